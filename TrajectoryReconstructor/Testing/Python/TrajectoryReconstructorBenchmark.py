@@ -0,0 +1,412 @@
+"""
+Benchmarks of the filtering and resampling functions of TrajectoryReconstructorLib.
+Each function runs on synthetic needle insertions of increasing length and on the trajectories of
+Testdata/MRTrackingTest.csv. Its output is compared to the reference implementation, the loops of the first
+version of the module, and its throughput and peak memory are written to a JSON file.
+When a baseline file of a previous run is given, the benchmark fails if a function got slower or uses more
+memory than the thresholds allow. It also fails if a batched function is slower than calling the function it
+batches for each trajectory, the two being timed alternately.
+Usage:
+  python TrajectoryReconstructorBenchmark.py [-o results.json] [--baseline previous.json] [--max-samples 1e5]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+MODULE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TEST_DATA = os.path.abspath(os.path.join(MODULE_DIR, "..", "Testdata", "MRTrackingTest.csv"))
+sys.path.insert(0, MODULE_DIR)
+
+import TrajectoryReconstructorLib
+from TrajectoryReconstructorLib import StreamingResampler, TrajectoryBuffer
+
+PROCESS_VARIANCE = 5e-5
+MEASUREMENT_VARIANCE = 0.0004
+MOVEMENT_THRESHOLD = 1.0
+STEP = 5
+# window size of the large-window case of resampleData, above MAX_TABLE_STEP
+LARGE_STEP = 1000
+# number of samples received by each real-time update
+REAL_TIME_BLOCK_SIZE = 10
+
+
+def referenceKalmanFilteredPoses(posAll, Q = 1e-5, R = 0.02**2):
+  totalLen = len(posAll)
+  hatminus = numpy.zeros(totalLen)
+  filteredData = numpy.zeros((totalLen,3))
+  for i in range(3):
+    filteredData[0][i] = posAll[0][i]
+    P_pre = 1.0
+    for k in range(1, totalLen):
+      hatminus[k] = filteredData[k-1][i]
+      Pminus = P_pre + Q
+      K = Pminus / (Pminus + R)
+      filteredData[k][i] = hatminus[k] + K * (posAll[k][i] - hatminus[k])
+      P_pre = (1 - K) * Pminus
+  return filteredData
+
+
+def referenceResampleData(data, movementThreshold = 1.0, step = 10):
+  dataLen = len(data)
+  if dataLen >= step:
+    pos_mean = numpy.zeros((int(dataLen/step),3))
+    pos_mean[0,:] = numpy.array([numpy.mean(data[0:step,0]), numpy.mean(data[0:step, 1]), numpy.mean(data[0:step, 2])])
+    pos_DownSampled = []
+    pos_DownSampled.append(pos_mean[0,:])
+    for index in range(step, dataLen-step, step):
+      pos_mean[int(index/step)] = numpy.array([numpy.mean(data[index:index+step, 0]), numpy.mean(data[index:index+step, 1]), numpy.mean(data[index:index+step, 2])])
+      if numpy.linalg.norm(pos_mean[int(index/step)] - pos_mean[int(index/step)-1])>movementThreshold:
+        distance = -1e20
+        indexMax = 0
+        for indexInner in range(step):
+          pos1 = numpy.array(data[index+indexInner,:])
+          if len(pos_DownSampled) > 1:
+            pos2 = pos_DownSampled[-2]
+          else:
+            pos2 = pos_DownSampled[0]
+          if numpy.linalg.norm(pos1-pos2)>distance:
+            indexMax = indexInner
+            distance = numpy.linalg.norm(pos1-pos2)
+        pos_DownSampled.append(data[index+indexMax,:])
+    pos_downSampledArray = numpy.zeros((len(pos_DownSampled),3))
+    for index in range(len(pos_DownSampled)):
+      pos_downSampledArray[index,:] = pos_DownSampled[index]
+    return pos_downSampledArray
+  return data
+
+
+def syntheticNeedlePath(numOfSamples, seed = 0):
+  """
+  Needle insertion along a slightly bending path. The insertion speed changes and stops from time to time,
+  the positions have a hand tremor and a measurement noise.
+  :param numOfSamples: number of samples
+  :return: (numOfSamples, 3) float array of positions, in millimeter
+  """
+  generator = numpy.random.RandomState(seed)
+  # speed in millimeter per sample, with pauses where the needle doesn't move
+  speed = 0.05 * (1.0 + numpy.sin(numpy.arange(numOfSamples) * 2 * numpy.pi / 5000.0))
+  speed[(numpy.arange(numOfSamples) // 2000) % 5 == 4] = 0.0
+  depth = numpy.cumsum(speed)
+  path = numpy.zeros((numOfSamples, 3))
+  path[:, 0] = 1e-4 * depth ** 2 / (1.0 + 1e-3 * depth)
+  path[:, 1] = 0.5 * numpy.sin(depth / 50.0)
+  path[:, 2] = depth
+  tremor = numpy.cumsum(generator.normal(scale=0.005, size=(numOfSamples, 3)), axis=0)
+  tremor -= numpy.cumsum(tremor, axis=0) / numpy.arange(1, numOfSamples + 1)[:, None]
+  return path + tremor + generator.normal(scale=0.2, size=(numOfSamples, 3))
+
+
+def recordedTrajectories():
+  """
+  :return: list of (N, 3) float arrays of the trajectories of the test data file
+  """
+  return [trajectory.positions for trajectory in TrajectoryReconstructorLib.readTrackingCSV(TEST_DATA)
+          if len(trajectory.positions)]
+
+
+def filteredDataset(dataset):
+  return [TrajectoryReconstructorLib.kalmanFilteredPoses(positions, PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+          for positions in dataset]
+
+
+def kalmanFilteredPoses(dataset):
+  return [TrajectoryReconstructorLib.kalmanFilteredPoses(positions, PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+          for positions in dataset]
+
+
+def kalmanFilteredPosesReference(dataset):
+  return [referenceKalmanFilteredPoses(positions, PROCESS_VARIANCE, MEASUREMENT_VARIANCE) for positions in dataset]
+
+
+def kalmanFilteredPosesWithoutProcessNoise(dataset):
+  # with Q = 0 the gain never converges, the filter uses the closed form of the estimate
+  return [TrajectoryReconstructorLib.kalmanFilteredPoses(positions, 0.0, MEASUREMENT_VARIANCE) for positions in dataset]
+
+
+def kalmanFilteredPosesWithoutProcessNoiseReference(dataset):
+  return [referenceKalmanFilteredPoses(positions, 0.0, MEASUREMENT_VARIANCE) for positions in dataset]
+
+
+def trajectoryParts(dataset):
+  # each trajectory is split in 4 to filter several trajectories at once
+  return [part for positions in dataset for part in numpy.array_split(positions, 4) if len(part)]
+
+
+def kalmanFilteredPosesBatch(dataset):
+  return TrajectoryReconstructorLib.kalmanFilteredPosesBatch(trajectoryParts(dataset), PROCESS_VARIANCE,
+                                                             MEASUREMENT_VARIANCE)
+
+
+def kalmanFilteredPosesParts(dataset):
+  return kalmanFilteredPoses(trajectoryParts(dataset))
+
+
+def kalmanFilteredPosesPartsReference(dataset):
+  return kalmanFilteredPosesReference(trajectoryParts(dataset))
+
+
+def kalmanFilteredNewPoses(dataset):
+  outputs = []
+  for positions in dataset:
+    filteredData = TrajectoryBuffer()
+    filteredData.append(positions[0])
+    pCov = 1.0
+    for blockStart in range(1, len(positions), REAL_TIME_BLOCK_SIZE):
+      filteredPos, pCov = TrajectoryReconstructorLib.kalmanFilteredNewPoses(
+        positions[blockStart:blockStart + REAL_TIME_BLOCK_SIZE], filteredData.array()[-1:], pCov,
+        PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+      filteredData.extend(filteredPos)
+    outputs.append(filteredData.array())
+  return outputs
+
+
+def kalmanFilteredPosesRealTime(dataset):
+  outputs = []
+  for positions in dataset:
+    filteredData = TrajectoryBuffer()
+    filteredData.append(positions[0])
+    pCov = 1.0
+    for pos in positions[1:]:
+      filteredPos, pCov = TrajectoryReconstructorLib.kalmanFilteredPosesRealTime(
+        pos, filteredData.array(), pCov, PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+      filteredData.append(filteredPos)
+    outputs.append(filteredData.array())
+  return outputs
+
+
+def resampleData(dataset):
+  return [TrajectoryReconstructorLib.resampleData(data, MOVEMENT_THRESHOLD, STEP) for data in dataset]
+
+
+def resampleDataReference(dataset):
+  return [referenceResampleData(data, MOVEMENT_THRESHOLD, STEP) for data in dataset]
+
+
+def resampleDataLargeStep(dataset):
+  return [TrajectoryReconstructorLib.resampleData(data, MOVEMENT_THRESHOLD, LARGE_STEP) for data in dataset]
+
+
+def resampleDataLargeStepReference(dataset):
+  return [referenceResampleData(data, MOVEMENT_THRESHOLD, LARGE_STEP) for data in dataset]
+
+
+def streamingResampler(dataset):
+  outputs = []
+  for data in dataset:
+    resampler = StreamingResampler(MOVEMENT_THRESHOLD, STEP)
+    points = [resampler.extend(data[blockStart:blockStart + REAL_TIME_BLOCK_SIZE])
+              for blockStart in range(0, len(data), REAL_TIME_BLOCK_SIZE)]
+    outputs.append(numpy.concatenate(points + [numpy.zeros((0, 3))]))
+  return outputs
+
+
+def resampleDataRealTime(dataset):
+  outputs = []
+  for data in dataset:
+    received = TrajectoryBuffer()
+    points = []
+    for pos in data:
+      received.append(pos)
+      point, valid = TrajectoryReconstructorLib.resampleDataRealTime(received.array(), MOVEMENT_THRESHOLD, STEP)
+      if valid:
+        points.append(point)
+    outputs.append(numpy.array(points).reshape(-1, 3))
+  return outputs
+
+
+# name, function, reference function, input of the functions (positions or filtered positions),
+# and whether the function is only run on the sizes of the real-time benchmarks
+BENCHMARKS = [
+  ("kalmanFilteredPoses", kalmanFilteredPoses, kalmanFilteredPosesReference, "positions", False),
+  ("kalmanFilteredPoses (Q=0)", kalmanFilteredPosesWithoutProcessNoise,
+   kalmanFilteredPosesWithoutProcessNoiseReference, "positions", False),
+  ("kalmanFilteredPosesBatch", kalmanFilteredPosesBatch, kalmanFilteredPosesPartsReference, "positions", False),
+  ("kalmanFilteredPoses (parts)", kalmanFilteredPosesParts, kalmanFilteredPosesPartsReference, "positions", False),
+  ("kalmanFilteredNewPoses", kalmanFilteredNewPoses, kalmanFilteredPosesRealTime, "positions", True),
+  ("resampleData", resampleData, resampleDataReference, "filtered", False),
+  ("resampleData (step %d)" % LARGE_STEP, resampleDataLargeStep, resampleDataLargeStepReference, "filtered", False),
+  ("StreamingResampler", streamingResampler, resampleDataRealTime, "filtered", True),
+]
+
+BENCHMARKS_BY_NAME = dict((benchmark[0], benchmark) for benchmark in BENCHMARKS)
+# benchmarks that must not be slower than another benchmark of the same inputs, the batched functions must not be
+# slower than calling the function they batch for each trajectory
+FASTER_THAN = {
+  "kalmanFilteredPosesBatch": "kalmanFilteredPoses (parts)",
+}
+
+
+def measure(function, dataset, repeat):
+  """
+  :return: (outputs, seconds, peakMemory), the shortest time of the runs and the peak memory allocated during
+           a separate run, in bytes
+  """
+  seconds = float("inf")
+  for run in range(repeat):
+    startTime = time.perf_counter()
+    outputs = function(dataset)
+    seconds = min(seconds, time.perf_counter() - startTime)
+  tracemalloc.start()
+  function(dataset)
+  peakMemory = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return outputs, seconds, peakMemory
+
+
+def relativeTime(function, otherFunction, dataset, repeat):
+  """
+  Time two functions alternately, so that they run in the same conditions.
+  :return: ratio of the shortest times of the runs of the functions
+  """
+  seconds = [float("inf"), float("inf")]
+  for run in range(max(repeat, 5)):
+    for index, timedFunction in enumerate([function, otherFunction]):
+      startTime = time.perf_counter()
+      timedFunction(dataset)
+      seconds[index] = min(seconds[index], time.perf_counter() - startTime)
+  return seconds[0] / seconds[1] if seconds[1] > 0 else float("inf")
+
+
+def outputsMatch(outputs, referenceOutputs, tolerance = 1e-9):
+  if not len(outputs) == len(referenceOutputs):
+    return False
+  for output, referenceOutput in zip(outputs, referenceOutputs):
+    output = numpy.asarray(output, dtype=float).reshape(-1, 3)
+    referenceOutput = numpy.asarray(referenceOutput, dtype=float).reshape(-1, 3)
+    if not output.shape == referenceOutput.shape or not numpy.allclose(output, referenceOutput, rtol=tolerance,
+                                                                        atol=tolerance):
+      return False
+  return True
+
+
+def runBenchmarks(sizes, maxReferenceSamples, maxRealTimeSamples, repeat, names = None, log = None):
+  """
+  :param sizes: numbers of samples of the synthetic trajectories
+  :param maxReferenceSamples: the outputs are only compared to the reference on datasets up to this size
+  :param maxRealTimeSamples: the real-time functions only run on datasets up to this size
+  :param repeat: number of timed runs of each function
+  :param names: names of the benchmarks to run, all of them if None
+  :param log: called with each result
+  :return: list of result dictionaries
+  """
+  datasets = [("synthetic %d" % size, [syntheticNeedlePath(size)]) for size in sizes]
+  if os.path.isfile(TEST_DATA):
+    datasets.append(("MRTrackingTest.csv", recordedTrajectories()))
+  results = []
+  for datasetName, dataset in datasets:
+    inputs = {"positions": dataset, "filtered": filteredDataset(dataset)}
+    numOfSamples = sum(len(positions) for positions in dataset)
+    for name, function, referenceFunction, inputName, realTime in BENCHMARKS:
+      if (names and not name in names) or (realTime and numOfSamples > maxRealTimeSamples):
+        continue
+      outputs, seconds, peakMemory = measure(function, inputs[inputName], repeat)
+      result = {"name": name, "dataset": datasetName, "samples": numOfSamples, "seconds": seconds,
+                "samplesPerSecond": numOfSamples / seconds if seconds > 0 else float("inf"),
+                "peakMemory": peakMemory, "matchesReference": None, "referenceSeconds": None}
+      if numOfSamples <= maxReferenceSamples:
+        startTime = time.perf_counter()
+        referenceOutputs = referenceFunction(inputs[inputName])
+        result["referenceSeconds"] = time.perf_counter() - startTime
+        result["matchesReference"] = outputsMatch(outputs, referenceOutputs)
+      if name in FASTER_THAN:
+        result["fasterThan"] = FASTER_THAN[name]
+        result["relativeTime"] = relativeTime(function, BENCHMARKS_BY_NAME[FASTER_THAN[name]][1], inputs[inputName],
+                                              repeat)
+      results.append(result)
+      if log:
+        log(result)
+  return results
+
+
+def checkRegressions(results, baselineResults, maxSlowdown, maxMemoryGrowth):
+  """
+  :return: list of messages, one per output that doesn't match its reference and per result that got slower or uses
+           more memory than the baseline result of the same function and dataset allows
+  """
+  failures = ["%s on %s doesn't match the reference" % (result["name"], result["dataset"])
+              for result in results if result["matchesReference"] is False]
+  baseline = dict(((result["name"], result["dataset"]), result) for result in baselineResults)
+  for result in results:
+    previous = baseline.get((result["name"], result["dataset"]))
+    if previous is None:
+      continue
+    if result["seconds"] > maxSlowdown * previous["seconds"]:
+      failures.append("%s on %s: %.4f s, %.4f s in the baseline" % (result["name"], result["dataset"],
+                                                                  result["seconds"], previous["seconds"]))
+    if result["peakMemory"] > maxMemoryGrowth * previous["peakMemory"]:
+      failures.append("%s on %s: peak memory %d bytes, %d bytes in the baseline" % (
+        result["name"], result["dataset"], result["peakMemory"], previous["peakMemory"]))
+  return failures
+
+
+def checkFasterThan(results, maxRelativeTime):
+  """
+  :param maxRelativeTime: allowed ratio of the times of the benchmarks of a FASTER_THAN pair
+  :return: list of messages, one per FASTER_THAN pair and dataset where the first benchmark is slower than allowed
+  """
+  return ["%s on %s: %.2f times the time of %s" % (result["name"], result["dataset"], result["relativeTime"],
+                                                   result["fasterThan"])
+          for result in results if result.get("relativeTime", 0.0) > maxRelativeTime]
+
+
+def printResult(result):
+  reference = ""
+  if result["referenceSeconds"] is not None:
+    reference = ", reference %.4f s, %s" % (result["referenceSeconds"],
+                                            "matches" if result["matchesReference"] else "DOESN'T MATCH")
+  if "relativeTime" in result:
+    reference += ", %.2f times %s" % (result["relativeTime"], result["fasterThan"])
+  print("%-26s %-20s %9d samples %10.4f s %12.0f samples/s %10.1f MB%s" % (
+    result["name"], result["dataset"], result["samples"], result["seconds"], result["samplesPerSecond"],
+    result["peakMemory"] / 1048576.0, reference))
+  sys.stdout.flush()
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description="Benchmark the filtering and resampling functions.")
+  parser.add_argument("-o", "--output", default="TrajectoryReconstructorBenchmark.json", help="JSON result file")
+  parser.add_argument("--baseline", default=None, help="JSON result file of a previous run to compare to")
+  parser.add_argument("--sizes", type=float, nargs="+", default=[1e3, 1e4, 1e5, 1e6, 1e7],
+                      help="numbers of samples of the synthetic trajectories")
+  parser.add_argument("--max-samples", type=float, default=None, help="skip the larger synthetic trajectories")
+  parser.add_argument("--max-reference-samples", type=float, default=1e5,
+                      help="compare to the reference implementation up to this number of samples")
+  parser.add_argument("--max-real-time-samples", type=float, default=1e6,
+                      help="run the real-time functions up to this number of samples")
+  parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each function")
+  parser.add_argument("--max-slowdown", type=float, default=1.5,
+                      help="fail if a function takes more than this times the baseline time")
+  parser.add_argument("--max-memory-growth", type=float, default=1.5,
+                      help="fail if a function uses more than this times the baseline peak memory")
+  parser.add_argument("--max-relative-time", type=float, default=1.1,
+                      help="fail if a batched function takes more than this times the function it batches")
+  parser.add_argument("--benchmark", nargs="+", default=None, choices=[benchmark[0] for benchmark in BENCHMARKS],
+                      help="benchmarks to run, all by default")
+  args = parser.parse_args(argv)
+
+  sizes = [int(size) for size in args.sizes if args.max_samples is None or size <= args.max_samples]
+  results = runBenchmarks(sizes, args.max_reference_samples, args.max_real_time_samples, args.repeat,
+                          args.benchmark, printResult)
+  with open(args.output, 'w') as outputFile:
+    json.dump({"python": platform.python_version(), "numpy": numpy.__version__, "machine": platform.machine(),
+               "processor": platform.processor(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "results": results}, outputFile, indent=2)
+  baselineResults = []
+  if args.baseline:
+    with open(args.baseline, 'r') as baselineFile:
+      baselineResults = json.load(baselineFile)["results"]
+  failures = checkRegressions(results, baselineResults, args.max_slowdown, args.max_memory_growth)
+  failures += checkFasterThan(results, args.max_relative_time)
+  for failure in failures:
+    print("FAILED: " + failure)
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
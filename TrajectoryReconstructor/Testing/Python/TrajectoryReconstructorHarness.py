@@ -0,0 +1,544 @@
+"""
+End-to-end benchmark of the widget and logic of the TrajectoryReconstructor module, run headlessly on the stand-ins
+of TrajectoryReconstructorStandIns. Synthetic needle insertions of several locators are imported, exported,
+imported again as a scene, reconstructed, and recorded in real time, and the time of each operation and the latency
+of the real-time samples are written to a JSON file. The samples that reach the sequence nodes, the exported files
+and the reconstructed trajectories are checked along the way, and the stage timings of the module are exported and
+a reconstruction is profiled.
+When a baseline file of a previous run is given, the harness fails if an operation got slower than the threshold
+allows.
+Usage:
+  python TrajectoryReconstructorHarness.py [-o results.json] [--baseline previous.json] [--locators 5]
+         [--trajectories 2] [--samples 1e6] [--real-time-samples 1e5]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+
+import TrajectoryReconstructorStandIns
+
+TrajectoryReconstructorStandIns.install()
+
+# also adds the module directory to sys.path
+from TrajectoryReconstructorBenchmark import PROCESS_VARIANCE, MEASUREMENT_VARIANCE, MOVEMENT_THRESHOLD, \
+  syntheticNeedlePath
+import TrajectoryReconstructorLib
+import TrajectoryReconstructor
+import slicer
+import vtk
+
+# tracking rate of the synthetic samples, in Hz
+SAMPLE_RATE = 100.0
+# resampling window of one second, the synthetic needle moves by about 5 millimeters
+STEP = 100
+
+
+def syntheticTrajectories(numOfLocators, numOfTrajectories, numOfSamples):
+  """
+  :return: list of TrackedTrajectory, numOfTrajectories for each locator, ordered by locator
+  """
+  trajectories = []
+  for locatorIndex in range(numOfLocators):
+    for trajectoryIndex in range(numOfTrajectories):
+      seed = locatorIndex * numOfTrajectories + trajectoryIndex
+      timeStamps = 1000.0 * (seed + 1) + numpy.arange(numOfSamples) / SAMPLE_RATE
+      trajectories.append(TrajectoryReconstructorLib.TrackedTrajectory(
+        locatorIndex, "Locator%d" % locatorIndex, "", trajectoryIndex, timeStamps,
+        syntheticNeedlePath(numOfSamples, seed)))
+  return trajectories
+
+
+def expectedPoints(positions):
+  """
+  :return: (filteredData, points), the filtered positions and the points of a reconstructed trajectory, which has
+           no point when less than 2 are resampled
+  """
+  filteredData = TrajectoryReconstructorLib.kalmanFilteredPoses(positions, PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+  resampledPoints = TrajectoryReconstructorLib.resampleData(filteredData, MOVEMENT_THRESHOLD, STEP)
+  return filteredData, resampledPoints if len(resampledPoints) >= 2 else numpy.zeros((0, 3))
+
+
+def expectedRealTimePoints(positions):
+  """
+  :return: (filteredData, points) of a trajectory recorded in real time, filtered and resampled at once. The first
+           sample is taken as the first filtered position.
+  """
+  filteredPositions, pCov = TrajectoryReconstructorLib.kalmanFilteredNewPoses(positions[1:], positions[:1], 1.0,
+                                                                             PROCESS_VARIANCE, MEASUREMENT_VARIANCE)
+  resampler = TrajectoryReconstructorLib.StreamingResampler(MOVEMENT_THRESHOLD, STEP)
+  resampler.append(positions[0])
+  return numpy.concatenate([positions[:1], filteredPositions]), resampler.extend(filteredPositions)
+
+
+class Harness(object):
+  """
+  Runs the operations on one widget and collects their timings and the failed checks.
+  """
+
+  def __init__(self, workDirectory, log = None):
+    self.workDirectory = workDirectory
+    self.log = log
+    self.results = []
+    self.failures = []
+    self.widget = None
+
+  def timed(self, name, samples, function, *args):
+    """
+    Call a function once and store its time
+    :return: the result of the function
+    """
+    startTime = time.perf_counter()
+    output = function(*args)
+    self.addResult(name, samples, [time.perf_counter() - startTime])
+    return output
+
+  def addResult(self, name, samples, seconds):
+    """
+    :param seconds: times of the calls of the operation
+    """
+    seconds = numpy.asarray(seconds, dtype=float)
+    total = float(seconds.sum())
+    result = {"name": name, "calls": len(seconds), "samples": samples, "seconds": total,
+              "meanSeconds": float(seconds.mean()), "p50Seconds": float(numpy.percentile(seconds, 50)),
+              "p95Seconds": float(numpy.percentile(seconds, 95)), "p99Seconds": float(numpy.percentile(seconds, 99)),
+              "maxSeconds": float(seconds.max()),
+              "samplesPerSecond": samples / total if total > 0 else float("inf")}
+    self.results.append(result)
+    if self.log:
+      self.log(result)
+
+  def check(self, condition, message):
+    if not condition:
+      self.failures.append(message)
+      print("FAILED: " + message)
+      sys.stdout.flush()
+
+  def trajectories(self):
+    return self.widget.logic.registry.trajectories()
+
+  def checkSequenceSamples(self, trajectories, operation):
+    """
+    Check that the sequence nodes hold the samples of the trajectories, in the same order
+    """
+    registered = self.trajectories()
+    self.check(len(registered) == len(trajectories), "%s registered %d trajectories instead of %d" % (
+      operation, len(registered), len(trajectories)))
+    for trajectory, expected in zip(registered, trajectories):
+      timeStamps, positions = self.widget.getSequenceSamples(trajectory.sequenceNode)
+      self.check(numpy.array_equal(timeStamps, expected.timeStamps) and numpy.array_equal(positions, expected.positions),
+                 "%s: samples of trajectory %d of locator %d differ from the file" % (
+                   operation, trajectory.trajectoryIndex, trajectory.locatorIndex))
+
+  def checkFile(self, fileName, trajectories, operation):
+    read = TrajectoryReconstructorLib.readTrackingFile(fileName)
+    self.check(len(read) == len(trajectories) and all(
+      numpy.array_equal(trajectory.timeStamps, expected.timeStamps) and
+      numpy.array_equal(trajectory.positions, expected.positions) for trajectory, expected in zip(read, trajectories)),
+      "%s: %s doesn't hold the recorded samples" % (operation, os.path.basename(fileName)))
+
+  def checkReconstruction(self, trajectories, operation):
+    for trajectory in self.trajectories():
+      timeStamps, positions = self.widget.getSequenceSamples(trajectory.sequenceNode)
+      filteredData, expected = expectedPoints(positions)
+      points = trajectory.points.array()
+      self.check(not trajectory.stale and len(points) == len(expected) and numpy.allclose(points, expected),
+                 "%s: trajectory %d of locator %d doesn't match its reconstruction" % (
+                   operation, trajectory.trajectoryIndex, trajectory.locatorIndex))
+      polyData = trajectory.modelNode.GetPolyData()
+      self.check(polyData is not None and polyData.GetNumberOfPoints() == trajectory.tube.numOfRings() * trajectory.tube.numOfSides,
+                 "%s: model of trajectory %d of locator %d doesn't match its points" % (
+                   operation, trajectory.trajectoryIndex, trajectory.locatorIndex))
+
+  def setup(self):
+    self.widget = TrajectoryReconstructor.TrajectoryReconstructorWidget()
+    self.timed("setup", 0, self.widget.setup)
+    widget = self.widget
+    widget.processVarianceSpinBox.setValue(PROCESS_VARIANCE)
+    widget.measurementVarianceSpinBox.setValue(MEASUREMENT_VARIANCE)
+    widget.movementThresholdSpinBox.setValue(MOVEMENT_THRESHOLD)
+    widget.downSampleStepSizeSpinBox.setValue(STEP)
+    widget.exportDirString = self.workDirectory
+
+  def load(self, name, fileName, trajectories):
+    """
+    Import a file in an empty scene, as the Load button does
+    """
+    self.widget.cleanup()
+    self.widget.initialize()
+    self.widget.fileString = fileName
+    self.timed(name, sum(len(trajectory.positions) for trajectory in trajectories), self.widget.loadFromOneFile)
+    self.checkSequenceSamples(trajectories, name)
+
+  def export(self, trajectories):
+    widget = self.widget
+    numOfSamples = sum(len(trajectory.positions) for trajectory in trajectories)
+    widget.fileNameEditor.text = "Harness.csv"
+    self.timed("saveInOneFile", numOfSamples, widget.saveInOneFile)
+    self.checkFile(os.path.join(self.workDirectory, "Harness.csv"), trajectories, "saveInOneFile")
+
+    widget.exportDirString = os.path.join(self.workDirectory, "DifferentFiles")
+    os.mkdir(widget.exportDirString)
+    self.timed("saveInDifferentFiles", numOfSamples, widget.saveInDifferentFiles)
+    for locator in widget.logic.registry.locators:
+      fileName = os.path.join(widget.exportDirString, locator.locatorNode.GetName())
+      read = TrajectoryReconstructorLib.readTrackingCSV(fileName)
+      self.check(sum(len(trajectory.positions) for trajectory in read) ==
+                 sum(len(trajectory.positions) for trajectory in trajectories if trajectory.locatorName == locator.locatorNode.GetName()),
+                 "saveInDifferentFiles: %s doesn't hold the recorded samples" % locator.locatorNode.GetName())
+
+    widget.exportDirString = self.workDirectory
+    widget.fileNameEditor.text = "Harness"
+    self.timed("saveInBinaryFiles", numOfSamples, widget.saveInBinaryFiles)
+    fileName = os.path.join(self.workDirectory, "Harness" + TrajectoryReconstructorLib.trackingbinary.FILE_EXTENSION)
+    self.checkFile(fileName, trajectories, "saveInBinaryFiles")
+    return fileName
+
+  def importScene(self, trajectories):
+    """
+    Initialize the widget from the nodes of the scene, as after a scene import. With the deferred reconstruction,
+    the trajectories are marked as stale.
+    """
+    self.widget.deferredReconstructionCheckBox.setChecked(True)
+    self.widget.onDeferredReconstructionChanged()
+    self.timed("LoadCaseCompletedCallback", 0, self.widget.LoadCaseCompletedCallback, slicer.mrmlScene,
+               slicer.vtkMRMLScene.EndImportEvent)
+    self.checkSequenceSamples(trajectories, "LoadCaseCompletedCallback")
+    self.check(all(trajectory.stale for trajectory in self.trajectories()),
+               "LoadCaseCompletedCallback: the trajectories are not marked as stale")
+
+  def editSequence(self, trajectories):
+    """
+    Replace a stored transform of a sequence node in place, which keeps the number of samples and the index values,
+    and check that the cached samples are read again. Then append a sample and check that the cache is extended
+    instead of read again, and restore the sequence.
+    """
+    logic = self.widget.logic
+    trajectory, expected = self.trajectories()[0], trajectories[0]
+    seqNode = trajectory.sequenceNode
+    index = len(expected.positions) // 2
+    logic.updateSequenceSamples(seqNode)
+    transformNode = slicer.vtkMRMLLinearTransformNode()
+    matrix = vtk.vtkMatrix4x4()
+    for offset in [1.0, 0.0]:
+      for axis in range(3):
+        matrix.SetElement(axis, 3, expected.positions[index, axis] + offset)
+      transformNode.SetMatrixTransformToParent(matrix)
+      seqNode.SetDataNodeAtValue(transformNode, seqNode.GetNthIndexValue(index))
+      positions = logic.updateSequenceSamples(seqNode).positions()
+      self.check(numpy.array_equal(positions[index], expected.positions[index] + offset) and
+                 numpy.array_equal(numpy.delete(positions, index, axis=0),
+                                   numpy.delete(expected.positions, index, axis=0)),
+                 "updateSequenceSamples: the samples of an edited sequence are not read again")
+    samples = logic.updateSequenceSamples(seqNode)
+    seqNode.SetDataNodeAtValue(transformNode, repr(float(expected.timeStamps[-1]) + 1.0 / SAMPLE_RATE))
+    self.check(logic.updateSequenceSamples(seqNode) is samples and len(samples) == len(expected.positions) + 1,
+               "updateSequenceSamples: the samples appended to a sequence are not read incrementally")
+    seqNode.RemoveAllDataNodes()
+    self.widget.fillSequenceNode(seqNode, expected.timeStamps, expected.positions,
+                                 trajectory.locator.locatorNode.GetName())
+    self.checkSequenceSamples(trajectories, "editSequence")
+
+  def reconstruct(self, trajectories):
+    widget = self.widget
+    numOfSamples = sum(len(trajectory.positions) for trajectory in trajectories)
+    cache = widget.logic.reconstructionCache
+    for name in ["constructSpecificTrajectory", "constructSpecificTrajectory (cached)"]:
+      if name == "constructSpecificTrajectory" and cache is not None:
+        cache.clear()
+      seconds = []
+      for trajectory in self.trajectories():
+        startTime = time.perf_counter()
+        widget.constructSpecificTrajectory(trajectory.locatorIndex, trajectory.trajectoryIndex)
+        seconds.append(time.perf_counter() - startTime)
+      self.addResult(name, numOfSamples, seconds)
+      self.checkReconstruction(trajectories, name)
+
+    if cache is not None:
+      cache.clear()
+    for trajectory in self.trajectories():
+      trajectory.points.clear()
+    startTime = time.perf_counter()
+    widget.onReconstructAll()
+    while widget.reconstructAllJob is not None:
+      time.sleep(0.001)
+      widget.reconstructAllTimer.timeout.emit()
+    self.addResult("onReconstructAll", numOfSamples, [time.perf_counter() - startTime])
+    self.checkReconstruction(trajectories, "onReconstructAll")
+
+  def cacheConcurrentWrites(self, numOfThreads = 8, numOfEntries = 50, numOfSamples = 1000):
+    """
+    Store entries in a reconstruction cache from several threads at once, as the workers of Reconstruct All do, with
+    a maximum size of two entries so that every write evicts entries while the other threads are writing.
+    """
+    positions = syntheticNeedlePath(numOfSamples)
+    directory = os.path.join(self.workDirectory, "ConcurrentCache")
+    cache = TrajectoryReconstructorLib.ReconstructionCache(directory)
+    cache.put("size", positions, positions[::STEP])
+    cache.maxSize = 2 * os.path.getsize(cache.fileName("size"))
+    failedWrites = []
+    def writeEntries(threadIndex):
+      for entryIndex in range(numOfEntries):
+        key = "%d-%d" % (threadIndex, entryIndex)
+        if not cache.put(key, positions + entryIndex, positions[::STEP]):
+          failedWrites.append(key)
+    threads = [threading.Thread(target=writeEntries, args=(threadIndex,)) for threadIndex in range(numOfThreads)]
+    startTime = time.perf_counter()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.addResult("ReconstructionCache.put (%d threads)" % numOfThreads, numOfThreads * numOfEntries * numOfSamples,
+                   [time.perf_counter() - startTime])
+    self.check(not failedWrites, "ReconstructionCache.put: %d of %d concurrent writes failed" % (
+      len(failedWrites), numOfThreads * numOfEntries))
+    self.check(cache.size() <= cache.maxSize, "ReconstructionCache.put: the cache is larger than its maximum size")
+    self.check(len(os.listdir(directory)) == len(cache.entries()),
+               "ReconstructionCache.put: temporary files are left in the cache directory")
+
+  def recordRealTime(self, numOfSamples, samplesPerUpdate):
+    """
+    Record a new trajectory of every locator at once. Before each real-time update, the samples received since the
+    previous one are added to the sequence nodes, as the sequence browser does while recording.
+    """
+    widget = self.widget
+    locators = widget.logic.registry.locators
+    while widget.nLocators < len(locators):
+      widget.addLocatorChannel()
+    for channelIndex, locator in enumerate(locators):
+      widget.transformSelector[channelIndex].setCurrentNode(locator.locatorNode)
+      widget.trajectoryIndexSpinBox[channelIndex].setValue(len(locator.trajectories))
+    widget.exportDirString = self.workDirectory
+    widget.streamingCheckBox.setChecked(True)
+    self.timed("startRecording", 0, lambda: [widget.locatorRecordCheckBox[channelIndex].click()
+                                             for channelIndex in range(len(locators))])
+    recorded = [locator.trajectories[-1] for locator in locators]
+    self.check(all(trajectory.sequenceBrowserNode.GetRecordingActive() for trajectory in recorded),
+               "startRecording: the new trajectories are not recorded")
+    self.check(widget.realTimeTimer.isActive(), "startRecording: the real-time timer isn't started")
+    self.check(widget.streamingTimer.isActive(), "startRecording: the streaming timer isn't started")
+
+    paths = [syntheticNeedlePath(numOfSamples, 1000 + index) for index in range(len(recorded))]
+    matrix = vtk.vtkMatrix4x4()
+    seconds = []
+    streamingSeconds = []
+    for blockStart in range(0, numOfSamples, samplesPerUpdate):
+      for trajectory, path in zip(recorded, paths):
+        locatorNode = trajectory.locator.locatorNode
+        for index in range(blockStart, min(blockStart + samplesPerUpdate, numOfSamples)):
+          matrix.SetElement(0, 3, path[index, 0])
+          matrix.SetElement(1, 3, path[index, 1])
+          matrix.SetElement(2, 3, path[index, 2])
+          locatorNode.SetMatrixTransformToParent(matrix)
+          trajectory.sequenceNode.SetDataNodeAtValue(locatorNode, repr(index / SAMPLE_RATE))
+      startTime = time.perf_counter()
+      widget.realTimeTimer.timeout.emit()
+      seconds.append(time.perf_counter() - startTime)
+      startTime = time.perf_counter()
+      widget.streamingTimer.timeout.emit()
+      streamingSeconds.append(time.perf_counter() - startTime)
+    self.addResult("onRealTimeUpdate", numOfSamples * len(recorded), seconds)
+    self.addResult("onStreamingUpdate", numOfSamples * len(recorded), streamingSeconds)
+
+    self.timed("stopRecording", 0, lambda: [widget.locatorRecordCheckBox[channelIndex].click()
+                                            for channelIndex in range(len(locators))])
+    self.check(not widget.realTimeTimer.isActive(), "stopRecording: the real-time timer isn't stopped")
+    widget.streamingCheckBox.setChecked(False)
+    self.check(widget.streamingRecorder is None and not widget.streamingTimer.isActive(),
+               "stopRecording: the streaming session isn't closed")
+    for trajectory in recorded:
+      fileName = os.path.join(widget.streamingSessionDirectory, trajectory.locator.locatorNode.GetName())
+      read = TrajectoryReconstructorLib.readTrackingCSV(fileName) if os.path.isfile(fileName) else []
+      timeStamps, positions = widget.getSequenceSamples(trajectory.sequenceNode)
+      self.check(len(read) == 1 and read[0].trajectoryIndex == trajectory.trajectoryIndex and
+                 numpy.array_equal(read[0].timeStamps, timeStamps) and numpy.array_equal(read[0].positions, positions),
+                 "onStreamingUpdate: the streamed samples of locator %d don't match its sequence" % trajectory.locatorIndex)
+    for locator in locators:
+      latency = dict((timed.locatorIndex, timed) for timed in widget.logic.diagnostics.latency.locators()).get(
+        locator.locatorIndex)
+      self.check(latency is not None and latency.numOfDropped() == 0 and
+                 all(latency.windows[stage].numOfSamples == numOfSamples
+                     for stage in TrajectoryReconstructorLib.latency.STAGES),
+                 "onRealTimeUpdate: the samples of locator %d aren't all timed" % locator.locatorIndex)
+    self.addLatencyResults(widget.logic.diagnostics.latency)
+    for trajectory, path in zip(recorded, paths):
+      filteredData, expected = expectedRealTimePoints(path)
+      self.check(numpy.allclose(trajectory.filteredData.array(), filteredData) and
+                 len(trajectory.points) == len(expected) and numpy.allclose(trajectory.points.array(), expected),
+                 "onRealTimeUpdate: trajectory %d of locator %d doesn't match its reconstruction" % (
+                   trajectory.trajectoryIndex, trajectory.locatorIndex))
+
+  def streamTrajectoryChange(self, numOfSamples):
+    """
+    Record two trajectories of the first locator one after the other, by changing the trajectory index while
+    recording. The samples of both trajectories have to be streamed in the same session.
+    """
+    widget = self.widget
+    locator = widget.logic.registry.locators[0]
+    widget.exportDirString = self.workDirectory
+    widget.streamingCheckBox.setChecked(True)
+    previousFiles = set(os.listdir(self.workDirectory))
+    widget.transformSelector[0].setCurrentNode(locator.locatorNode)
+    firstIndex = len(locator.trajectories)
+    widget.trajectoryIndexSpinBox[0].setValue(firstIndex)
+    widget.locatorRecordCheckBox[0].click()
+    path = syntheticNeedlePath(2 * numOfSamples, 2000)
+    matrix = vtk.vtkMatrix4x4()
+    for index in range(2 * numOfSamples):
+      if index == numOfSamples:
+        widget.trajectoryIndexSpinBox[0].setValue(firstIndex + 1)
+      trajectory = locator.trajectories[widget.trajectoryIndexSpinBox[0].value]
+      matrix.SetElement(0, 3, path[index, 0])
+      matrix.SetElement(1, 3, path[index, 1])
+      matrix.SetElement(2, 3, path[index, 2])
+      locator.locatorNode.SetMatrixTransformToParent(matrix)
+      trajectory.sequenceNode.SetDataNodeAtValue(locator.locatorNode, repr(index / SAMPLE_RATE))
+      if index % 50 == 0:
+        widget.realTimeTimer.timeout.emit()
+        widget.streamingTimer.timeout.emit()
+    widget.locatorRecordCheckBox[0].click()
+    widget.streamingCheckBox.setChecked(False)
+    sessions = sorted(set(os.listdir(self.workDirectory)) - previousFiles)
+    self.check(len(sessions) == 1 and widget.streamingRecorder is None,
+               "trajectory index change: %d streaming sessions instead of 1" % len(sessions))
+    if len(sessions) == 1:
+      fileName = os.path.join(self.workDirectory, sessions[0], locator.locatorNode.GetName())
+      read = dict((streamed.trajectoryIndex, streamed) for streamed in TrajectoryReconstructorLib.readTrackingCSV(fileName))
+      for trajectory in locator.trajectories[firstIndex:firstIndex + 2]:
+        timeStamps, positions = widget.getSequenceSamples(trajectory.sequenceNode)
+        streamed = read.get(trajectory.trajectoryIndex)
+        self.check(streamed is not None and numpy.array_equal(streamed.timeStamps, timeStamps) and
+                   numpy.array_equal(streamed.positions, positions),
+                   "trajectory index change: the streamed samples of trajectory %d don't match its sequence" %
+                   trajectory.trajectoryIndex)
+
+  def addLatencyResults(self, monitor):
+    """
+    Store the latencies of the samples recorded in real time, from their recording to the end of each stage, as
+    one call per sample
+    """
+    for stage in TrajectoryReconstructorLib.latency.STAGES:
+      latencies = numpy.concatenate([locator.windows[stage].latencies() for locator in monitor.locators()])
+      if len(latencies):
+        self.addResult("latency (%s)" % stage, len(latencies), latencies)
+
+  def diagnostics(self, trajectories):
+    """
+    Check the stage timings gathered by the previous operations, export them and profile a reconstruction.
+    """
+    widget = self.widget
+    diagnostics = dict(((trajectory.locatorIndex, trajectory.trajectoryIndex), trajectory)
+                       for trajectory in widget.logic.diagnostics.trajectories())
+    for trajectory in self.trajectories():
+      timed = diagnostics.get((trajectory.locatorIndex, trajectory.trajectoryIndex))
+      self.check(timed is not None and
+                 any(stages["filter"].calls > 0 for stages in timed.stages.values()) and
+                 timed.numOfPoints == len(trajectory.points),
+                 "diagnostics: trajectory %d of locator %d isn't timed" % (trajectory.trajectoryIndex,
+                                                                           trajectory.locatorIndex))
+    fileName = os.path.join(self.workDirectory, "Diagnostics.json")
+    TrajectoryReconstructorStandIns.QFileDialog.saveFileName = fileName
+    try:
+      widget.onExportDiagnostics()
+    finally:
+      TrajectoryReconstructorStandIns.QFileDialog.saveFileName = ""
+    with open(fileName) as inputFile:
+      exported = json.load(inputFile)
+    self.check(len(exported["trajectories"]) == len(diagnostics), "onExportDiagnostics: wrong number of trajectories")
+
+    numOfSamples = sum(len(trajectory.positions) for trajectory in trajectories)
+    self.timed("onProfileReconstruction", numOfSamples, widget.onProfileReconstruction)
+    self.check("cumulative" in widget.logic.diagnostics.profile and
+               widget.diagnosticsTextEdit.toPlainText().endswith(widget.logic.diagnostics.profile),
+               "onProfileReconstruction: the profile isn't shown")
+    self.checkReconstruction(trajectories, "onProfileReconstruction")
+
+  def run(self, numOfLocators, numOfTrajectories, numOfSamples, numOfRealTimeSamples, samplesPerUpdate):
+    trajectories = syntheticTrajectories(numOfLocators, numOfTrajectories, numOfSamples)
+    fileName = os.path.join(self.workDirectory, "Input.csv")
+    TrajectoryReconstructorLib.writeTrackingCSV(fileName, trajectories)
+    self.setup()
+    self.load("loadFromOneFile", fileName, trajectories)
+    binaryFileName = self.export(trajectories)
+    self.load("loadFromOneFile (binary)", binaryFileName, trajectories)
+    self.importScene(trajectories)
+    self.editSequence(trajectories)
+    self.reconstruct(trajectories)
+    self.cacheConcurrentWrites()
+    if numOfRealTimeSamples > 0:
+      self.recordRealTime(numOfRealTimeSamples, samplesPerUpdate)
+      self.streamTrajectoryChange(min(numOfRealTimeSamples, 1000))
+    self.diagnostics(trajectories)
+    for warning in slicer.util.messageLog.warnings:
+      self.check(False, "warning displayed: %s" % warning)
+    return self.results
+
+
+def checkRegressions(results, baselineResults, maxSlowdown):
+  """
+  :return: list of messages, one per operation that got slower than the baseline result of the same operation allows
+  """
+  baseline = dict((result["name"], result) for result in baselineResults)
+  failures = []
+  for result in results:
+    previous = baseline.get(result["name"])
+    if previous is not None and result["seconds"] > maxSlowdown * previous["seconds"]:
+      failures.append("%s: %.4f s, %.4f s in the baseline" % (result["name"], result["seconds"], previous["seconds"]))
+  return failures
+
+
+def printResult(result):
+  print("%-38s %6d calls %10d samples %10.4f s %10.4f s max %12.0f samples/s" % (
+    result["name"], result["calls"], result["samples"], result["seconds"], result["maxSeconds"],
+    result["samplesPerSecond"]))
+  sys.stdout.flush()
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description="Benchmark the import, export and reconstruction of the module.")
+  parser.add_argument("-o", "--output", default="TrajectoryReconstructorHarness.json", help="JSON result file")
+  parser.add_argument("--baseline", default=None, help="JSON result file of a previous run to compare to")
+  parser.add_argument("--locators", type=int, default=5, help="number of locators")
+  parser.add_argument("--trajectories", type=int, default=2, help="number of trajectories of each locator")
+  parser.add_argument("--samples", type=float, default=1e6, help="number of samples of each trajectory")
+  parser.add_argument("--real-time-samples", type=float, default=1e5,
+                      help="number of samples of each locator recorded in real time, 0 to skip the recording")
+  parser.add_argument("--samples-per-update", type=int, default=5,
+                      help="number of samples of each locator received between two real-time updates")
+  parser.add_argument("--max-slowdown", type=float, default=1.5,
+                      help="fail if an operation takes more than this times the baseline time")
+  args = parser.parse_args(argv)
+
+  workDirectory = tempfile.mkdtemp(prefix="TrajectoryReconstructorHarness")
+  try:
+    slicer.app.cachePath = os.path.join(workDirectory, "Cache")
+    harness = Harness(workDirectory, printResult)
+    results = harness.run(args.locators, args.trajectories, int(args.samples), int(args.real_time_samples),
+                          args.samples_per_update)
+  finally:
+    shutil.rmtree(workDirectory, ignore_errors=True)
+  with open(args.output, 'w') as outputFile:
+    json.dump({"python": platform.python_version(), "numpy": numpy.__version__, "machine": platform.machine(),
+               "processor": platform.processor(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "locators": args.locators, "trajectories": args.trajectories, "samples": int(args.samples),
+               "realTimeSamples": int(args.real_time_samples), "samplesPerUpdate": args.samples_per_update,
+               "results": results}, outputFile, indent=2)
+  baselineResults = []
+  if args.baseline:
+    with open(args.baseline, 'r') as baselineFile:
+      baselineResults = json.load(baselineFile)["results"]
+  failures = harness.failures + checkRegressions(results, baselineResults, args.max_slowdown)
+  for failure in failures[len(harness.failures):]:
+    print("FAILED: " + failure)
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,929 @@
+"""
+Lightweight stand-ins of the slicer, vtk, qt, ctk and CurveMaker modules, with the parts of their API that the
+TrajectoryReconstructor module uses. They let the widget and the logic run in plain CPython, so that the paths going
+through the scene, the sequence, transform and markups nodes and the model polydata can be measured without Slicer.
+The nodes keep their state and invoke their events like the MRML nodes, the Qt widgets keep their properties and
+emit their signals, the rest of the GUI is a no-op. Only the translation of the transforms is stored in the
+sequence nodes, which is all the module reads.
+install() registers the stand-ins in sys.modules and in __main__, where the module imports them from.
+"""
+import array
+import bisect
+import itertools
+import sys
+import tempfile
+import types
+
+import numpy
+
+
+def _noOp(*args, **kwargs):
+  return None
+
+
+#------------------------------------------------------------
+#
+# qt and ctk
+#
+class Signal(object):
+
+  def __init__(self):
+    self.slots = []
+
+  def connect(self, slot):
+    self.slots.append(slot)
+
+  def disconnect(self, slot):
+    self.slots.remove(slot)
+
+  def emit(self, *args):
+    for slot in list(self.slots):
+      slot(*args)
+
+
+class QObject(object):
+  """
+  Widget that stores its properties and emits its signals. The signals are created when they are first accessed,
+  by attribute or with connect(signature, slot), the other methods do nothing.
+  """
+  SIGNALS = ["clicked", "valueChanged", "timeout", "currentNodeChanged", "nodeAdded", "currentPathChanged",
+             "currentIndexChanged", "toggled"]
+
+  def __init__(self, *args):
+    self.checkable = False
+    self.checked = False
+    self.value = 0
+    self.text = ""
+    self.currentIndex = 0
+    self.visible = True
+    self.enabled = True
+    self.currentPath = ""
+    self._signals = {}
+    self._children = {}
+
+  def __getattr__(self, name):
+    if name.startswith("_"):
+      raise AttributeError(name)
+    if name in QObject.SIGNALS:
+      return self._signals.setdefault(name, Signal())
+    return _noOp
+
+  def connect(self, signature, slot):
+    getattr(self, signature.split("(")[0]).connect(slot)
+
+  def findChild(self, className, name):
+    return self._children.setdefault(name, QObject())
+
+  def cellWidget(self, row, column):
+    return self._children.setdefault((row, column), QObject())
+
+  def setChecked(self, checked):
+    self.checked = bool(checked)
+
+  def isChecked(self):
+    return self.checked
+
+  def setCheckable(self, checkable):
+    self.checkable = bool(checkable)
+
+  def click(self):
+    if self.checkable:
+      self.checked = not self.checked
+    self.clicked.emit()
+
+  def setValue(self, value):
+    if not value == self.value:
+      self.value = value
+      self.valueChanged.emit(value)
+
+  def setText(self, text):
+    self.text = text
+
+  def setCurrentIndex(self, index):
+    if not index == self.currentIndex:
+      self.currentIndex = index
+      self.currentIndexChanged.emit(index)
+
+  def setVisible(self, visible):
+    self.visible = bool(visible)
+
+  def setEnabled(self, enabled):
+    self.enabled = bool(enabled)
+
+
+class QCheckBox(QObject):
+
+  def __init__(self, *args):
+    QObject.__init__(self, *args)
+    self.checkable = True
+
+
+class QPlainTextEdit(QObject):
+  NoWrap = 0
+
+  def setPlainText(self, text):
+    self.text = text
+
+  def toPlainText(self):
+    return self.text
+
+
+class QTimer(QObject):
+  """
+  Timer that is only fired by emitting its timeout signal.
+  """
+
+  def __init__(self, *args):
+    QObject.__init__(self, *args)
+    self.interval = 0
+    self.active = False
+
+  def setInterval(self, interval):
+    self.interval = interval
+
+  def start(self):
+    self.active = True
+
+  def stop(self):
+    self.active = False
+
+  def isActive(self):
+    return self.active
+
+
+class QSettings(object):
+  values = {}
+
+  def value(self, key, defaultValue = None):
+    return QSettings.values.get(key, defaultValue)
+
+  def setValue(self, key, value):
+    QSettings.values[key] = value
+
+
+class QFileDialog(QObject):
+  # returned by getSaveFileName
+  saveFileName = ""
+
+  def getExistingDirectory(self, *args):
+    return ""
+
+  def getOpenFileName(self, *args):
+    return ""
+
+  def getSaveFileName(self, *args):
+    return QFileDialog.saveFileName
+
+
+class ctkPathLineEdit(QObject):
+  Dirs = 1
+
+
+#------------------------------------------------------------
+#
+# vtk
+#
+class vtkCommand(object):
+  ModifiedEvent = 33
+
+
+class vtkObject(object):
+
+  def __init__(self):
+    self._observers = {}
+    self._nextObserverTag = itertools.count(1)
+
+  def AddObserver(self, event, callback):
+    tag = next(self._nextObserverTag)
+    self._observers[tag] = (event, callback)
+    return tag
+
+  def RemoveObserver(self, tag):
+    self._observers.pop(tag, None)
+
+  def InvokeEvent(self, event, callData = None):
+    for observedEvent, callback in list(self._observers.values()):
+      if observedEvent == event:
+        callback(self, event)
+
+  def Modified(self):
+    self.InvokeEvent(vtkCommand.ModifiedEvent)
+
+  def GetClassName(self):
+    return type(self).__name__
+
+  def IsA(self, className):
+    return any(cls.__name__ == className for cls in type(self).__mro__)
+
+
+class vtkMatrix4x4(object):
+
+  def __init__(self):
+    self.elements = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+  def SetElement(self, i, j, value):
+    self.elements[4 * i + j] = value
+
+  def GetElement(self, i, j):
+    return self.elements[4 * i + j]
+
+  def DeepCopy(self, matrix):
+    self.elements[:] = matrix.elements
+
+
+class vtkDataArray(vtkObject):
+  """
+  numpy backed data array, which grows geometrically like the VTK arrays
+  """
+
+  def __init__(self, data = None, numOfComponents = 1):
+    vtkObject.__init__(self)
+    if data is None:
+      data = numpy.zeros((0, numOfComponents))
+    self._data = data[:, None] if data.ndim == 1 else data
+    self._numOfTuples = len(data)
+    self._name = None
+
+  def SetName(self, name):
+    self._name = name
+
+  def GetName(self):
+    return self._name
+
+  def GetNumberOfTuples(self):
+    return self._numOfTuples
+
+  def GetNumberOfComponents(self):
+    return self._data.shape[1]
+
+  def SetNumberOfTuples(self, numOfTuples):
+    if numOfTuples > len(self._data):
+      data = numpy.zeros((max(numOfTuples, 2 * len(self._data)), self._data.shape[1]), dtype=self._data.dtype)
+      data[:self._numOfTuples] = self._data[:self._numOfTuples]
+      self._data = data
+    self._numOfTuples = numOfTuples
+
+  def InsertNextTuple(self, values):
+    self.SetNumberOfTuples(self._numOfTuples + 1)
+    self._data[self._numOfTuples - 1] = values
+
+  def array(self):
+    data = self._data[:self._numOfTuples]
+    return data[:, 0] if data.shape[1] == 1 else data
+
+
+class vtkPoints(vtkObject):
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self._data = vtkDataArray(numOfComponents=3)
+
+  def SetData(self, data):
+    self._data = data
+
+  def GetData(self):
+    return self._data
+
+  def SetNumberOfPoints(self, numOfPoints):
+    self._data.SetNumberOfTuples(numOfPoints)
+
+  def GetNumberOfPoints(self):
+    return self._data.GetNumberOfTuples()
+
+
+class vtkCellArray(vtkObject):
+  """
+  Cell array in the legacy layout, the number of points of each cell followed by its point ids
+  """
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self._cells = vtkDataArray(numpy.zeros(0, dtype=numpy.int64))
+    self._numOfCells = 0
+
+  def SetCells(self, numOfCells, cells):
+    self._cells = cells
+    self._numOfCells = numOfCells
+
+  def InsertNextCell(self, numOfPoints, pointIds):
+    size = self._cells.GetNumberOfTuples()
+    self._cells.SetNumberOfTuples(size + numOfPoints + 1)
+    self._cells.array()[size:] = [numOfPoints] + list(pointIds)
+    self._numOfCells += 1
+    return self._numOfCells - 1
+
+  def GetNumberOfCells(self):
+    return self._numOfCells
+
+
+class vtkPointData(vtkObject):
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self._normals = None
+
+  def SetNormals(self, normals):
+    self._normals = normals
+
+  def GetNormals(self):
+    return self._normals
+
+
+class vtkPolyData(vtkObject):
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self.Initialize()
+
+  def Initialize(self):
+    self._points = None
+    self._polys = None
+    self._pointData = vtkPointData()
+
+  def SetPoints(self, points):
+    self._points = points
+
+  def GetPoints(self):
+    return self._points
+
+  def SetPolys(self, polys):
+    self._polys = polys
+
+  def GetPolys(self):
+    return self._polys
+
+  def GetPointData(self):
+    return self._pointData
+
+  def GetNumberOfPoints(self):
+    return self._points.GetNumberOfPoints() if self._points else 0
+
+  def GetNumberOfCells(self):
+    return self._polys.GetNumberOfCells() if self._polys else 0
+
+  def DeleteCells(self):
+    pass
+
+
+class vtkAlgorithm(vtkObject):
+  """
+  Sources and filters of the locator model, their output is an empty polydata
+  """
+
+  def __getattr__(self, name):
+    if name.startswith("_"):
+      raise AttributeError(name)
+    return _noOp
+
+  def GetOutput(self):
+    return vtkPolyData()
+
+
+def numpy_to_vtk(num_array, deep = 0, array_type = None):
+  data = numpy.array(num_array) if deep else numpy.asarray(num_array)
+  return vtkDataArray(data)
+
+
+def numpy_to_vtkIdTypeArray(num_array, deep = 0):
+  return numpy_to_vtk(numpy.asarray(num_array, dtype=numpy.int64), deep)
+
+
+def vtk_to_numpy(vtk_array):
+  return vtk_array.array()
+
+
+def get_vtk_to_numpy_typemap():
+  return {VTK_ID_TYPE: numpy.int64}
+
+
+VTK_ID_TYPE = 12
+
+
+#------------------------------------------------------------
+#
+# MRML
+#
+class vtkMRMLNode(vtkObject):
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self._id = None
+    self._name = None
+    self._scene = None
+    self._attributes = {}
+    self._disableModified = 0
+    self._modifiedPending = False
+
+  def GetID(self):
+    return self._id
+
+  def SetName(self, name):
+    self._name = name
+
+  def GetName(self):
+    return self._name
+
+  def GetNodeTagName(self):
+    return type(self).__name__[len("vtkMRML"):-len("Node")]
+
+  def SetScene(self, scene):
+    self._scene = scene
+
+  def GetScene(self):
+    return self._scene
+
+  def SetAttribute(self, name, value):
+    self._attributes[name] = value
+
+  def GetAttribute(self, name):
+    return self._attributes.get(name)
+
+  def RemoveAttribute(self, name):
+    self._attributes.pop(name, None)
+
+  def StartModify(self):
+    self._disableModified += 1
+    return self._disableModified - 1
+
+  def EndModify(self, previousDisableModified):
+    self._disableModified = previousDisableModified
+    if self._disableModified == 0 and self._modifiedPending:
+      self.Modified()
+    return self._modifiedPending
+
+  def Modified(self):
+    if self._disableModified:
+      self._modifiedPending = True
+      return
+    self._modifiedPending = False
+    vtkObject.Modified(self)
+
+
+class vtkMRMLDisplayNode(vtkMRMLNode):
+
+  def __init__(self):
+    vtkMRMLNode.__init__(self)
+    self._visibility = True
+    self._color = [1.0, 1.0, 1.0]
+    self._opacity = 1.0
+
+  def SetVisibility(self, visibility):
+    if not bool(visibility) == self._visibility:
+      self._visibility = bool(visibility)
+      self.Modified()
+
+  def GetVisibility(self):
+    return self._visibility
+
+  def SetColor(self, color):
+    self._color = list(color)
+    self.Modified()
+
+  def SetSelectedColor(self, color):
+    self.SetColor(color)
+
+  def SetOpacity(self, opacity):
+    self._opacity = opacity
+    self.Modified()
+
+
+class vtkMRMLModelDisplayNode(vtkMRMLDisplayNode):
+  pass
+
+
+class vtkMRMLMarkupsDisplayNode(vtkMRMLDisplayNode):
+  pass
+
+
+class vtkMRMLTransformableNode(vtkMRMLNode):
+  TransformModifiedEvent = 15000
+
+  def __init__(self):
+    vtkMRMLNode.__init__(self)
+    self._transformNodeID = None
+
+  def SetAndObserveTransformNodeID(self, transformNodeID):
+    self._transformNodeID = transformNodeID
+
+  def GetTransformNodeID(self):
+    return self._transformNodeID
+
+  def RemoveNodeReferenceIDs(self, role):
+    if role == "transform":
+      self._transformNodeID = None
+
+
+class vtkMRMLDisplayableNode(vtkMRMLTransformableNode):
+  DISPLAY_NODE_CLASS = vtkMRMLDisplayNode
+
+  def __init__(self):
+    vtkMRMLTransformableNode.__init__(self)
+    self._displayNodeID = None
+
+  def CreateDefaultDisplayNodes(self):
+    if self.GetDisplayNode() is None and self._scene is not None:
+      displayNode = self.DISPLAY_NODE_CLASS()
+      self._scene.AddNode(displayNode)
+      self.SetAndObserveDisplayNodeID(displayNode.GetID())
+
+  def SetAndObserveDisplayNodeID(self, displayNodeID):
+    self._displayNodeID = displayNodeID
+
+  def GetDisplayNodeID(self):
+    return self._displayNodeID
+
+  def GetDisplayNode(self):
+    return self._scene.GetNodeByID(self._displayNodeID) if self._scene is not None else None
+
+  def SetDisplayVisibility(self, visibility):
+    displayNode = self.GetDisplayNode()
+    if displayNode is not None:
+      displayNode.SetVisibility(visibility)
+
+  def GetDisplayVisibility(self):
+    displayNode = self.GetDisplayNode()
+    return displayNode is not None and displayNode.GetVisibility()
+
+
+class vtkMRMLModelNode(vtkMRMLDisplayableNode):
+  DISPLAY_NODE_CLASS = vtkMRMLModelDisplayNode
+
+  def __init__(self):
+    vtkMRMLDisplayableNode.__init__(self)
+    self._polyData = None
+
+  def SetAndObservePolyData(self, polyData):
+    self._polyData = polyData
+    self.Modified()
+
+  def GetPolyData(self):
+    return self._polyData
+
+
+class vtkMRMLMarkupsNode(vtkMRMLDisplayableNode):
+  DISPLAY_NODE_CLASS = vtkMRMLMarkupsDisplayNode
+
+  def __init__(self):
+    vtkMRMLDisplayableNode.__init__(self)
+    self._positions = []
+    self._labels = []
+    self._locked = False
+
+  def GetMarkupsDisplayNode(self):
+    return self.GetDisplayNode()
+
+  def SetLocked(self, locked):
+    self._locked = bool(locked)
+
+  def RemoveAllMarkups(self):
+    self._positions = []
+    self._labels = []
+    self.Modified()
+
+
+class vtkMRMLMarkupsFiducialNode(vtkMRMLMarkupsNode):
+
+  def AddFiducialFromArray(self, pos, label = ""):
+    self._positions.append([float(pos[0]), float(pos[1]), float(pos[2])])
+    self._labels.append(label)
+    self.Modified()
+    return len(self._positions) - 1
+
+  def AddFiducial(self, x, y, z, label = ""):
+    return self.AddFiducialFromArray([x, y, z], label)
+
+  def SetNthFiducialLabel(self, index, label):
+    self._labels[index] = label
+    self.Modified()
+
+  def GetNumberOfFiducials(self):
+    return len(self._positions)
+
+  def GetNthFiducialPosition(self, index, pos):
+    pos[:] = self._positions[index]
+
+
+class vtkMRMLTransformNode(vtkMRMLDisplayableNode):
+  pass
+
+
+class vtkMRMLLinearTransformNode(vtkMRMLTransformNode):
+
+  def __init__(self):
+    vtkMRMLTransformNode.__init__(self)
+    self._matrix = vtkMatrix4x4()
+
+  def SetMatrixTransformToParent(self, matrix):
+    self._matrix.DeepCopy(matrix)
+    self.Modified()
+    self.InvokeEvent(vtkMRMLTransformableNode.TransformModifiedEvent)
+
+  def GetMatrixTransformToParent(self, matrix):
+    matrix.DeepCopy(self._matrix)
+
+
+class SequenceDataNode(object):
+  """
+  Transform stored in a sequence node, created when it is accessed
+  """
+
+  def __init__(self, x, y, z):
+    self._translation = (x, y, z)
+
+  def GetMatrixTransformToParent(self, matrix):
+    matrix.SetElement(0, 3, self._translation[0])
+    matrix.SetElement(1, 3, self._translation[1])
+    matrix.SetElement(2, 3, self._translation[2])
+
+
+class vtkMRMLSequenceNode(vtkMRMLNode):
+  """
+  Sequence of transforms sorted by their numeric index value. Each data node is copied when it is stored,
+  as in the Sequences extension.
+  """
+
+  def __init__(self):
+    vtkMRMLNode.__init__(self)
+    self._indexValues = array.array('d')
+    self._translations = array.array('d')
+    self._matrix = vtkMatrix4x4()
+
+  def SetDataNodeAtValue(self, dataNode, indexValue):
+    value = float(indexValue)
+    dataNode.GetMatrixTransformToParent(self._matrix)
+    translation = [self._matrix.GetElement(0, 3), self._matrix.GetElement(1, 3), self._matrix.GetElement(2, 3)]
+    indexValues = self._indexValues
+    if len(indexValues) == 0 or value > indexValues[-1]:
+      indexValues.append(value)
+      self._translations.extend(translation)
+    else:
+      index = bisect.bisect_left(indexValues, value)
+      if index < len(indexValues) and indexValues[index] == value:
+        self._translations[3 * index:3 * index + 3] = array.array('d', translation)
+      else:
+        indexValues.insert(index, value)
+        self._translations[3 * index:3 * index] = array.array('d', translation)
+    self.Modified()
+
+  def RemoveAllDataNodes(self):
+    self._indexValues = array.array('d')
+    self._translations = array.array('d')
+    self.Modified()
+
+  def GetNumberOfDataNodes(self):
+    return len(self._indexValues)
+
+  def GetNthIndexValue(self, index):
+    return repr(self._indexValues[index])
+
+  def GetNthDataNode(self, index):
+    return SequenceDataNode(*self._translations[3 * index:3 * index + 3])
+
+
+class vtkMRMLSequenceBrowserNode(vtkMRMLNode):
+
+  def __init__(self):
+    vtkMRMLNode.__init__(self)
+    self._recordingActive = False
+    self._playbackActive = False
+
+  def SetRecordingActive(self, recordingActive):
+    self._recordingActive = bool(recordingActive)
+    self.Modified()
+
+  def GetRecordingActive(self):
+    return self._recordingActive
+
+  def SetPlaybackActive(self, playbackActive):
+    self._playbackActive = bool(playbackActive)
+    self.Modified()
+
+  def GetPlaybackActive(self):
+    return self._playbackActive
+
+
+class vtkMRMLInteractionNode(vtkMRMLNode):
+  ViewTransform = 2
+
+
+class NodeCollection(object):
+
+  def __init__(self, nodes):
+    self._nodes = nodes
+
+  def GetNumberOfItems(self):
+    return len(self._nodes)
+
+  def GetItemAsObject(self, index):
+    return self._nodes[index]
+
+
+class vtkMRMLScene(vtkObject):
+  NodeAddedEvent = 66000
+  NodeRemovedEvent = 66001
+  StartImportEvent = 66003
+  EndImportEvent = 66004
+  BatchProcessState = 0x0001
+  NODE_CLASSES = dict((cls.__name__, cls) for cls in [
+    vtkMRMLModelNode, vtkMRMLModelDisplayNode, vtkMRMLMarkupsFiducialNode, vtkMRMLMarkupsDisplayNode,
+    vtkMRMLLinearTransformNode, vtkMRMLSequenceNode, vtkMRMLSequenceBrowserNode])
+
+  def __init__(self):
+    vtkObject.__init__(self)
+    self._nodes = {}
+    self._nextNodeNumber = itertools.count(1)
+    self._states = []
+
+  def CreateNodeByClass(self, className):
+    return vtkMRMLScene.NODE_CLASSES[className]()
+
+  def AddNode(self, node):
+    node._id = "%s%d" % (node.GetClassName(), next(self._nextNodeNumber))
+    if not node.GetName():
+      node.SetName("%s_%d" % (node.GetNodeTagName(), len(self._nodes) + 1))
+    node.SetScene(self)
+    self._nodes[node.GetID()] = node
+    self.InvokeEvent(vtkMRMLScene.NodeAddedEvent, node)
+    return node
+
+  def RemoveNode(self, node):
+    if node is None or self._nodes.pop(node.GetID(), None) is None:
+      return
+    self.InvokeEvent(vtkMRMLScene.NodeRemovedEvent, node)
+
+  def GetNodeByID(self, nodeID):
+    return self._nodes.get(nodeID)
+
+  def GetNodesByClass(self, className):
+    return NodeCollection([node for node in self._nodes.values() if node.IsA(className)])
+
+  def GetNumberOfNodes(self):
+    return len(self._nodes)
+
+  def Clear(self, removeSingletons = 0):
+    for node in list(self._nodes.values()):
+      self.RemoveNode(node)
+
+  def StartState(self, state):
+    self._states.append(state)
+
+  def EndState(self, state):
+    self._states.remove(state)
+
+  def IsBatchProcessing(self):
+    return vtkMRMLScene.BatchProcessState in self._states
+
+
+class qMRMLNodeComboBox(QObject):
+
+  def __init__(self, *args):
+    QObject.__init__(self, *args)
+    self._currentNode = None
+
+  def currentNode(self):
+    return self._currentNode
+
+  def setCurrentNode(self, node):
+    if not node is self._currentNode:
+      self._currentNode = node
+      self.currentNodeChanged.emit(node)
+
+
+#------------------------------------------------------------
+#
+# slicer module and ScriptedLoadableModule base classes
+#
+class ScriptedLoadableModule(object):
+
+  def __init__(self, parent):
+    self.parent = parent
+
+
+class ScriptedLoadableModuleWidget(object):
+
+  def __init__(self, parent = None):
+    self.parent = parent
+    self.layout = QObject()
+
+  def setup(self):
+    pass
+
+
+class ScriptedLoadableModuleLogic(object):
+
+  def __init__(self, parent = None):
+    self.parent = parent
+
+
+class ScriptedLoadableModuleTest(object):
+  pass
+
+
+class ModuleWidgets(object):
+  """
+  slicer.modules of the module dependencies, their widgets only return stand-in child widgets
+  """
+
+  def __init__(self):
+    self.sequencebrowser = types.SimpleNamespace(widgetRepresentation=self._widgetFactory())
+    self.openigtlinkif = types.SimpleNamespace(widgetRepresentation=self._widgetFactory())
+
+  def _widgetFactory(self):
+    widget = QObject()
+    return lambda: widget
+
+
+class MessageLog(object):
+  """
+  slicer.util functions that show a dialog, the messages are stored instead
+  """
+
+  def __init__(self):
+    self.warnings = []
+
+  def warningDisplay(self, text, windowTitle = None, **kwargs):
+    self.warnings.append(text)
+
+  def confirmYesNoDisplay(self, text, windowTitle = None, **kwargs):
+    return True
+
+
+def createModules(cachePath):
+  """
+  :param cachePath: slicer.app.cachePath
+  :return: dictionary of the stand-in modules, by module name
+  """
+  modules = dict((name, types.ModuleType(name)) for name in [
+    "slicer", "slicer.ScriptedLoadableModule", "slicer.util", "vtk", "vtk.util", "vtk.util.numpy_support", "qt",
+    "ctk", "CurveMaker"])
+
+  qt = modules["qt"]
+  for name in ["QPushButton", "QSpinBox", "QDoubleSpinBox", "QLabel", "QLineEdit", "QComboBox", "QProgressBar",
+               "QFormLayout", "QHBoxLayout", "QVBoxLayout", "QWidget", "QTableWidget"]:
+    setattr(qt, name, type(name, (QObject,), {}))
+  qt.QObject = QObject
+  qt.QCheckBox = QCheckBox
+  qt.QTimer = QTimer
+  qt.QPlainTextEdit = QPlainTextEdit
+  qt.QSettings = QSettings
+  qt.QFileDialog = QFileDialog
+  qt.SIGNAL = lambda signature: signature
+
+  ctk = modules["ctk"]
+  ctk.ctkCollapsibleButton = type("ctkCollapsibleButton", (QObject,), {})
+  ctk.ctkPathLineEdit = ctkPathLineEdit
+
+  numpySupport = modules["vtk.util.numpy_support"]
+  for function in [numpy_to_vtk, numpy_to_vtkIdTypeArray, vtk_to_numpy, get_vtk_to_numpy_typemap]:
+    setattr(numpySupport, function.__name__, function)
+  modules["vtk.util"].numpy_support = numpySupport
+  vtk = modules["vtk"]
+  vtk.util = modules["vtk.util"]
+  vtk.VTK_MAJOR_VERSION = 9
+  vtk.VTK_ID_TYPE = VTK_ID_TYPE
+  for cls in [vtkCommand, vtkObject, vtkMatrix4x4, vtkDataArray, vtkPoints, vtkCellArray, vtkPolyData]:
+    setattr(vtk, cls.__name__, cls)
+  for name in ["vtkCylinderSource", "vtkSphereSource", "vtkTransform", "vtkTransformPolyDataFilter",
+               "vtkAppendPolyData"]:
+    setattr(vtk, name, type(name, (vtkAlgorithm,), {}))
+
+  scriptedLoadableModule = modules["slicer.ScriptedLoadableModule"]
+  for cls in [ScriptedLoadableModule, ScriptedLoadableModuleWidget, ScriptedLoadableModuleLogic,
+              ScriptedLoadableModuleTest]:
+    setattr(scriptedLoadableModule, cls.__name__, cls)
+  messageLog = MessageLog()
+  util = modules["slicer.util"]
+  util.messageLog = messageLog
+  util.warningDisplay = messageLog.warningDisplay
+  util.confirmYesNoDisplay = messageLog.confirmYesNoDisplay
+  util.reloadScriptedModule = _noOp
+  slicer = modules["slicer"]
+  slicer.ScriptedLoadableModule = scriptedLoadableModule
+  slicer.util = util
+  slicer.app = types.SimpleNamespace(cachePath=cachePath)
+  slicer.modules = ModuleWidgets()
+  slicer.mrmlScene = vtkMRMLScene()
+  slicer.qMRMLNodeComboBox = qMRMLNodeComboBox
+  for cls in [vtkMRMLScene, vtkMRMLNode, vtkMRMLDisplayNode, vtkMRMLTransformableNode, vtkMRMLDisplayableNode,
+              vtkMRMLInteractionNode, vtkMRMLTransformNode] + list(vtkMRMLScene.NODE_CLASSES.values()):
+    setattr(slicer, cls.__name__, cls)
+
+  curveMaker = modules["CurveMaker"]
+  curveMaker.CurveMakerLogic = type("CurveMakerLogic", (vtkAlgorithm,), {"ModelColor": [1.0, 1.0, 0.5]})
+  return modules
+
+
+def install(cachePath = None):
+  """
+  Register the stand-ins in sys.modules and in __main__, replacing the real modules if they were imported.
+  :param cachePath: slicer.app.cachePath, the temporary directory if None
+  :return: the slicer stand-in module
+  """
+  if cachePath is None:
+    cachePath = tempfile.gettempdir()
+  modules = createModules(cachePath)
+  sys.modules.update(modules)
+  mainModule = sys.modules["__main__"]
+  for name in ["slicer", "vtk", "qt", "ctk"]:
+    setattr(mainModule, name, modules[name])
+  return modules["slicer"]
@@ -5,7 +5,10 @@ from __main__ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 from functools import partial
 import CurveMaker, numpy
-import csv
+from vtk.util import numpy_support
+import TrajectoryReconstructorLib
+from TrajectoryReconstructorLib import LocatorRegistry, ReconstructionCache, ReconstructionDiagnostics, \
+  ReconstructionJob, SequenceSamples, StreamingRecorder, StreamingResampler, TubeBuilder
 #------------------------------------------------------------
 #
 # Locator
@@ -42,9 +45,11 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
   REL_LOCATORINDEX_FIDUCIAL = "vtkMRMLMarkupsFiducialNode.rel_locatorIndex"
   REL_LOCATORINDEX_MODEL = "vtkMRMLModelNode.rel_locatorIndex"
   REL_LOCATORINDEX_SEQ = "vtkMRMLSequenceNode.rel_locatorIndex"
+  REL_LOCATORNODE_SEQ = "vtkMRMLSequenceNode.rel_locatorNodeID"
   REL_LOCATOR = "vtkMRMLLinearTranformNode.rel_locator"
   #REL_TRAJECTORYINDEX_TRANS = "vtkMRMLLinearTranformNode.rel_trajectoryIndex"
   REL_TRAJECTORYINDEX_SEQ = "vtkMRMLSequenceNode.rel_trajectoryIndex"
+  STALE_MODEL = "vtkMRMLModelNode.stale"
   def setup(self):
     ScriptedLoadableModuleWidget.setup(self)
     # Instantiate and connect widgets ...
@@ -60,6 +65,17 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.measurementVariance = 0.0004
     self.movementThreshold = 1.0 # in millimeter
     self.downSampleStepSize = 1
+    self.realTimeUpdateRate = 20 # in Hz
+    self.tubeRadius = 0.5 # in millimeter
+    self.simplificationTolerance = 0.0 # in millimeter, the displayed points are not simplified if 0
+    self.maxNumOfDisplayedPoints = 0 # no limit if 0
+    settings = qt.QSettings()
+    # the trajectories of an imported scene are only reconstructed when they are needed, off unless the user chose it
+    self.deferredReconstruction = settings.value("TrajectoryReconstructor/DeferredReconstruction", "false") == "true"
+    self.cacheEnabled = settings.value("TrajectoryReconstructor/CacheEnabled", "true") == "true"
+    self.cacheDirectory = settings.value("TrajectoryReconstructor/CacheDirectory",
+                                         os.path.join(slicer.app.cachePath, "TrajectoryReconstructor"))
+    self.cacheMaxSize = int(settings.value("TrajectoryReconstructor/CacheMaxSize", 256)) # in MB
 
     self.sequenceBrowserWidget = slicer.modules.sequencebrowser.widgetRepresentation()
     self.replayButton = self.sequenceBrowserWidget.findChild("QPushButton","pushButton_VcrPlayPause")
@@ -107,6 +123,18 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.settingFormLayout = qt.QFormLayout(self.algorithmSettingCollapsibleButton)
     self.realTimeReconstructCheckBox = qt.QCheckBox()
     self.realTimeReconstructCheckBox.setChecked(True)
+    self.realTimeUpdateRateSpinBox = qt.QSpinBox()
+    self.realTimeUpdateRateSpinBox.setMinimum(1)
+    self.realTimeUpdateRateSpinBox.setMaximum(100)
+    self.realTimeUpdateRateSpinBox.setValue(self.realTimeUpdateRate)
+    self.realTimeUpdateRateSpinBox.setSuffix(" Hz")
+    self.realTimeUpdateRateSpinBox.setToolTip("Number of real-time trajectory updates per second. \
+                                              All the samples recorded since the previous update are processed at once.")
+    self.realTimeUpdateRateSpinBox.valueChanged.connect(self.onRealTimeUpdateRateChanged)
+    self.realTimeTimer = qt.QTimer()
+    self.realTimeTimer.setInterval(int(1000 / self.realTimeUpdateRate))
+    self.realTimeTimer.timeout.connect(self.onRealTimeUpdate)
+    self.realTimeTrajectories = []
     self.processVarianceSpinBox = qt.QDoubleSpinBox()
     self.processVarianceSpinBox.setDecimals(6)
     self.processVarianceSpinBox.setValue(self.processVariance)
@@ -134,16 +162,64 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.downSampleStepSizeSpinBox.setSingleStep(1)
     self.downSampleStepSizeSpinBox.setToolTip("Moving window size for downsampling, this variable is used in combination with the movement threshold")
     self.downSampleStepSizeSpinBox.valueChanged.connect(self.onDownSampleStepSizeChanged)
+    self.simplificationToleranceSpinBox = qt.QDoubleSpinBox()
+    self.simplificationToleranceSpinBox.setDecimals(2)
+    self.simplificationToleranceSpinBox.setMinimum(0.0)
+    self.simplificationToleranceSpinBox.setSingleStep(0.1)
+    self.simplificationToleranceSpinBox.setValue(self.simplificationTolerance)
+    self.simplificationToleranceSpinBox.setSuffix(" mm")
+    self.simplificationToleranceSpinBox.setSpecialValueText("Off")
+    self.simplificationToleranceSpinBox.setToolTip("Maximum distance between the resampled points and the displayed trajectory. \
+                                                    Points are removed from the model and the markups until this distance is reached, \
+                                                    the exported files keep all the tracked samples.")
+    self.simplificationToleranceSpinBox.valueChanged.connect(self.onSimplificationToleranceChanged)
+    self.maxNumOfDisplayedPointsSpinBox = qt.QSpinBox()
+    self.maxNumOfDisplayedPointsSpinBox.setMinimum(0)
+    self.maxNumOfDisplayedPointsSpinBox.setMaximum(100000)
+    self.maxNumOfDisplayedPointsSpinBox.setSingleStep(10)
+    self.maxNumOfDisplayedPointsSpinBox.setValue(self.maxNumOfDisplayedPoints)
+    self.maxNumOfDisplayedPointsSpinBox.setSpecialValueText("Unlimited")
+    self.maxNumOfDisplayedPointsSpinBox.setToolTip("Maximum number of points of a displayed trajectory, \
+                                                    the points that reduce the distance to the resampled points the most are kept")
+    self.maxNumOfDisplayedPointsSpinBox.valueChanged.connect(self.onMaxNumOfDisplayedPointsChanged)
+    self.deferredReconstructionCheckBox = qt.QCheckBox()
+    self.deferredReconstructionCheckBox.setChecked(self.deferredReconstruction)
+    self.deferredReconstructionCheckBox.setToolTip("When a scene is imported, the trajectories are only reconstructed when \
+                                                    they are shown, replayed, edited or recorded again. Until then they are marked as stale.")
+    self.deferredReconstructionCheckBox.connect(qt.SIGNAL("clicked()"), self.onDeferredReconstructionChanged)
+    self.cacheEnabledCheckBox = qt.QCheckBox()
+    self.cacheEnabledCheckBox.setChecked(self.cacheEnabled)
+    self.cacheEnabledCheckBox.setToolTip("Store the reconstructed trajectories on disk, a trajectory is read from the cache \
+                                          when its samples and the algorithm settings didn't change")
+    self.cacheEnabledCheckBox.connect(qt.SIGNAL("clicked()"), self.onCacheSettingsChanged)
+    self.cacheDirectoryEdit = ctk.ctkPathLineEdit()
+    self.cacheDirectoryEdit.filters = ctk.ctkPathLineEdit.Dirs
+    self.cacheDirectoryEdit.currentPath = self.cacheDirectory
+    self.cacheDirectoryEdit.connect("currentPathChanged(QString)", self.onCacheSettingsChanged)
+    self.cacheMaxSizeSpinBox = qt.QSpinBox()
+    self.cacheMaxSizeSpinBox.setMinimum(1)
+    self.cacheMaxSizeSpinBox.setMaximum(100000)
+    self.cacheMaxSizeSpinBox.setValue(self.cacheMaxSize)
+    self.cacheMaxSizeSpinBox.setSuffix(" MB")
+    self.cacheMaxSizeSpinBox.setToolTip("The least recently used trajectories are removed from the cache above this size")
+    self.cacheMaxSizeSpinBox.valueChanged.connect(self.onCacheSettingsChanged)
 
     self.savingSeperateChannelCheckBox = qt.QCheckBox()
     self.savingSeperateChannelCheckBox.connect(qt.SIGNAL("clicked()"), self.onSavingSeperateChannel)
     self.savingSeperateChannelCheckBox.setToolTip("When this check box is checked, tracking data in different channel will be saved in different files.")
     self.removeDuplicatePosCheckBox = qt.QCheckBox()
     self.settingFormLayout.addRow("Real-time Reconstruct: ", self.realTimeReconstructCheckBox)
+    self.settingFormLayout.addRow("Real-time Update Rate: ", self.realTimeUpdateRateSpinBox)
     self.settingFormLayout.addRow("Process Variance: ", self.processVarianceSpinBox)
     self.settingFormLayout.addRow("Measurement Variance: ", self.measurementVarianceSpinBox)
     self.settingFormLayout.addRow("Movement Threshold: ", self.movementThresholdSpinBox)
     self.settingFormLayout.addRow("Downsample Window Size: ", self.downSampleStepSizeSpinBox)
+    self.settingFormLayout.addRow("Simplification Tolerance: ", self.simplificationToleranceSpinBox)
+    self.settingFormLayout.addRow("Maximum Displayed Points: ", self.maxNumOfDisplayedPointsSpinBox)
+    self.settingFormLayout.addRow("Reconstruct on Demand: ", self.deferredReconstructionCheckBox)
+    self.settingFormLayout.addRow("Cache Reconstructions: ", self.cacheEnabledCheckBox)
+    self.settingFormLayout.addRow("Cache Directory: ", self.cacheDirectoryEdit)
+    self.settingFormLayout.addRow("Cache Size: ", self.cacheMaxSizeSpinBox)
     self.settingFormLayout.addRow("SeperateFiles: ", self.savingSeperateChannelCheckBox)
     self.settingFormLayout.addRow("Remove Duplicated Positions: ", self.removeDuplicatePosCheckBox)
 
@@ -155,62 +231,37 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.locatorRecordCheckBox = []
     self.trajectoryIndexSpinBox = []
     self.trajectoryIndexSpinBoxLastValue = []
+    self.trajectoryStatusLabel = []
     self.locatorReplayCheckBox = []
+    self.locatorEditCheckBox = []
     self.locatorRecontructButton = []
     self.colors = [[0.3, 0.5, 0.5], [0.2, 0.3, 0.6], [0.1, 0.6, 0.5], [0.5, 0.9, 0.5], [0.0, 0.2, 0.8]]
+    self.addChannelButton = qt.QPushButton()
+    self.addChannelButton.text = 'Add Locator'
+    self.addChannelButton.setToolTip("Add a row to record, replay and reconstruct one more locator at the same time")
+    self.addChannelButton.connect(qt.SIGNAL("clicked()"), self.addLocatorChannel)
+    self.reconstructAllButton = qt.QPushButton()
+    self.reconstructAllButton.text = 'Reconstruct All'
+    self.reconstructAllButton.setToolTip("Reconstruct all the trajectories of all the locators in the background")
+    self.reconstructAllButton.connect(qt.SIGNAL("clicked()"), self.onReconstructAll)
+    self.reconstructAllProgressBar = qt.QProgressBar()
+    self.reconstructAllProgressBar.setVisible(False)
+    self.cancelReconstructAllButton = qt.QPushButton()
+    self.cancelReconstructAllButton.text = 'Cancel'
+    self.cancelReconstructAllButton.setVisible(False)
+    self.cancelReconstructAllButton.connect(qt.SIGNAL("clicked()"), self.onCancelReconstructAll)
+    self.reconstructAllTimer = qt.QTimer()
+    self.reconstructAllTimer.setInterval(50)
+    self.reconstructAllTimer.timeout.connect(self.onReconstructAllUpdate)
+    self.reconstructAllJob = None
+    reconstructAllLayout = qt.QHBoxLayout()
+    reconstructAllLayout.addWidget(self.addChannelButton)
+    reconstructAllLayout.addWidget(self.reconstructAllButton)
+    reconstructAllLayout.addWidget(self.reconstructAllProgressBar)
+    reconstructAllLayout.addWidget(self.cancelReconstructAllButton)
+    self.selectionFormLayout.addRow(reconstructAllLayout)
     for i in range(self.nLocators):
-      self.transformSelector.append(slicer.qMRMLNodeComboBox())
-      transSelector = self.transformSelector[i]
-      transSelector.nodeTypes = ( ("vtkMRMLLinearTransformNode"), "" )
-      transSelector.selectNodeUponCreation = True
-      transSelector.addEnabled = False
-      transSelector.removeEnabled = False
-      transSelector.noneEnabled = False
-      transSelector.showHidden = False
-      transSelector.showChildNodeTypes = False
-      transSelector.setMRMLScene( slicer.mrmlScene )
-      transSelector.connect("nodeAdded(vtkMRMLNode*)", self.onAddedTransNode)
-      transSelector.setToolTip( "Choose a locator transformation matrix" )
-
-      self.locatorRecordCheckBox.append(qt.QCheckBox())
-      checkbox = self.locatorRecordCheckBox[i]
-      checkbox.checked = 0
-      checkbox.text = 'Record: '
-      checkbox.setToolTip("Activate locator")
-      checkbox.setLayoutDirection(1) # 1 =  QtCore.Qt.RightToLeft
-      checkbox.connect(qt.SIGNAL("clicked()"), partial(self.onLocatorRecording, checkbox))
-
-      selectorLayout = qt.QHBoxLayout()
-      recordingLayout = qt.QHBoxLayout()
-      selectorLayout.addWidget(transSelector)
-      recordingLayout.addWidget(checkbox)
-      self.trajectoryIndexSpinBox.append(qt.QSpinBox())
-      self.trajectoryIndexSpinBoxLastValue.append(-1)
-      self.trajectoryIndexSpinBox[i].setValue(0)
-      self.trajectoryIndexSpinBox[i].setMinimum(0)
-      self.trajectoryIndexSpinBox[i].setSingleStep(1)
-      selectorLayout.addWidget(self.trajectoryIndexSpinBox[i])
-      self.trajectoryIndexSpinBox[i].valueChanged.connect(partial(self.onTrajectoyIndexChanged, self.trajectoryIndexSpinBox[i]))
-      
-      self.locatorReplayCheckBox.append(qt.QCheckBox())
-      checkbox = self.locatorReplayCheckBox[i]
-      checkbox.checked = 0
-      checkbox.text = 'Replay: '
-      checkbox.setToolTip("Replay locator")
-      checkbox.setLayoutDirection(1)  # 1 =  QtCore.Qt.RightToLeft
-      checkbox.connect(qt.SIGNAL("clicked()"), partial(self.onLocatorReplay, checkbox))
-      recordingLayout.addWidget(checkbox)
-      
-      self.locatorRecontructButton.append(qt.QPushButton())
-      pushbutton = self.locatorRecontructButton[i]
-      pushbutton.setCheckable(False)
-      pushbutton.text = 'Reconstruct'
-      pushbutton.setToolTip("Generate the trajectory based on the tracked needle")
-      pushbutton.connect(qt.SIGNAL("clicked()"), partial(self.onConstructTrajectory, pushbutton))
-      recordingLayout.addWidget(pushbutton)
-      
-      self.selectionFormLayout.addRow("Locator #%d:" % (i+1), selectorLayout)
-      self.selectionFormLayout.addRow("Locator #%d:" % (i+1), recordingLayout)
+      self.addLocatorChannel()
 
     self.exportImportCollapsibleButton = ctk.ctkCollapsibleButton()
     self.exportImportCollapsibleButton.text = "Export/Import Results"
@@ -228,9 +279,14 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.saveFileLayout.addWidget(self.saveButton)
     self.outputDirBrowserButton.clicked.connect(self.selectDirectory)
     self.saveButton.clicked.connect(self.saveFile)
+    self.exportFormatComboBox = qt.QComboBox()
+    self.exportFormatComboBox.addItem("CSV")
+    self.exportFormatComboBox.addItem("Binary (%s)" % TrajectoryReconstructorLib.trackingbinary.FILE_EXTENSION)
+    self.exportFormatComboBox.setToolTip("The binary format is faster to save and load and can be opened with numpy.memmap. \
+                                          Both formats can be imported, the format is detected from the file content.")
 
     self.inputFileBrowserButton = qt.QPushButton()
-    self.inputFileBrowserButton.setText("Input CSV file name")
+    self.inputFileBrowserButton.setText("Input file name")
     self.loadButton = qt.QPushButton()
     self.loadButton.setText("Load")
     self.importLayout = qt.QHBoxLayout()
@@ -239,10 +295,63 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     self.inputFileBrowserButton.clicked.connect(self.selectForImport)
     self.loadButton.clicked.connect(self.loadFile)
 
+    self.streamingCheckBox = qt.QCheckBox()
+    self.streamingCheckBox.setToolTip("While recording, append the tracked samples to one file per locator in a new \
+                                       session directory of the export directory. The directory can be imported \
+                                       with SeperateFiles checked.")
+    self.streamingCheckBox.connect(qt.SIGNAL("clicked()"), self.onStreamingChanged)
+    self.streamingTimer = qt.QTimer()
+    self.streamingTimer.setInterval(500)
+    self.streamingTimer.timeout.connect(self.onStreamingUpdate)
+    self.streamingRecorder = None
+    self.streamingTrajectories = []
+    self.streamedSamples = {}
+    self.streamingSessionDirectory = ""
+
+    self.exportImportFormLayout.addRow("Export format: ", self.exportFormatComboBox)
     self.exportImportFormLayout.addRow("Export to directory: ", self.exportLayout)
     self.exportImportFormLayout.addRow("Export File name: ", self.saveFileLayout)
     self.exportImportFormLayout.addRow("Import File: ", self.importLayout)
-
+    self.exportImportFormLayout.addRow("Stream While Recording: ", self.streamingCheckBox)
+
+    self.diagnosticsCollapsibleButton = ctk.ctkCollapsibleButton()
+    self.diagnosticsCollapsibleButton.text = "Diagnostics"
+    self.diagnosticsCollapsibleButton.setChecked(False)
+    self.layout.addWidget(self.diagnosticsCollapsibleButton)
+    self.diagnosticsFormLayout = qt.QFormLayout(self.diagnosticsCollapsibleButton)
+    self.diagnosticsTextEdit = qt.QPlainTextEdit()
+    self.diagnosticsTextEdit.setReadOnly(True)
+    self.diagnosticsTextEdit.setLineWrapMode(qt.QPlainTextEdit.NoWrap)
+    self.diagnosticsTextEdit.setToolTip("Time of each reconstruction stage by locator and trajectory, in milliseconds \
+                                         for the last call or in seconds for all the calls")
+    self.diagnosticsCumulativeCheckBox = qt.QCheckBox()
+    self.diagnosticsCumulativeCheckBox.checked = False
+    self.diagnosticsCumulativeCheckBox.setToolTip("Show the cumulative times instead of the times of the last calls")
+    self.diagnosticsCumulativeCheckBox.connect(qt.SIGNAL("clicked()"), self.updateDiagnostics)
+    self.refreshDiagnosticsButton = qt.QPushButton()
+    self.refreshDiagnosticsButton.text = 'Refresh'
+    self.refreshDiagnosticsButton.connect(qt.SIGNAL("clicked()"), self.updateDiagnostics)
+    self.resetDiagnosticsButton = qt.QPushButton()
+    self.resetDiagnosticsButton.text = 'Reset'
+    self.resetDiagnosticsButton.connect(qt.SIGNAL("clicked()"), self.onResetDiagnostics)
+    self.exportDiagnosticsButton = qt.QPushButton()
+    self.exportDiagnosticsButton.text = 'Export JSON'
+    self.exportDiagnosticsButton.connect(qt.SIGNAL("clicked()"), self.onExportDiagnostics)
+    self.profileReconstructionButton = qt.QPushButton()
+    self.profileReconstructionButton.text = 'Profile Reconstruction'
+    self.profileReconstructionButton.setToolTip("Reconstruct all the trajectories that are not recorded in real time \
+                                                 with cProfile, without the reconstruction cache")
+    self.profileReconstructionButton.connect(qt.SIGNAL("clicked()"), self.onProfileReconstruction)
+    diagnosticsButtonLayout = qt.QHBoxLayout()
+    diagnosticsButtonLayout.addWidget(self.refreshDiagnosticsButton)
+    diagnosticsButtonLayout.addWidget(self.resetDiagnosticsButton)
+    diagnosticsButtonLayout.addWidget(self.exportDiagnosticsButton)
+    diagnosticsButtonLayout.addWidget(self.profileReconstructionButton)
+    self.diagnosticsFormLayout.addRow("Cumulative: ", self.diagnosticsCumulativeCheckBox)
+    self.diagnosticsFormLayout.addRow(self.diagnosticsTextEdit)
+    self.diagnosticsFormLayout.addRow(diagnosticsButtonLayout)
+
+    self.updateReconstructionCache()
     self.initialize()
 
     #--------------------------------------------------
@@ -254,56 +363,140 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     # Add vertical spacer
     self.layout.addStretch(1)
 
-  def initialize(self, sequenceNodesList = None, sequenceBrowserNodesList = None):
+  def addLocatorChannel(self):
+    """
+    Add the GUI components of one locator channel: the transform selector, the trajectory index,
+    and the record, replay and reconstruct controls. Any registered locator can be selected in any channel.
+    :return: None
+    """
+    i = len(self.transformSelector)
+    self.nLocators = i + 1
+    self.transformSelector.append(slicer.qMRMLNodeComboBox())
+    transSelector = self.transformSelector[i]
+    transSelector.nodeTypes = ( ("vtkMRMLLinearTransformNode"), "" )
+    transSelector.selectNodeUponCreation = True
+    transSelector.addEnabled = False
+    transSelector.removeEnabled = False
+    transSelector.noneEnabled = False
+    transSelector.showHidden = False
+    transSelector.showChildNodeTypes = False
+    transSelector.setMRMLScene( slicer.mrmlScene )
+    transSelector.connect("nodeAdded(vtkMRMLNode*)", self.onAddedTransNode)
+    transSelector.connect("currentNodeChanged(vtkMRMLNode*)", partial(self.updateChannelStatus, i))
+    transSelector.setToolTip( "Choose a locator transformation matrix" )
+
+    self.locatorRecordCheckBox.append(qt.QCheckBox())
+    checkbox = self.locatorRecordCheckBox[i]
+    checkbox.checked = 0
+    checkbox.text = 'Record: '
+    checkbox.setToolTip("Activate locator")
+    checkbox.setLayoutDirection(1) # 1 =  QtCore.Qt.RightToLeft
+    checkbox.connect(qt.SIGNAL("clicked()"), partial(self.onLocatorRecording, i))
+
+    selectorLayout = qt.QHBoxLayout()
+    recordingLayout = qt.QHBoxLayout()
+    selectorLayout.addWidget(transSelector)
+    recordingLayout.addWidget(checkbox)
+    self.trajectoryIndexSpinBox.append(qt.QSpinBox())
+    self.trajectoryIndexSpinBoxLastValue.append(-1)
+    self.trajectoryIndexSpinBox[i].setValue(0)
+    self.trajectoryIndexSpinBox[i].setMinimum(0)
+    self.trajectoryIndexSpinBox[i].setSingleStep(1)
+    selectorLayout.addWidget(self.trajectoryIndexSpinBox[i])
+    self.trajectoryIndexSpinBox[i].valueChanged.connect(partial(self.onTrajectoyIndexChanged, i))
+    self.trajectoryStatusLabel.append(qt.QLabel())
+    self.trajectoryStatusLabel[i].setStyleSheet("color: darkorange")
+    self.trajectoryStatusLabel[i].setToolTip("The trajectory isn't reconstructed yet, it will be reconstructed when it is shown, \
+                                              replayed, edited or recorded again, or with the Reconstruct button")
+    selectorLayout.addWidget(self.trajectoryStatusLabel[i])
+
+    self.locatorReplayCheckBox.append(qt.QCheckBox())
+    checkbox = self.locatorReplayCheckBox[i]
+    checkbox.checked = 0
+    checkbox.text = 'Replay: '
+    checkbox.setToolTip("Replay locator")
+    checkbox.setLayoutDirection(1)  # 1 =  QtCore.Qt.RightToLeft
+    checkbox.connect(qt.SIGNAL("clicked()"), partial(self.onLocatorReplay, i))
+    recordingLayout.addWidget(checkbox)
+
+    self.locatorEditCheckBox.append(qt.QCheckBox())
+    checkbox = self.locatorEditCheckBox[i]
+    checkbox.checked = 0
+    checkbox.text = 'Edit: '
+    checkbox.setToolTip("Show the points of the reconstructed trajectory as markups that can be moved")
+    checkbox.setLayoutDirection(1)  # 1 =  QtCore.Qt.RightToLeft
+    checkbox.connect(qt.SIGNAL("clicked()"), partial(self.onTrajectoryEdit, i))
+    recordingLayout.addWidget(checkbox)
+
+    self.locatorRecontructButton.append(qt.QPushButton())
+    pushbutton = self.locatorRecontructButton[i]
+    pushbutton.setCheckable(False)
+    pushbutton.text = 'Reconstruct'
+    pushbutton.setToolTip("Generate the trajectory based on the tracked needle")
+    pushbutton.connect(qt.SIGNAL("clicked()"), partial(self.onConstructTrajectory, i))
+    recordingLayout.addWidget(pushbutton)
+
+    self.selectionFormLayout.addRow("Locator #%d:" % (i+1), selectorLayout)
+    self.selectionFormLayout.addRow("Locator #%d:" % (i+1), recordingLayout)
+
+  def getColor(self, index):
+    return self.colors[index % len(self.colors)]
+
+  def getChannelLocator(self, channelIndex):
+    """
+    :param channelIndex: index of the GUI channel
+    :return: LocatorRecord of the transform node selected in the channel, None if it isn't a registered locator
+    """
+    transformNode = self.transformSelector[channelIndex].currentNode()
+    if transformNode is None:
+      return None
+    return self.logic.registry.find(transformNode.GetID())
+
+  def initialize(self, loadedSequences = None):
     """
-    Initialize variables in the widget to be empty lists if either sequence node and sequence browser node are not provided \
-    When both sequence node and sequence browser node are provided, add the sequence ralated nodes and contruct the trajectories for all sequences.
-    :param sequenceNodesList:
-    :param sequenceBrowserNodesList:
+    Initialize the registry of locators and trajectories to be empty if no sequence is provided. \
+    When sequences are provided, register the locators of the scene, add the sequence ralated nodes and contruct the trajectories for all sequences.
+    With the deferred reconstruction, the trajectories are only marked as stale and reconstructed when they are needed.
+    :param loadedSequences: list of (locatorNode, sequenceNode, sequenceBrowserNode) in the order of the trajectories
     :return: None
     """
-    self.trajectoryFidicualsList = [[],[],[],[],[]]
-    self.trajectoryModelsList = [[],[],[],[],[]]
-    self.curveManagersList = [[],[],[],[],[]]
-    self.sequenceNodesList = [[],[],[],[],[]]
-    self.sequenceBrowserNodesList = [[],[],[],[],[]]
-    self.locatorNodeList = []
-    if (sequenceNodesList is not None) and (sequenceBrowserNodesList is not None):
+    self.onCancelReconstructAll()
+    self.closeStreamingSession()
+    for locatorIndex, trajectoryIndex in self.realTimeTrajectories:
+      self.stopLatencyMonitoring(self.logic.registry.trajectory(locatorIndex, trajectoryIndex))
+    self.logic.registry.clear()
+    self.realTimeTrajectories = []
+    self.realTimeTimer.stop()
+    self.logic.invalidateSequenceSamples()
+    if loadedSequences is not None:
       transformCollection = slicer.mrmlScene.GetNodesByClass("vtkMRMLLinearTransformNode")
       for index in range(transformCollection.GetNumberOfItems()):
         transformNode = transformCollection.GetItemAsObject(index)
         if transformNode.GetAttribute(self.REL_LOCATOR) is not None:
-          self.locatorNodeList.append(transformNode)
-      for locatorIndex in range(len(sequenceNodesList)):
-        for j in range(len(sequenceNodesList[locatorIndex])):
-          self.addSequenceRelatedNodesInList(locatorIndex, j, sequenceNodesList[locatorIndex][j], sequenceBrowserNodesList[locatorIndex][j])
-      for locatorIndex in range(len(sequenceNodesList)):
-        if len(sequenceNodesList[locatorIndex])>0:
-          self.onConstructTrajectory(self.locatorRecontructButton[locatorIndex])
-    if not self.sequenceBrowserNodesList[0] == []:
-      self.sequenceBrowserWidget.setActiveBrowserNode(self.sequenceBrowserNodesList[0][0])
+          self.logic.registry.addLocator(transformNode)
+      for locatorNode, sequenceNode, sequenceBrowserNode in loadedSequences:
+        locator = self.logic.registry.addLocator(locatorNode)
+        self.addSequenceRelatedNodesInList(locator.locatorIndex, len(locator.trajectories), sequenceNode, sequenceBrowserNode)
+      if self.deferredReconstruction:
+        for trajectory in self.logic.registry.trajectories():
+          self.setTrajectoryStale(trajectory, True)
+      else:
+        self.constructTrajectories(self.logic.registry.trajectories())
+    trajectories = self.logic.registry.trajectories()
+    if trajectories:
+      self.sequenceBrowserWidget.setActiveBrowserNode(trajectories[0].sequenceBrowserNode)
 
   def cleanup(self):
-    for i in range(self.nLocators):
-      if self.sequenceNodesList:
-        if not self.sequenceNodesList[i] == []:
-          numberOfSeq = len(self.sequenceNodesList[i])
-          for j in range (numberOfSeq):
-            if self.sequenceNodesList and self.sequenceNodesList[i][j]:
-              slicer.mrmlScene.RemoveNode(self.sequenceNodesList[i][j])
-            if self.sequenceBrowserNodesList and self.sequenceBrowserNodesList[i][j]:
-              slicer.mrmlScene.RemoveNode(self.sequenceBrowserNodesList[i][j])
-            if self.trajectoryFidicualsList and self.trajectoryFidicualsList[i][j]:
-              slicer.mrmlScene.RemoveNode(self.trajectoryFidicualsList[i][j])
-            if self.trajectoryModelsList and self.trajectoryModelsList[i][j]:
-              slicer.mrmlScene.RemoveNode(self.trajectoryModelsList[i][j])
-            if self.curveManagersList and self.curveManagersList[i][j]:
-              self.curveManagersList[i][j].clear()
-    del self.trajectoryFidicualsList[:]
-    del self.sequenceNodesList[:]
-    del self.sequenceBrowserNodesList[:]
-    del self.trajectoryModelsList[:]
-    del self.curveManagersList[:]
+    self.closeStreamingSession()
+    for trajectory in self.logic.registry.trajectories():
+      if trajectory.sequenceNode:
+        slicer.mrmlScene.RemoveNode(trajectory.sequenceNode)
+      if trajectory.sequenceBrowserNode:
+        slicer.mrmlScene.RemoveNode(trajectory.sequenceBrowserNode)
+      self.removeTrajectoryMarkups(trajectory)
+      if trajectory.modelNode:
+        slicer.mrmlScene.RemoveNode(trajectory.modelNode)
+    self.logic.registry.clear()
     slicer.mrmlScene.Clear(0)
     pass
 
@@ -351,78 +544,71 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     Load the saved tracked data from a directory
     :return: None
     """
-    startLocatorIndex = 0
     for file in os.listdir(self.importDirString):
       self.fileString = os.path.join(self.importDirString, file)
-      self.loadFromOneFile(startLocatorIndex)
-      startLocatorIndex = startLocatorIndex + 1
+      self.loadFromOneFile()
     pass
 
-  def loadFromOneFile(self, startLocatorIndex = 0):
+  def loadFromOneFile(self):
     """
-    Load the saved tracked data from one file
+    Load the saved tracked data from one file, a new locator is added for each locator of the file.
+    The whole file is parsed into arrays first, then the nodes of all the trajectories are created,
+    and finally the sequence nodes are filled with the scene in batch processing mode.
     :return: None
     """
     if os.path.isfile(self.fileString):
-      with open(self.fileString, 'rb') as csvfile:
-        fileReader = csv.reader(csvfile, delimiter=',',
-                                quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        rowIndex = 0
-        locatorIndexes = []
-        for row in fileReader:
-          numTrajectoryInRow = int(len(row) / self.elementPerLocator)
-          locatorIndex = startLocatorIndex
-          if rowIndex == 0:
-            locatorName = row[0]
-            transformNode = slicer.vtkMRMLLinearTransformNode()
-            slicer.mrmlScene.AddNode(transformNode)
-            self.transformSelector[locatorIndex].setCurrentNode(transformNode)
-            self.transformSelector[locatorIndex].currentNode().SetName(locatorName)
-            trajectoryIndex = 0
-            self.addSequenceRelatedNodesInList(locatorIndex, trajectoryIndex)
-            locatorIndexes.append(locatorIndex)
-            for index in range(1, numTrajectoryInRow):
-              if not locatorName == row[index * self.elementPerLocator]:
-                locatorIndex = locatorIndex + 1
-                locatorName = row[index * self.elementPerLocator]
-                transformNode = slicer.vtkMRMLLinearTransformNode()
-                slicer.mrmlScene.AddNode(transformNode)
-                self.transformSelector[locatorIndex].setCurrentNode(transformNode)
-                self.transformSelector[locatorIndex].currentNode().SetName(locatorName)
-                trajectoryIndex = 0
-              else:
-                trajectoryIndex = trajectoryIndex + 1  
-              locatorIndexes.append(locatorIndex)
-              self.addSequenceRelatedNodesInList(locatorIndex, trajectoryIndex)
-          if rowIndex >= 2:
-            # trajectoryIndexInLocator = -1
-            for trajectoryIndex in range(numTrajectoryInRow):
-              timeStamp = row[trajectoryIndex * self.elementPerLocator]
-              # trajectoryIndexInLocator = (trajectoryIndexInLocator + 1) if locatorIndex == locatorIndexes[trajectoryIndex] else 0
-              locatorIndex = locatorIndexes[trajectoryIndex]
-              if (not timeStamp == " ") and (not timeStamp == ""):
-                pos = [float(row[trajectoryIndex * self.elementPerLocator + 1]),
-                       float(row[trajectoryIndex * self.elementPerLocator + 2]),
-                       float(row[trajectoryIndex * self.elementPerLocator + 3])]
-                matrix = vtk.vtkMatrix4x4()
-                matrix.Identity()
-                matrix.SetElement(0, 3, pos[0])
-                matrix.SetElement(1, 3, pos[1])
-                matrix.SetElement(2, 3, pos[2])
-                transformNode = slicer.vtkMRMLLinearTransformNode()
-                transformNode.SetMatrixTransformToParent(matrix)
-                proxyNodeName = self.transformSelector[locatorIndex].currentNode().GetName()
-                transformNode.SetName(proxyNodeName)
-                subTrajectoryIndex = int(row[trajectoryIndex * self.elementPerLocator + 4])
-                if subTrajectoryIndex >= len(self.sequenceNodesList[locatorIndex]):
-                  self.addSequenceRelatedNodesInList(locatorIndex, subTrajectoryIndex)
-                seqNode = self.sequenceNodesList[locatorIndex][subTrajectoryIndex]
-                seqNode.SetDataNodeAtValue(transformNode, timeStamp)
-                seqNode.SetAttribute(self.REL_TRAJECTORYINDEX_SEQ, str(subTrajectoryIndex))
-          rowIndex = rowIndex + 1
+      trajectories = TrajectoryReconstructorLib.readTrackingFile(self.fileString)
+      loadedLocators = {}
+      for trajectory in trajectories:
+        if not trajectory.locatorIndex in loadedLocators:
+          transformNode = slicer.vtkMRMLLinearTransformNode()
+          transformNode.SetName(trajectory.locatorName)
+          slicer.mrmlScene.AddNode(transformNode)
+          self.onAddedTransNode(transformNode)
+          locator = self.logic.registry.find(transformNode.GetID())
+          if locator.locatorIndex < self.nLocators:
+            self.transformSelector[locator.locatorIndex].setCurrentNode(transformNode)
+          loadedLocators[trajectory.locatorIndex] = locator
+        locator = loadedLocators[trajectory.locatorIndex]
+        while len(locator.trajectories) <= trajectory.trajectoryIndex:
+          self.addSequenceRelatedNodesInList(locator.locatorIndex, len(locator.trajectories))
+      slicer.mrmlScene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+      try:
+        for trajectory in trajectories:
+          locator = loadedLocators[trajectory.locatorIndex]
+          seqNode = locator.trajectories[trajectory.trajectoryIndex].sequenceNode
+          proxyNodeName = locator.locatorNode.GetName()
+          self.fillSequenceNode(seqNode, trajectory.timeStamps, trajectory.positions, proxyNodeName)
+          seqNode.SetAttribute(self.REL_TRAJECTORYINDEX_SEQ, str(trajectory.trajectoryIndex))
+          self.logic.setSequenceSamples(seqNode, trajectory.timeStamps, trajectory.positions)
+      finally:
+        slicer.mrmlScene.EndState(slicer.vtkMRMLScene.BatchProcessState)
     else:
       slicer.util.warningDisplay("file doesn't exists!")
 
+  def fillSequenceNode(self, seqNode, timeStamps, positions, proxyNodeName):
+    """
+    Add tracked samples to a sequence node. The sequence node copies the data node it receives,
+    so a single scratch transform node is used for all the samples, and the modified events of the
+    sequence node are only invoked once at the end.
+    :param seqNode: Sequence node where the poses are stored.
+    :param timeStamps: (N,) float array
+    :param positions: (N, 3) float array
+    :param proxyNodeName: name of the stored transform nodes
+    :return: None
+    """
+    transformNode = slicer.vtkMRMLLinearTransformNode()
+    transformNode.SetName(proxyNodeName)
+    matrix = vtk.vtkMatrix4x4()
+    wasModified = seqNode.StartModify()
+    for timeStamp, pos in zip(timeStamps.tolist(), positions.tolist()):
+      matrix.SetElement(0, 3, pos[0])
+      matrix.SetElement(1, 3, pos[1])
+      matrix.SetElement(2, 3, pos[2])
+      transformNode.SetMatrixTransformToParent(matrix)
+      seqNode.SetDataNodeAtValue(transformNode, repr(timeStamp))
+    seqNode.EndModify(wasModified)
+
   def onSavingSeperateChannel(self):
     """
     Change the layout of the Export/Import section in the GUI
@@ -432,61 +618,88 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
       self.fileNameEditor.visible = False
       self.exportLayout.addWidget(self.saveButton)
       self.exportImportFormLayout = qt.QFormLayout(self.exportImportCollapsibleButton)
+      self.exportImportFormLayout.addRow("Export format: ", self.exportFormatComboBox)
       self.exportImportFormLayout.addRow("Export to directory: ", self.exportLayout)
       self.exportImportFormLayout.addRow("Import Directory: ", self.importLayout)
+      self.exportImportFormLayout.addRow("Stream While Recording: ", self.streamingCheckBox)
     else :
       self.fileNameEditor.visible = True
       self.saveFileLayout.addWidget(self.saveButton)
       self.exportImportFormLayout = qt.QFormLayout(self.exportImportCollapsibleButton)
+      self.exportImportFormLayout.addRow("Export format: ", self.exportFormatComboBox)
       self.exportImportFormLayout.addRow("Export to directory: ", self.exportLayout)
       self.exportImportFormLayout.addRow("Export File name: ", self.saveFileLayout)
       self.exportImportFormLayout.addRow("Import File name: ", self.importLayout)
+      self.exportImportFormLayout.addRow("Stream While Recording: ", self.streamingCheckBox)
 
   def saveFile(self):
     """
     Export the tracked data
     :return: None
     """
-    if self.savingSeperateChannelCheckBox.checked == False:
+    if self.exportFormatComboBox.currentIndex == 1:
+      self.saveInBinaryFiles()
+    elif self.savingSeperateChannelCheckBox.checked == False:
       self.saveInOneFile()
     else:
       self.saveInDifferentFiles()
     pass
 
-  def appendValidPos(self, seqNode, posIndex, poses, removeRedundance = True):
+  def getSequenceSamples(self, seqNode):
     """
-    Append valid pos from the sequence node to the list 'poses' if the pos specified by 'row' in the sequence node is not the same as previous pos
+    Read the time stamps and positions stored in a sequence node
     :param seqNode: Sequence node where the poses are stored.
-    :param posIndex: index of the position in the sequence node
-    :param poses: to which the valid position will append
-    :param removeRedundance: flag indicate if redundancy should be moved or not.
-    :return: Return True if the evaluated pos at the specified index is valid and added to the poses
-    """
-    posValid = True
-    transformNode = seqNode.GetNthDataNode(posIndex)
-    transMatrix = vtk.vtkMatrix4x4()
-    transformNode.GetMatrixTransformToParent(transMatrix)
-    pos = [transMatrix.GetElement(0, 3), transMatrix.GetElement(1, 3), transMatrix.GetElement(2, 3)]
-    timeStamp = float(seqNode.GetNthIndexValue(posIndex))
-    if removeRedundance:
-      if posIndex > 0:
-        transformNode_pre = seqNode.GetNthDataNode(posIndex - 1)
-        transMatrix_pre = transformNode_pre.GetMatrixTransformToParent()
-        pos_pre = [transMatrix_pre.GetElement(0, 3), transMatrix_pre.GetElement(1, 3),
-                   transMatrix_pre.GetElement(2, 3)]
-        if numpy.linalg.norm(numpy.array(pos) - numpy.array(pos_pre)) < 1e-8:
-          posValid = False
-        else:
-          posValid = True
-    if posValid:
-      poses.append(timeStamp)
-      poses.append(pos[0])
-      poses.append(pos[1])
-      poses.append(pos[2])
-      poses.append(seqNode.GetAttribute(self.REL_TRAJECTORYINDEX_SEQ))
-      poses.append(" ")
-      return True
-    return False
+    :return: (timeStamps, positions), (N,) and (N, 3) float arrays
+    """
+    samples = self.logic.updateSequenceSamples(seqNode)
+    return samples.timeStamps(), samples.positions()
+
+  def getExportedLocatorIndexes(self):
+    """
+    :return: indexes of the registered locators that have sequence nodes
+    """
+    return [locator.locatorIndex for locator in self.logic.registry.locators if locator.trajectories]
+
+  def getTrackedTrajectories(self, locatorIndexes):
+    """
+    Collect the tracked data of the given locators for export. The locators are renumbered from 0 in the given order.
+    :param locatorIndexes: indexes of the registered locators
+    :return: list of TrackedTrajectory
+    """
+    trajectories = []
+    for fileLocatorIndex, i in enumerate(locatorIndexes):
+      locator = self.logic.registry.locator(i)
+      for trajectory in locator.trajectories:
+        seqNode = trajectory.sequenceNode
+        if seqNode.GetNumberOfDataNodes():
+          timeStamps, positions = self.getSequenceSamples(seqNode)
+          if self.removeDuplicatePosCheckBox.checked:
+            timeStamps, positions = TrajectoryReconstructorLib.removeDuplicatedPositions(timeStamps, positions)
+          trajectories.append(TrajectoryReconstructorLib.TrackedTrajectory(
+            fileLocatorIndex, locator.locatorNode.GetName(), seqNode.GetName(),
+            int(seqNode.GetAttribute(self.REL_TRAJECTORYINDEX_SEQ)), timeStamps, positions))
+    return trajectories
+
+  def saveInBinaryFiles(self):
+    """
+    Save the tracked data in the binary recording format, either all the locators in one file,
+    or one file for each locator when the SeperateFiles check box is checked.
+    :return:None
+    """
+    if os.path.exists(self.exportDirString):
+      fileExtension = TrajectoryReconstructorLib.trackingbinary.FILE_EXTENSION
+      validLocatorIndex = self.getExportedLocatorIndexes()
+      if self.savingSeperateChannelCheckBox.checked == True:
+        for i in validLocatorIndex:
+          fileName = os.path.join(self.exportDirString, self.logic.registry.locator(i).locatorNode.GetName() + fileExtension)
+          TrajectoryReconstructorLib.writeTrackingRecording(fileName, self.getTrackedTrajectories([i]))
+      else:
+        fileName = os.path.join(self.exportDirString, self.fileNameEditor.text)
+        if not os.path.splitext(fileName)[1]:
+          fileName = fileName + fileExtension
+        TrajectoryReconstructorLib.writeTrackingRecording(fileName, self.getTrackedTrajectories(validLocatorIndex))
+    else:
+      slicer.util.warningDisplay("Path doesn't exists!")
 
   def saveInDifferentFiles(self):
     """
@@ -501,36 +714,11 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     :return:None
     """
     if os.path.exists(self.exportDirString):
-      for i in range(len(self.locatorNodeList)):
-        if self.locatorNodeList[i] and (not self.sequenceNodesList[i] == []):
-          locatorName = self.locatorNodeList[i].GetName()
-          fileName = os.path.join(self.exportDirString, locatorName)
-          with open(fileName, 'wb') as csvfile:
-            fileWriter = csv.writer(csvfile, delimiter=',',
-                                    quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            header = []
-            title = []
-            header.append(self.locatorNodeList[i].GetName())
-            header.append(" ")
-            header.append(" ")
-            header.append(" ")
-            header.append(" ")
-            header.append(" ")
-            title.append("TimeStamp")
-            title.append("X")
-            title.append("Y")
-            title.append("Z")
-            title.append("TrajectoryIndex")
-            title.append(" ")
-            fileWriter.writerow(header)
-            fileWriter.writerow(title)
-            for j in range(len(self.sequenceNodesList[i])):
-              seqNode = self.sequenceNodesList[i][j]
-              for row in range(seqNode.GetNumberOfDataNodes()):
-                seqNode = self.sequenceNodesList[i][j]
-                poses = []
-                if self.appendValidPos(seqNode, row, poses, self.removeDuplicatePosCheckBox.checked):
-                  fileWriter.writerow(poses)
+      for i in self.getExportedLocatorIndexes():
+        fileName = os.path.join(self.exportDirString, self.logic.registry.locator(i).locatorNode.GetName())
+        trajectories = self.getTrackedTrajectories([i])
+        if trajectories:
+          TrajectoryReconstructorLib.writeTrackingCSV(fileName, trajectories, concatenate = True)
     else:
       slicer.util.warningDisplay("Path doesn't exists!")
 
@@ -546,71 +734,8 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     """
     if os.path.exists(self.exportDirString):
       fileName = os.path.join(self.exportDirString, self.fileNameEditor.text)
-      with open(fileName, 'wb') as csvfile:
-        fileWriter = csv.writer(csvfile, delimiter=',',
-                                quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        header = []
-        title = []
-        validLocatorIndex = []
-        for i in range(self.nLocators):
-          if not self.sequenceNodesList[i] == []:
-            validLocatorIndex.append(i)
-            for j in range(len(self.sequenceNodesList[i])):
-              seqNode = self.sequenceNodesList[i][j]
-              if seqNode.GetNumberOfDataNodes() and self.locatorNodeList[i]:
-                header.append(self.locatorNodeList[i].GetName())
-                header.append(seqNode.GetName())
-                header.append(" ")
-                header.append(" ")
-                header.append(" ")
-                header.append(" ")
-                title.append("TimeStamp")
-                title.append("X")
-                title.append("Y")
-                title.append("Z")
-                title.append("TrajectoryIndex")
-                title.append(" ")
-        fileWriter.writerow(header)
-        fileWriter.writerow(title)
-        maxRowNum = 0
-        rowIndexes = []
-        for i in validLocatorIndex:
-          number = []
-          if not self.sequenceNodesList[i] == []:
-            for j in range(len(self.sequenceNodesList[i])):
-              seqNode = self.sequenceNodesList[i][j]
-              if seqNode.GetNumberOfDataNodes()> maxRowNum:
-                maxRowNum = seqNode.GetNumberOfDataNodes()
-              number.append(0)
-            rowIndexes.append(number)
-        for row in range(maxRowNum):
-          poses = []
-          for i in validLocatorIndex:
-            if not self.sequenceNodesList[i] == []:
-              for j in range(len(self.sequenceNodesList[i])):
-                seqNode = self.sequenceNodesList[i][j]
-                if rowIndexes[i][j] < seqNode.GetNumberOfDataNodes():
-                  while True:
-                    if self.appendValidPos(seqNode, rowIndexes[i][j], poses, self.removeDuplicatePosCheckBox.checked):
-                      break
-                    rowIndexes[i][j] = rowIndexes[i][j] + 1
-                    if rowIndexes[i][j] >= seqNode.GetNumberOfDataNodes():
-                      poses.append(" ")
-                      poses.append(" ")
-                      poses.append(" ")
-                      poses.append(" ")
-                      poses.append(" ")
-                      poses.append(" ")
-                      break
-                else:
-                  poses.append(" ")
-                  poses.append(" ")
-                  poses.append(" ")
-                  poses.append(" ")
-                  poses.append(" ")
-                  poses.append(" ")
-                rowIndexes[i][j] = rowIndexes[i][j] + 1
-          fileWriter.writerow(poses)
+      validLocatorIndex = self.getExportedLocatorIndexes()
+      TrajectoryReconstructorLib.writeTrackingCSV(fileName, self.getTrackedTrajectories(validLocatorIndex))
     else:
       slicer.util.warningDisplay("Path doesn't exists!")
 
@@ -633,17 +758,28 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     :return:
     """
     print("study loaded")
-    sequenceNodesList = [[],[],[],[],[]]
-    sequenceBrowserNodesList = [[],[],[],[],[]]
+    locatorNodes = []
+    transformCollection = slicer.mrmlScene.GetNodesByClass("vtkMRMLLinearTransformNode")
+    for index in range(transformCollection.GetNumberOfItems()):
+      transformNode = transformCollection.GetItemAsObject(index)
+      if transformNode.GetAttribute(self.REL_LOCATOR) is not None:
+        locatorNodes.append(transformNode)
+    loadedSequences = []
     sequenceBrowserNodesCollection = slicer.mrmlScene.GetNodesByClass("vtkMRMLSequenceBrowserNode")
     for index in range(sequenceBrowserNodesCollection.GetNumberOfItems()):
       sequenceBrowserNode = sequenceBrowserNodesCollection.GetItemAsObject(index)
       sequenceNodeID = sequenceBrowserNode.GetAttribute(self.REL_SEQNODE)
       if slicer.mrmlScene.GetNodeByID(sequenceNodeID):
         seqNode = slicer.mrmlScene.GetNodeByID(sequenceNodeID)
-        locatorIndex = int(seqNode.GetAttribute(self.REL_LOCATORINDEX_SEQ)[-1])
-        sequenceNodesList[locatorIndex].append(seqNode)
-        sequenceBrowserNodesList[locatorIndex].append(sequenceBrowserNode)
+        locatorNode = slicer.mrmlScene.GetNodeByID(seqNode.GetAttribute(self.REL_LOCATORNODE_SEQ)) \
+          if seqNode.GetAttribute(self.REL_LOCATORNODE_SEQ) else None
+        if locatorNode is None:
+          # scenes saved by older versions only have the index of the locator, "Locator <index>"
+          locatorIndex = int(seqNode.GetAttribute(self.REL_LOCATORINDEX_SEQ).split()[-1])
+          if locatorIndex < len(locatorNodes):
+            locatorNode = locatorNodes[locatorIndex]
+        if locatorNode is not None:
+          loadedSequences.append((locatorNode, seqNode, sequenceBrowserNode))
     # We clear all the markups and model from the loaded mrmlScene to reduce complexity.
     # The markups and model for curve maker will be generated in the self.initialization function.
     markupsNodesCollection = slicer.mrmlScene.GetNodesByClass("vtkMRMLMarkupsFiducialNode")
@@ -657,7 +793,7 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
       if modelNode.GetAttribute('vtkMRMLModelNode.rel_needleModel') is None:  # we don't delete related locator model
         slicer.mrmlScene.RemoveNode(modelNode.GetDisplayNode())
         slicer.mrmlScene.RemoveNode(modelNode) 
-    self.initialize(sequenceNodesList, sequenceBrowserNodesList)
+    self.initialize(loadedSequences)
     for i in range(self.nLocators):
       self.transformSelector[i].setCurrentNode(None)
 
@@ -671,7 +807,7 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
     tnode = self.transformSelector[activeIndex].currentNode()
     if tnode:
       self.transformSelector[activeIndex].setEnabled(not active)
-      self.logic.addLocator(tnode, self.colors[activeIndex])
+      self.logic.addLocator(tnode, self.getColor(activeIndex))
       mnodeID = tnode.GetAttribute('Locator')
       if mnodeID != None:
         if active:
@@ -696,31 +832,56 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
   def onDownSampleStepSizeChanged(self, value):
     self.downSampleStepSize = self.downSampleStepSizeSpinBox.value
 
-  def onTrajectoyIndexChanged(self, spinbox, value):
+  def onSimplificationToleranceChanged(self, value):
+    self.simplificationTolerance = self.simplificationToleranceSpinBox.value
+
+  def onMaxNumOfDisplayedPointsChanged(self, value):
+    self.maxNumOfDisplayedPoints = self.maxNumOfDisplayedPointsSpinBox.value
+
+  def onDeferredReconstructionChanged(self):
+    self.deferredReconstruction = self.deferredReconstructionCheckBox.checked
+    qt.QSettings().setValue("TrajectoryReconstructor/DeferredReconstruction",
+                            "true" if self.deferredReconstruction else "false")
+
+  def onCacheSettingsChanged(self, value = None):
+    self.cacheEnabled = self.cacheEnabledCheckBox.checked
+    self.cacheDirectory = self.cacheDirectoryEdit.currentPath
+    self.cacheMaxSize = self.cacheMaxSizeSpinBox.value
+    settings = qt.QSettings()
+    settings.setValue("TrajectoryReconstructor/CacheEnabled", "true" if self.cacheEnabled else "false")
+    settings.setValue("TrajectoryReconstructor/CacheDirectory", self.cacheDirectory)
+    settings.setValue("TrajectoryReconstructor/CacheMaxSize", self.cacheMaxSize)
+    self.updateReconstructionCache()
+
+  def updateReconstructionCache(self):
+    if self.cacheEnabled:
+      self.logic.setReconstructionCacheDirectory(self.cacheDirectory, self.cacheMaxSize * 1024 * 1024)
+    else:
+      self.logic.setReconstructionCacheDirectory(None)
+
+  def onRealTimeUpdateRateChanged(self, value):
+    self.realTimeUpdateRate = self.realTimeUpdateRateSpinBox.value
+    self.realTimeTimer.setInterval(int(1000 / self.realTimeUpdateRate))
+
+  def onTrajectoyIndexChanged(self, channelIndex, value):
     """
     Response to the spinbox value change. new sequence nodes and sequence browser nodes will be created if the spinbox value is larger than the number of available sequence nodes.
     The tracked data of the specific locator will be recorded
-    :param spinbox: The spinbox that triggers the signal.
+    :param channelIndex: The index of the channel of the spinbox that triggers the signal.
     :param value: value in the spinbox
     :return:
     """
-    channelIndex = 0
-    for i in range(self.nLocators):
-      if self.trajectoryIndexSpinBox[i] == spinbox:
-        channelIndex = i
-        break
-    locatorIndex = -1
-    for i in range(len(self.locatorNodeList)):
-      if self.transformSelector[channelIndex].currentNode() == self.locatorNodeList[i]:
-        locatorIndex = i    
-        break
-    numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
+    locator = self.getChannelLocator(channelIndex)
+    if locator is None:
+      self.trajectoryIndexSpinBoxLastValue[channelIndex] = value
+      return
+    locatorIndex = locator.locatorIndex
+    numOfSequenceNode = len(locator.trajectories)
     if self.locatorRecordCheckBox[channelIndex].checked == True:
       self.disableSpecificLocatorRecording(locatorIndex)
-      if numOfSequenceNode < (value+1):
-        while numOfSequenceNode < (value+1):
-          self.addSequenceRelatedNodesInList(locatorIndex, numOfSequenceNode)
-          numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
+      while len(locator.trajectories) < (value+1):
+        self.addSequenceRelatedNodesInList(locatorIndex, len(locator.trajectories))
+      numOfSequenceNode = len(locator.trajectories)
       self.enableSpecificTrajectoryRecording(locatorIndex, value)
     if self.locatorReplayCheckBox[channelIndex].checked == True:
       if self.trajectoryIndexSpinBoxLastValue[channelIndex] >=0 and self.trajectoryIndexSpinBoxLastValue[channelIndex] < numOfSequenceNode:
@@ -728,95 +889,212 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
       if self.trajectoryIndexSpinBox[channelIndex].value < numOfSequenceNode:
         self.enableSpecificTrajectoryReplay(locatorIndex, self.trajectoryIndexSpinBox[channelIndex].value)
     self.trajectoryIndexSpinBoxLastValue[channelIndex] = value
+    self.updateChannelStatus(channelIndex)
     
   def addSequenceRelatedNodesInList(self, locatorIndex, trajectoryIndex, sequenceNode = None, sequenceBrowserNode = None):
     """
-    Markups fiducial will be added for storing the filted locator trajectory.
-    Model node will be added for visualization of the trajectory.
+    Add a trajectory at the end of the trajectories of a locator in the registry.
+    Model node will be added for visualization of the trajectory, the markups fiducial for editing it is only
+    created on request, see createTrajectoryMarkups.
     :param sequenceNode: Sequence node stores the tracked data
     :param sequenceBrowserNode: Sequence browser node record or replay the tracked data
     :param locatorIndex: The index of the locator that needs to be recorded
+    :param trajectoryIndex: The index of the new trajectory, which is the number of trajectories of the locator
     :return: None
     """
+    locator = self.logic.registry.locator(locatorIndex)
+    trajectory = self.logic.registry.addTrajectory(locator)
     if sequenceNode == None or sequenceBrowserNode == None:
       sequenceNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLSequenceNode")
       slicer.mrmlScene.AddNode(sequenceNode)
       sequenceBrowserNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLSequenceBrowserNode")
       slicer.mrmlScene.AddNode(sequenceBrowserNode)
-    sequenceNode.SetAttribute(self.REL_LOCATORINDEX_SEQ, "Locator " + str(trajectoryIndex))
-    sequenceNode.SetAttribute(self.REL_TRAJECTORYINDEX_SEQ, str(trajectoryIndex))
-    if not sequenceNode.GetName()[-9:] == ("-Locator " + str(locatorIndex)):
+    sequenceNode.SetAttribute(self.REL_LOCATORINDEX_SEQ, "Locator " + str(locatorIndex))
+    sequenceNode.SetAttribute(self.REL_LOCATORNODE_SEQ, locator.locatorNode.GetID())
+    sequenceNode.SetAttribute(self.REL_TRAJECTORYINDEX_SEQ, str(trajectory.trajectoryIndex))
+    if not sequenceNode.GetName().endswith("-Locator " + str(locatorIndex)):
       sequenceNode.SetName(sequenceNode.GetName() + "-Locator " + str(locatorIndex))
-    self.sequenceNodesList[locatorIndex].append(sequenceNode)
-    self.sequenceBrowserNodesList[locatorIndex].append(sequenceBrowserNode)
-    self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex].SetAttribute(self.REL_SEQNODE,
-                                                                              self.sequenceNodesList[locatorIndex][
-                                                                                trajectoryIndex].GetID())
-    self.sequenceBrowserWidget.setActiveBrowserNode(self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex])
-    self.sequenceNodeComboBox.setCurrentNode(self.sequenceNodesList[locatorIndex][trajectoryIndex])
+    trajectory.sequenceNode = sequenceNode
+    trajectory.sequenceBrowserNode = sequenceBrowserNode
+    sequenceBrowserNode.SetAttribute(self.REL_SEQNODE, sequenceNode.GetID())
+    self.sequenceBrowserWidget.setActiveBrowserNode(sequenceBrowserNode)
+    self.sequenceNodeComboBox.setCurrentNode(sequenceNode)
     self.addSequenceNodeButton.click()
     self.recordingSamplingSetting.setCurrentIndex(0)
-    fiducialNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLMarkupsFiducialNode")
-    fiducialNode.SetAttribute(self.REL_LOCATORINDEX_FIDUCIAL, "Locator " + str(locatorIndex))
-    self.trajectoryFidicualsList[locatorIndex].append(fiducialNode)
-    fiducialNode.SetLocked(True)
-    slicer.mrmlScene.AddNode(fiducialNode)
     modelNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLModelNode")
     modelNode.SetAttribute(self.REL_LOCATORINDEX_MODEL, "Locator " + str(locatorIndex))
-    self.trajectoryModelsList[locatorIndex].append(modelNode)
+    trajectory.modelNode = modelNode
     slicer.mrmlScene.AddNode(modelNode)
-    fiducialNode.SetAttribute('CurveMaker.CurveModel', modelNode.GetID())
         
     modelNode.CreateDefaultDisplayNodes()
     modelNode.GetDisplayNode().SetOpacity(0.5)
-    modelNode.GetDisplayNode().SetColor(self.colors[locatorIndex])
+    modelNode.GetDisplayNode().SetColor(self.getColor(locatorIndex))
     
-    self.curveManagersList[locatorIndex].append(self.logic.createNeedleTrajBasedOnCurveMaker("Traj"))
+    trajectory.resampler = StreamingResampler(self.movementThreshold, self.downSampleStepSize)
+    trajectory.tube = TubeBuilder(self.tubeRadius)
+    for node in [sequenceNode, sequenceBrowserNode, modelNode]:
+      self.logic.registry.register(node.GetID(), trajectory)
 
-    self.curveManagersList[locatorIndex][trajectoryIndex].connectMarkerNode(self.trajectoryFidicualsList[locatorIndex][trajectoryIndex])
-    self.curveManagersList[locatorIndex][trajectoryIndex].connectModelNode(self.trajectoryModelsList[locatorIndex][trajectoryIndex])
-    self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.enableAutomaticUpdate(1)
-    self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.setInterpolationMethod('cardinal')
-    
-    # here we add initial point for the kalman filter. As the pCov is set to 1.0, the first tracked point will be added to trajectory.
-    self.logic.filteredData[locatorIndex].append(numpy.zeros((0,0,3))) # numpy.insert(self.logic.filteredData[locatorIndex][trajectoryIndex], [0], pos, axis=0)
-    self.logic.pCov[locatorIndex].append(1.0)
+  def createTrajectoryMarkups(self, trajectory):
+    """
+    Create the markups fiducial of a trajectory and connect it to CurveMaker, which updates the model
+    when the fiducials are moved.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    if trajectory.fiducialNode:
+      return
+    fiducialNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLMarkupsFiducialNode")
+    fiducialNode.SetAttribute(self.REL_LOCATORINDEX_FIDUCIAL, "Locator " + str(trajectory.locatorIndex))
+    trajectory.fiducialNode = fiducialNode
+    slicer.mrmlScene.AddNode(fiducialNode)
+    fiducialNode.SetAttribute('CurveMaker.CurveModel', trajectory.modelNode.GetID())
+    self.logic.registry.register(fiducialNode.GetID(), trajectory)
+
+    trajectory.curveManager = self.logic.createNeedleTrajBasedOnCurveMaker("Traj")
+    trajectory.curveManager.connectMarkerNode(fiducialNode)
+    trajectory.curveManager.connectModelNode(trajectory.modelNode)
+    trajectory.curveManager.cmLogic.enableAutomaticUpdate(1)
+    trajectory.curveManager.cmLogic.setInterpolationMethod('cardinal')
+
+  def removeTrajectoryMarkups(self, trajectory):
+    """
+    Disconnect the markups fiducial of a trajectory from CurveMaker and remove it, the model node is kept.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    if trajectory.fiducialNode:
+      trajectory.curveManager.cmLogic.setSourceNodeObserver(trajectory.fiducialNode, False)
+      slicer.mrmlScene.RemoveNode(trajectory.fiducialNode.GetDisplayNode())
+      slicer.mrmlScene.RemoveNode(trajectory.fiducialNode)
+    trajectory.fiducialNode = None
+    trajectory.curveManager = None
+
+  def setTrajectoryMarkups(self, trajectory):
+    """
+    Replace the fiducials of a trajectory with its points, the markups events are only invoked once.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    fiducialNode = trajectory.fiducialNode
+    wasModified = fiducialNode.StartModify()
+    fiducialNode.RemoveAllMarkups()
+    for index, pos in enumerate(self.getDisplayedPoints(trajectory)):
+      fiducialNode.AddFiducialFromArray(pos)
+      fiducialNode.SetNthFiducialLabel(index, "")
+    fiducialNode.EndModify(wasModified)
+
+  def getTrajectoryMarkupsPoints(self, trajectory):
+    """
+    :param trajectory: TrajectoryRecord
+    :return: (N, 3) float array of the positions of the fiducials of the trajectory
+    """
+    fiducialNode = trajectory.fiducialNode
+    points = numpy.zeros((fiducialNode.GetNumberOfFiducials(), 3))
+    pos = [0.0, 0.0, 0.0]
+    for index in range(len(points)):
+      fiducialNode.GetNthFiducialPosition(index, pos)
+      points[index] = pos
+    return points
+
+  def onTrajectoryEdit(self, channelIndex):
+    """
+    Show the points of the trajectory selected in a channel as markups that can be moved, the model then follows
+    the markups through CurveMaker. When the edition is finished, the moved points are kept and the markups removed.
+    :param channelIndex: The index of the channel of the checkbox that triggers the signal.
+    :return: None
+    """
+    locator = self.getChannelLocator(channelIndex)
+    trajectoryIndex = self.trajectoryIndexSpinBox[channelIndex].value
+    checkbox = self.locatorEditCheckBox[channelIndex]
+    if locator is None or trajectoryIndex >= len(locator.trajectories):
+      checkbox.setChecked(False)
+      return
+    trajectory = locator.trajectories[trajectoryIndex]
+    if checkbox.checked == True:
+      self.ensureTrajectoryReconstructed(trajectory)
+      trajectory.editing = True
+      self.createTrajectoryMarkups(trajectory)
+      self.setTrajectoryMarkups(trajectory)
+      trajectory.fiducialNode.SetLocked(False)
+      trajectory.curveManager.unlockLine()
+      if trajectory.fiducialNode.GetNumberOfFiducials()>1:
+        trajectory.curveManager.cmLogic.updateCurve()
+    elif trajectory.editing:
+      trajectory.editing = False
+      trajectory.points.setData(self.getTrajectoryMarkupsPoints(trajectory))
+      self.removeTrajectoryMarkups(trajectory)
+      self.updateTrajectoryModel(trajectory)
+
+  def setTrajectoryStale(self, trajectory, stale):
+    """
+    Mark a trajectory as reconstructed or not. A stale trajectory is hidden, and it is reconstructed as soon as its
+    model is shown.
+    :param trajectory: TrajectoryRecord
+    :param stale: True if the trajectory isn't reconstructed
+    :return: None
+    """
+    trajectory.stale = stale
+    if stale:
+      trajectory.modelNode.SetAttribute(self.STALE_MODEL, "True")
+    else:
+      trajectory.modelNode.RemoveAttribute(self.STALE_MODEL)
+    displayNode = trajectory.modelNode.GetDisplayNode()
+    if stale:
+      trajectory.modelNode.SetDisplayVisibility(False)
+      if trajectory.staleObserverTag is None and displayNode:
+        trajectory.staleObserverTag = displayNode.AddObserver(vtk.vtkCommand.ModifiedEvent,
+                                                              partial(self.onStaleModelDisplayModified, trajectory))
+    elif trajectory.staleObserverTag is not None:
+      if displayNode:
+        displayNode.RemoveObserver(trajectory.staleObserverTag)
+      trajectory.staleObserverTag = None
+    self.updateChannelStatus()
+
+  def onStaleModelDisplayModified(self, trajectory, caller, event):
+    if trajectory.stale and caller.GetVisibility():
+      self.ensureTrajectoryReconstructed(trajectory)
+
+  def ensureTrajectoryReconstructed(self, trajectory):
+    """
+    Reconstruct a trajectory if it is stale
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    if trajectory.stale:
+      self.constructTrajectories([trajectory])
+
+  def updateChannelStatus(self, channelIndex = None, node = None):
+    """
+    Show whether the trajectory selected in a channel is stale.
+    :param channelIndex: index of the channel, all the channels are updated if None
+    :return: None
+    """
+    channelIndexes = range(len(self.trajectoryStatusLabel)) if channelIndex is None else [channelIndex]
+    for index in channelIndexes:
+      locator = self.getChannelLocator(index)
+      trajectoryIndex = self.trajectoryIndexSpinBox[index].value
+      stale = locator is not None and trajectoryIndex < len(locator.trajectories) and \
+              locator.trajectories[trajectoryIndex].stale
+      self.trajectoryStatusLabel[index].setText("Stale" if stale else "")
 
   def onAddedTransNode(self, addedNode):
     """
-    Adding the user added transformation node into the locatorNodeList
+    Adding the user added transformation node into the registry of locators
     :param addedNode: Added node from GUI interaction
     :return: None
     """
     addedNode.SetAttribute(self.REL_LOCATOR, "True")
-    if not self.locatorNodeList == []:
-      addedBefore = False
-      for i in range(len(self.locatorNodeList)):
-        if addedNode == self.locatorNodeList[i]:
-          addedBefore = True
-          break
-      if addedBefore == False:
-        self.locatorNodeList.append(addedNode)
-    else:
-      self.locatorNodeList.append(addedNode)
+    self.logic.registry.addLocator(addedNode)
 
-  def onLocatorRecording(self, checkbox):
-    channelIndex = 0
-    for i in range(self.nLocators):
-      if self.locatorRecordCheckBox[i] == checkbox:
-        channelIndex = i
-    locatorIndex = -1
-    for i in range(len(self.locatorNodeList)):
-      if self.transformSelector[channelIndex].currentNode() == self.locatorNodeList[i]:
-        locatorIndex = i    
-        break    
+  def onLocatorRecording(self, channelIndex):
+    locator = self.getChannelLocator(channelIndex)
+    checkbox = self.locatorRecordCheckBox[channelIndex]
     trajectoryIndex = self.trajectoryIndexSpinBox[channelIndex].value
-    numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
-    if (trajectoryIndex + 1) > numOfSequenceNode:
-      while numOfSequenceNode < (trajectoryIndex + 1):
-        self.addSequenceRelatedNodesInList(locatorIndex, numOfSequenceNode)
-        numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
-    if trajectoryIndex > -1 and locatorIndex > -1:
+    if trajectoryIndex > -1 and locator is not None:
+      locatorIndex = locator.locatorIndex
+      while len(locator.trajectories) < (trajectoryIndex + 1):
+        self.addSequenceRelatedNodesInList(locatorIndex, len(locator.trajectories))
       if checkbox.checked == True:
         if self.locatorReplayCheckBox[channelIndex].checked:
           self.locatorReplayCheckBox[channelIndex].click()
@@ -825,52 +1103,156 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
       else:
         self.enableCurrentLocator(channelIndex, False)
         self.disableSpecificLocatorRecording(locatorIndex)
+        if not any(recordCheckBox.checked for recordCheckBox in self.locatorRecordCheckBox):
+          self.closeStreamingSession()
 
   def enableSpecificTrajectoryRecording(self, locatorIndex, trajectoryIndex):
-      trackedNode = self.locatorNodeList[locatorIndex]
-      self.sequenceBrowserWidget.setActiveBrowserNode(self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex])
-      self.sequenceNodeCellWidget.cellWidget(0, 1).setCurrentNode(trackedNode)
+      trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+      self.sequenceBrowserWidget.setActiveBrowserNode(trajectory.sequenceBrowserNode)
+      self.sequenceNodeCellWidget.cellWidget(0, 1).setCurrentNode(trajectory.locator.locatorNode)
       self.sequenceNodeCellWidget.cellWidget(0, 3).setChecked(True)
       if self.realTimeReconstructCheckBox.checked:
-        self.sequenceNodesList[locatorIndex][trajectoryIndex].RemoveObserver(vtk.vtkCommand.ModifiedEvent)
-        self.sequenceNodesList[locatorIndex][trajectoryIndex].AddObserver(vtk.vtkCommand.ModifiedEvent, self.realTimeConstructTrajectory)
-      self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex].SetRecordingActive(True)
-      self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel.SetDisplayVisibility(True)
+        self.startRealTimeReconstruction(locatorIndex, trajectoryIndex)
+      trajectory.sequenceBrowserNode.SetRecordingActive(True)
+      trajectory.modelNode.SetDisplayVisibility(True)
+      if self.streamingCheckBox.checked:
+        self.startStreaming(trajectory)
 
   def disableSpecificLocatorRecording(self, locatorIndex):
-    numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
-    for trajectoryIndex in range(numOfSequenceNode):
-      self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex].SetRecordingActive(False)
-      if self.realTimeReconstructCheckBox.checked:
-        self.sequenceNodesList[locatorIndex][trajectoryIndex].RemoveObserver(vtk.vtkCommand.ModifiedEvent)
-      self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel.SetDisplayVisibility(False)
+    for trajectory in self.logic.registry.locator(locatorIndex).trajectories:
+      trajectory.sequenceBrowserNode.SetRecordingActive(False)
+      self.stopStreaming(trajectory)
+      self.stopRealTimeReconstruction(locatorIndex, trajectory.trajectoryIndex)
+      trajectory.modelNode.SetDisplayVisibility(False)
+
+  def startStreaming(self, trajectory):
+    """
+    Append the samples of a recorded trajectory to the file of its locator in the streaming session, the session
+    starts with the first streamed trajectory in a new directory of the export directory. The samples the trajectory
+    already had are written as well the first time it is streamed in the session.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    if self.streamingRecorder is None:
+      if not os.path.exists(self.exportDirString):
+        slicer.util.warningDisplay("Path doesn't exists!")
+        return
+      directory = os.path.join(self.exportDirString, "Session_" + time.strftime("%Y%m%d_%H%M%S"))
+      sessionDirectory = directory
+      suffix = 1
+      while os.path.exists(sessionDirectory):
+        suffix = suffix + 1
+        sessionDirectory = "%s_%d" % (directory, suffix)
+      self.streamingRecorder = StreamingRecorder(sessionDirectory)
+      self.streamedSamples = {}
+      self.streamingTimer.start()
+    key = (trajectory.locatorIndex, trajectory.trajectoryIndex)
+    if not key in self.streamedSamples:
+      self.streamedSamples[key] = 0
+    if not key in self.streamingTrajectories:
+      self.streamingTrajectories.append(key)
+
+  def stopStreaming(self, trajectory):
+    """
+    Queue the last samples of a trajectory that isn't recorded anymore. The session stays open, as another
+    trajectory is recorded when the trajectory index of a recorded locator is changed.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    key = (trajectory.locatorIndex, trajectory.trajectoryIndex)
+    if key in self.streamingTrajectories:
+      self.streamSamples(trajectory, True)
+      self.streamingTrajectories.remove(key)
+
+  def onStreamingChanged(self):
+    """
+    Stream the trajectories that are recorded, or close the streaming session.
+    :return: None
+    """
+    if self.streamingCheckBox.checked:
+      for trajectory in self.logic.registry.trajectories():
+        if trajectory.sequenceBrowserNode.GetRecordingActive():
+          self.startStreaming(trajectory)
+    else:
+      self.closeStreamingSession()
+
+  def onStreamingUpdate(self):
+    """
+    Timer callback: queue the samples recorded since the previous update, the writer thread of the session
+    appends them to the files.
+    :return: None
+    """
+    if self.streamingRecorder is None:
+      return
+    if self.streamingRecorder.error is not None:
+      self.closeStreamingSession()
+      return
+    for locatorIndex, trajectoryIndex in self.streamingTrajectories:
+      self.streamSamples(self.logic.registry.trajectory(locatorIndex, trajectoryIndex))
+
+  def streamSamples(self, trajectory, wait = False):
+    """
+    Queue the samples of a trajectory that weren't streamed yet. When the queue of the session is full, they are
+    kept in the sequence node and queued by a next update. The samples that are removed from the sequence after
+    being streamed stay in the file.
+    :param trajectory: TrajectoryRecord
+    :param wait: if True, wait until the queue has room for the samples
+    :return: None
+    """
+    key = (trajectory.locatorIndex, trajectory.trajectoryIndex)
+    samples = self.logic.updateSequenceSamples(trajectory.sequenceNode)
+    numOfStreamedSamples = min(self.streamedSamples[key], len(samples))
+    if len(samples) > numOfStreamedSamples:
+      locatorName = trajectory.locator.locatorNode.GetName()
+      if self.streamingRecorder.addSamples(locatorName, locatorName, trajectory.trajectoryIndex,
+                                           samples.timeStamps()[numOfStreamedSamples:].copy(),
+                                           samples.positions()[numOfStreamedSamples:].copy(), wait):
+        numOfStreamedSamples = len(samples)
+    self.streamedSamples[key] = numOfStreamedSamples
+
+  def closeStreamingSession(self):
+    """
+    Queue the last samples of the streamed trajectories, then write the queued samples and close the files of the
+    streaming session. The session is closed when the recording stops, when streaming is turned off, and when the
+    scene is cleared.
+    :return: None
+    """
+    recorder = self.streamingRecorder
+    if recorder is None:
+      return
+    for locatorIndex, trajectoryIndex in list(self.streamingTrajectories):
+      self.stopStreaming(self.logic.registry.trajectory(locatorIndex, trajectoryIndex))
+    self.streamingTimer.stop()
+    self.streamingRecorder = None
+    self.streamingTrajectories = []
+    recorder.close()
+    self.streamingSessionDirectory = recorder.directory
+    if recorder.error is not None:
+      slicer.util.warningDisplay("Streaming to %s failed: %s" % (recorder.directory, recorder.error))
+    else:
+      print("%d samples streamed to %s" % (recorder.numOfWrittenSamples, recorder.directory))
 
   def enableSpecificTrajectoryReplay(self, locatorIndex, trajectoryIndex):
-      trackedNode = self.locatorNodeList[locatorIndex]
-      self.sequenceBrowserWidget.setActiveBrowserNode(self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex])
-      self.sequenceNodeCellWidget.cellWidget(0, 1).setCurrentNode(trackedNode)
+      trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+      self.ensureTrajectoryReconstructed(trajectory)
+      self.sequenceBrowserWidget.setActiveBrowserNode(trajectory.sequenceBrowserNode)
+      self.sequenceNodeCellWidget.cellWidget(0, 1).setCurrentNode(trajectory.locator.locatorNode)
       self.sequenceNodeCellWidget.cellWidget(0, 3).setChecked(True)
-      self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex].SetPlaybackActive(True)
-      self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel.SetDisplayVisibility(True)
+      trajectory.sequenceBrowserNode.SetPlaybackActive(True)
+      trajectory.modelNode.SetDisplayVisibility(True)
 
   def disableSpecificTrajectoryReplay(self, locatorIndex, trajectoryIndex):
-    self.sequenceBrowserNodesList[locatorIndex][trajectoryIndex].SetPlaybackActive(False)
-    if self.realTimeReconstructCheckBox.checked:
-      self.sequenceNodesList[locatorIndex][trajectoryIndex].RemoveObserver(vtk.vtkCommand.ModifiedEvent)
-    self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel.SetDisplayVisibility(False)
-
-  def onLocatorReplay(self, checkbox):
-    channelIndex = 0
-    for i in range(self.nLocators):
-      if self.locatorReplayCheckBox[i] == checkbox:
-        channelIndex = i
-    locatorIndex = -1
-    for i in range(len(self.locatorNodeList)):
-      if self.transformSelector[channelIndex].currentNode() == self.locatorNodeList[i]:
-        locatorIndex = i    
-        break        
-    if locatorIndex > -1:
-      numOfSequenceNode = len(self.sequenceNodesList[locatorIndex])
+    trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+    trajectory.sequenceBrowserNode.SetPlaybackActive(False)
+    self.stopRealTimeReconstruction(locatorIndex, trajectoryIndex)
+    trajectory.modelNode.SetDisplayVisibility(False)
+
+  def onLocatorReplay(self, channelIndex):
+    locator = self.getChannelLocator(channelIndex)
+    checkbox = self.locatorReplayCheckBox[channelIndex]
+    if locator is not None:
+      locatorIndex = locator.locatorIndex
+      numOfSequenceNode = len(locator.trajectories)
       trajectoryIndex = self.trajectoryIndexSpinBox[channelIndex].value
       self.trajectoryIndexSpinBoxLastValue[channelIndex] = trajectoryIndex
       if (self.trajectoryIndexSpinBox[channelIndex].value + 1) <= numOfSequenceNode:
@@ -883,81 +1265,386 @@ class TrajectoryReconstructorWidget(ScriptedLoadableModuleWidget):
           self.enableCurrentLocator(channelIndex, False)
           self.disableSpecificTrajectoryReplay(locatorIndex, trajectoryIndex)
 
-  def onConstructTrajectory(self, button):
-    channelIndex = 0
-    for i in range(self.nLocators):
-      if self.locatorRecontructButton[i] == button:
-        channelIndex = i
+  def onConstructTrajectory(self, channelIndex):
     self.enableCurrentLocator(channelIndex, True)
     trajectoryIndex = self.trajectoryIndexSpinBox[channelIndex].value
-    locatorIndex = -1
-    for i in range(len(self.locatorNodeList)):
-      if self.transformSelector[channelIndex].currentNode() == self.locatorNodeList[i]:
-        locatorIndex = i
-        break
-    if trajectoryIndex > -1 and locatorIndex > -1:
-      self.constructSpecificTrajectory(locatorIndex, trajectoryIndex)
+    locator = self.getChannelLocator(channelIndex)
+    if trajectoryIndex > -1 and locator is not None and trajectoryIndex < len(locator.trajectories):
+      self.constructSpecificTrajectory(locator.locatorIndex, trajectoryIndex)
    
-  def realTimeConstructTrajectory(self, caller, eventId):
-    locatorIndex = 0
-    trajectoryIndex = 0
-    numOfLocator = len(self.sequenceNodesList)
-    for i in range(numOfLocator):
-      numOfSequenceNode = len(self.sequenceNodesList[i])
-      for j in range(numOfSequenceNode):
-        if self.sequenceNodesList[i][j] == caller:
-          locatorIndex = i
-          trajectoryIndex = j
-    self.constructSpecificTrajectoryRealTime(locatorIndex, trajectoryIndex)
+  def startRealTimeReconstruction(self, locatorIndex, trajectoryIndex):
+    """
+    Add a trajectory to the ones updated by the real-time timer, the timer is started with the first one.
+    :return: None
+    """
+    trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+    self.ensureTrajectoryReconstructed(trajectory)
+    if not (locatorIndex, trajectoryIndex) in self.realTimeTrajectories:
+      self.realTimeTrajectories.append((locatorIndex, trajectoryIndex))
+      self.startLatencyMonitoring(trajectory)
+    if not self.realTimeTimer.isActive():
+      self.realTimeTimer.start()
+
+  def stopRealTimeReconstruction(self, locatorIndex, trajectoryIndex):
+    """
+    Process the remaining samples of a trajectory and remove it from the ones updated by the real-time timer.
+    The model of the finished trajectory is then simplified if it is enabled in the settings.
+    :return: None
+    """
+    if (locatorIndex, trajectoryIndex) in self.realTimeTrajectories:
+      trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+      if self.simplificationTolerance > 0 or self.maxNumOfDisplayedPoints > 0:
+        self.constructSpecificTrajectoryRealTime(locatorIndex, trajectoryIndex)
+        with self.logic.diagnostics.measure("realTime", "model", [trajectory]):
+          self.updateTrajectoryModel(trajectory)
+      elif self.constructSpecificTrajectoryRealTime(locatorIndex, trajectoryIndex):
+        with self.logic.diagnostics.measure("realTime", "model", [trajectory]):
+          self.appendTrajectoryModel(trajectory)
+      self.logic.diagnostics.latency.setStageTime(trajectory, "display", len(trajectory.filteredData))
+      self.stopLatencyMonitoring(trajectory)
+      self.realTimeTrajectories.remove((locatorIndex, trajectoryIndex))
+    if len(self.realTimeTrajectories) == 0:
+      self.realTimeTimer.stop()
+      self.updateDiagnostics()
+
+  def onRealTimeUpdate(self):
+    """
+    Timer callback: process the samples recorded since the previous update for all the recorded trajectories,
+    then extend the model of each trajectory that got new points once.
+    :return: None
+    """
+    trajectories = [self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+                    for locatorIndex, trajectoryIndex in self.realTimeTrajectories]
+    for trajectory in self.constructTrajectoriesRealTime(trajectories):
+      with self.logic.diagnostics.measure("realTime", "model", [trajectory]):
+        self.appendTrajectoryModel(trajectory)
+    # the samples that didn't add points are shown as well, they are kept by the resamplers
+    displayTime = time.perf_counter()
+    for trajectory in trajectories:
+      self.logic.diagnostics.latency.setStageTime(trajectory, "display", len(trajectory.filteredData), displayTime)
+
+  def startLatencyMonitoring(self, trajectory):
+    """
+    Time the samples recorded in the sequence of a trajectory through the real-time reconstruction, and count the
+    samples received by the transform node of its locator to find the ones that weren't recorded.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    sequenceNode = trajectory.sequenceNode
+    locatorNode = trajectory.locator.locatorNode
+    self.logic.diagnostics.latency.startTrajectory(trajectory, sequenceNode.GetNumberOfDataNodes())
+    trajectory.latencyObserverTags = [
+      (sequenceNode, sequenceNode.AddObserver(vtk.vtkCommand.ModifiedEvent,
+                                              partial(self.onRealTimeSequenceModified, trajectory))),
+      (locatorNode, locatorNode.AddObserver(slicer.vtkMRMLTransformableNode.TransformModifiedEvent,
+                                            partial(self.onRealTimeLocatorModified, trajectory)))]
+
+  def stopLatencyMonitoring(self, trajectory):
+    for node, tag in trajectory.latencyObserverTags:
+      node.RemoveObserver(tag)
+    trajectory.latencyObserverTags = []
+    self.logic.diagnostics.latency.stopTrajectory(trajectory)
+
+  def onRealTimeSequenceModified(self, trajectory, caller, event):
+    self.logic.diagnostics.latency.addRecorded(trajectory, caller.GetNumberOfDataNodes())
+
+  def onRealTimeLocatorModified(self, trajectory, caller, event):
+    self.logic.diagnostics.latency.addReceived(trajectory)
+
+  def getDisplayedPoints(self, trajectory, simplify = True):
+    """
+    :param trajectory: TrajectoryRecord
+    :param simplify: if False, all the resampled points are returned
+    :return: (N, 3) float array of the resampled points, simplified with the tolerance and the maximum number of
+             points of the settings
+    """
+    points = trajectory.points.array()
+    if not simplify or (self.simplificationTolerance <= 0 and self.maxNumOfDisplayedPoints <= 0):
+      return points
+    maxNumOfPoints = self.maxNumOfDisplayedPoints if self.maxNumOfDisplayedPoints > 0 else None
+    return self.logic.simplifyTrajectory(points, self.simplificationTolerance, maxNumOfPoints)
+
+  def updateTrajectoryModel(self, trajectory, simplify = True):
+    """
+    Rebuild the model of a trajectory from its displayed points. While the trajectory is edited, the model is built
+    by CurveMaker from the markups instead.
+    :param trajectory: TrajectoryRecord
+    :param simplify: if False, the model shows all the resampled points, as while recording
+    :return: None
+    """
+    if trajectory.editing:
+      if trajectory.fiducialNode.GetNumberOfFiducials()>1:
+        trajectory.curveManager.cmLogic.updateCurve()
+    else:
+      points = self.getDisplayedPoints(trajectory, simplify)
+      trajectory.simplified = len(points) < len(trajectory.points)
+      trajectory.tube.setPoints(points)
+      trajectory.modelNode.SetAndObservePolyData(self.logic.createTrajectoryPolyData(trajectory.tube))
+
+  def appendTrajectoryModel(self, trajectory):
+    """
+    Extend the model of a recorded trajectory with the points added since its previous update. Only the end of the
+    tube is computed again and the rest of the polydata is kept, the whole model is rebuilt if it doesn't match
+    the tube or if the trajectory was built again from its first sample.
+    The points are not simplified while recording, the simplification would change the whole trajectory.
+    :param trajectory: TrajectoryRecord
+    :return: None
+    """
+    tube = trajectory.tube
+    polyData = trajectory.modelNode.GetPolyData()
+    if trajectory.editing or trajectory.simplified or polyData is None or len(tube) > len(trajectory.points) or \
+        not polyData.GetNumberOfPoints() == tube.numOfRings() * tube.numOfSides:
+      self.updateTrajectoryModel(trajectory, simplify = False)
+      return
+    numOfOldRings = tube.numOfRings()
+    firstRing = tube.append(trajectory.points.array()[len(tube):])
+    if firstRing == 0:
+      trajectory.modelNode.SetAndObservePolyData(self.logic.createTrajectoryPolyData(tube))
+    else:
+      self.logic.appendTrajectoryPolyData(polyData, tube, firstRing, numOfOldRings)
    
   def constructSpecificTrajectory(self, locatorIndex, trajectoryIndex):
-    posAll = []
-    seqNode = self.sequenceNodesList[locatorIndex][trajectoryIndex]
-    self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].RemoveAllMarkups()
-    for index in range(seqNode.GetNumberOfDataNodes()):
-      transformNode = seqNode.GetNthDataNode(index)
-      transMatrix = vtk.vtkMatrix4x4()
-      transformNode.GetMatrixTransformToParent(transMatrix)
-      pos = [transMatrix.GetElement(0, 3), transMatrix.GetElement(1, 3), transMatrix.GetElement(2, 3)]
-      posAll.append(pos)
-    if not posAll == []:
-      self.logic.filteredData[locatorIndex][trajectoryIndex] = self.logic.kalmanFilteredPoses(posAll, self.processVariance, self.measurementVariance)
-      resampledPos = self.logic.resampleData(self.logic.filteredData[locatorIndex][trajectoryIndex], self.movementThreshold, self.downSampleStepSize)
+    self.constructTrajectories([self.logic.registry.trajectory(locatorIndex, trajectoryIndex)])
+
+  def constructTrajectories(self, trajectories):
+    """
+    Filter, resample and display whole trajectories. The trajectories that are not in the reconstruction cache
+    are filtered together by one batch call.
+    :param trajectories: list of TrajectoryRecord
+    :return: None
+    """
+    samples = []
+    for trajectory in trajectories:
+      with self.logic.diagnostics.measure("reconstruction", "samples", [trajectory]):
+        samples.append(self.logic.updateSequenceSamples(trajectory.sequenceNode))
+    reconstructions = self.logic.reconstructTrajectories(samples, self.processVariance, self.measurementVariance,
+                                                         self.movementThreshold, self.downSampleStepSize, trajectories)
+    for trajectory, (filteredData, resampledPos) in zip(trajectories, reconstructions):
+      self.setTrajectoryReconstruction(trajectory, filteredData, resampledPos, self.downSampleStepSize)
+    self.updateDiagnostics()
+
+  def setTrajectoryReconstruction(self, trajectory, filteredData, resampledPos, step):
+    """
+    Display a reconstructed trajectory.
+    :param trajectory: TrajectoryRecord
+    :param filteredData: (N, 3) float array of the filtered positions, empty if the trajectory has no sample
+    :param resampledPos: (M, 3) float array of the resampled points
+    :param step: resampling window size used for the reconstruction
+    :return: None
+    """
+    if trajectory.stale:
+      self.setTrajectoryStale(trajectory, False)
+    trajectory.points.clear()
+    if len(filteredData):
+      filteredBuffer = trajectory.filteredData
+      filteredBuffer.setData(filteredData)
+      trajectory.resampler.setStep(step, filteredBuffer.array())
       if len(resampledPos) >=2:
-        for pos in resampledPos:
-          self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].AddFiducialFromArray(pos)
-          self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].SetNthFiducialLabel(index, "")   
-        #self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.DestinationNode = self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel
-        #self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.SourceNode = self.curveManagersList[locatorIndex][trajectoryIndex].curveFiducials
-        self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.updateCurve()
-        self.curveManagersList[locatorIndex][trajectoryIndex].lockLine()
-        self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel.SetDisplayVisibility(True)
+        trajectory.points.setData(resampledPos)
+        trajectory.modelNode.SetDisplayVisibility(True)
+    diagnostics = self.logic.diagnostics
+    if trajectory.editing:
+      with diagnostics.measure("reconstruction", "markups", [trajectory]):
+        self.setTrajectoryMarkups(trajectory)
+    with diagnostics.measure("reconstruction", "model", [trajectory]):
+      self.updateTrajectoryModel(trajectory)
+    diagnostics.setCounts(trajectory, len(filteredData), len(trajectory.points))
+
+  def onReconstructAll(self):
+    """
+    Reconstruct all the trajectories that are not recorded in real time. The samples are read from the sequence
+    nodes here, the filtering and resampling run on a thread pool, and onReconstructAllUpdate displays the
+    trajectories as they are done.
+    :return: None
+    """
+    if self.reconstructAllJob is not None:
+      return
+    realTimeTrajectories = [self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+                            for locatorIndex, trajectoryIndex in self.realTimeTrajectories]
+    tasks = []
+    for trajectory in self.logic.registry.trajectories():
+      if trajectory in realTimeTrajectories:
+        continue
+      with self.logic.diagnostics.measure("reconstruction", "samples", [trajectory]):
+        samples = self.logic.updateSequenceSamples(trajectory.sequenceNode)
+      # the workers get copies, the samples can be extended while they run
+      tasks.append((trajectory, (samples.timeStamps().copy(), samples.positions().copy(), self.processVariance,
+                                 self.measurementVariance, self.movementThreshold, self.downSampleStepSize,
+                                 trajectory)))
+    if len(tasks) == 0:
+      return
+    self.reconstructAllJob = ReconstructionJob(self.logic.reconstructTrajectory, tasks)
+    self.reconstructAllStep = self.downSampleStepSize
+    self.reconstructAllProgressBar.setMaximum(len(tasks))
+    self.reconstructAllProgressBar.setValue(0)
+    self.reconstructAllProgressBar.setVisible(True)
+    self.cancelReconstructAllButton.setVisible(True)
+    self.reconstructAllButton.setEnabled(False)
+    self.reconstructAllTimer.start()
+
+  def onReconstructAllUpdate(self):
+    """
+    Timer callback of Reconstruct All: display the trajectories reconstructed since the previous call.
+    :return: None
+    """
+    job = self.reconstructAllJob
+    if job is None:
+      return
+    for trajectory, reconstruction, error in job.takeCompleted():
+      if error is not None:
+        print("Reconstruction of trajectory %d of locator %d failed: %s" % (trajectory.trajectoryIndex,
+                                                                          trajectory.locatorIndex, error))
+      elif not (trajectory.locatorIndex, trajectory.trajectoryIndex) in self.realTimeTrajectories:
+        self.setTrajectoryReconstruction(trajectory, reconstruction[0], reconstruction[1], self.reconstructAllStep)
+    self.reconstructAllProgressBar.setValue(job.numOfCompletedTasks)
+    if job.isFinished():
+      self.finishReconstructAll()
+
+  def onCancelReconstructAll(self):
+    if self.reconstructAllJob is not None:
+      self.reconstructAllJob.cancel()
+      self.finishReconstructAll()
+
+  def finishReconstructAll(self):
+    self.reconstructAllTimer.stop()
+    self.reconstructAllJob = None
+    self.reconstructAllProgressBar.setVisible(False)
+    self.cancelReconstructAllButton.setVisible(False)
+    self.reconstructAllButton.setEnabled(True)
+    self.updateDiagnostics()
+
+  def updateDiagnostics(self):
+    """
+    Show the stage timings of the trajectories, followed by the real-time latencies and the last profile if any.
+    :return: None
+    """
+    text = TrajectoryReconstructorLib.formatDiagnosticsTable(self.logic.diagnostics,
+                                                             self.diagnosticsCumulativeCheckBox.checked)
+    if len(self.logic.diagnostics.latency.locators()):
+      text += "\n\nReal-time latency\n" + TrajectoryReconstructorLib.formatLatencyTable(self.logic.diagnostics.latency)
+    if self.logic.diagnostics.profile:
+      text += "\n\n" + self.logic.diagnostics.profile
+    self.diagnosticsTextEdit.setPlainText(text)
+
+  def onResetDiagnostics(self):
+    self.logic.diagnostics.clear()
+    self.updateDiagnostics()
+
+  def onExportDiagnostics(self):
+    fileName = self.fileDialog.getSaveFileName(None, "Export diagnostics", "", "JSON files (*.json)")
+    if not fileName:
+      return
+    if not fileName.endswith(".json"):
+      fileName += ".json"
+    self.logic.diagnostics.writeJSON(fileName)
+
+  def onProfileReconstruction(self):
+    """
+    Reconstruct all the trajectories that are not recorded in real time with cProfile. The reconstruction cache is
+    disabled during the profile, so the filter and the resampling are run.
+    :return: None
+    """
+    trajectories = [trajectory for trajectory in self.logic.registry.trajectories()
+                    if not (trajectory.locatorIndex, trajectory.trajectoryIndex) in self.realTimeTrajectories]
+    if len(trajectories) == 0:
+      return
+    reconstructionCache = self.logic.reconstructionCache
+    self.logic.reconstructionCache = None
+    try:
+      self.logic.diagnostics.profile = TrajectoryReconstructorLib.profileCall(self.constructTrajectories,
+                                                                              trajectories)[1]
+    finally:
+      self.logic.reconstructionCache = reconstructionCache
+    self.updateDiagnostics()
 
   def constructSpecificTrajectoryRealTime(self, locatorIndex, trajectoryIndex):
+    """
+    Filter and resample the samples recorded since the previous call, and add the resampled points to the trajectory.
+    The model isn't updated, the caller updates it once for all the new points.
+    :param locatorIndex: The index of the locator
+    :param trajectoryIndex: The index of the trajectory
+    :return: True if points were added to the trajectory
+    """
+    trajectory = self.logic.registry.trajectory(locatorIndex, trajectoryIndex)
+    return len(self.constructTrajectoriesRealTime([trajectory])) > 0
 
-    seqNode = self.sequenceNodesList[locatorIndex][trajectoryIndex]
-    transformNode = seqNode.GetNthDataNode(seqNode.GetNumberOfDataNodes()-1)
-    transMatrix = vtk.vtkMatrix4x4()
-    transformNode.GetMatrixTransformToParent(transMatrix)
-    pos = [transMatrix.GetElement(0, 3), transMatrix.GetElement(1, 3), transMatrix.GetElement(2, 3)]
-    if len(self.logic.filteredData[locatorIndex][trajectoryIndex]) == 0:
-      self.logic.filteredData[locatorIndex][trajectoryIndex] = numpy.array([pos])
-    else:
-      filteredPos, pCov = self.logic.kalmanFilteredPosesRealTime(pos, self.logic.filteredData[locatorIndex][trajectoryIndex], self.logic.pCov[locatorIndex][trajectoryIndex], self.processVariance, self.measurementVariance)
-      arrayLength = len(self.logic.filteredData[locatorIndex][trajectoryIndex])
-      insertedArray = numpy.insert(self.logic.filteredData[locatorIndex][trajectoryIndex], [arrayLength], filteredPos, axis=0)
-      self.logic.filteredData[locatorIndex][trajectoryIndex] = insertedArray
-      self.logic.pCov[locatorIndex][trajectoryIndex] = pCov
-      resampledPos, valid = self.logic.resampleDataRealTime(self.logic.filteredData[locatorIndex][trajectoryIndex], self.movementThreshold, self.downSampleStepSize)
-      if valid:
-        self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].AddFiducialFromArray(resampledPos)
-        fiducialNum = self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].GetNumberOfFiducials()
-        self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].SetNthFiducialLabel(fiducialNum-1, "")
-        if self.trajectoryFidicualsList[locatorIndex][trajectoryIndex].GetNumberOfFiducials()>1:
-          #self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.DestinationNode = self.curveManagersList[locatorIndex][trajectoryIndex]._curveModel
-          #self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.SourceNode = self.curveManagersList[locatorIndex][trajectoryIndex].curveFiducials
-          self.curveManagersList[locatorIndex][trajectoryIndex].cmLogic.updateCurve()
-          self.curveManagersList[locatorIndex][trajectoryIndex].lockLine()
+  def getNewSamples(self, trajectory):
+    """
+    Get the samples of a recorded trajectory that haven't been filtered yet. The trajectory is reset if its
+    sequence was edited, and its first sample is taken as the first filtered position.
+    :param trajectory: TrajectoryRecord
+    :return: (M, 3) float array of the positions to filter
+    """
+    samples = self.logic.updateSequenceSamples(trajectory.sequenceNode)
+    filteredBuffer = trajectory.filteredData
+    resampler = trajectory.resampler
+    if len(samples) < len(filteredBuffer):
+      # the sequence was edited, the trajectory is built again from its first sample
+      self.logic.diagnostics.latency.discard(trajectory, len(samples))
+      filteredBuffer.clear()
+      trajectory.pCov = 1.0
+      resampler.reset()
+      trajectory.points.clear()
+      trajectory.tube.clear()
+      if trajectory.editing:
+        trajectory.fiducialNode.RemoveAllMarkups()
+    resampler.movementThreshold = self.movementThreshold
+    if not resampler.step == self.downSampleStepSize:
+      resampler.setStep(self.downSampleStepSize, filteredBuffer.array())
+    newPositions = samples.positions()[len(filteredBuffer):]
+    if len(filteredBuffer) == 0 and len(newPositions):
+      filteredBuffer.append(newPositions[0])
+      resampler.append(newPositions[0])
+      newPositions = newPositions[1:]
+    return newPositions
+
+  def constructTrajectoriesRealTime(self, trajectories):
+    """
+    Filter and resample the samples recorded since the previous call for several trajectories, and add the
+    resampled points to the trajectories. The new samples of all the trajectories are filtered by one batch call.
+    The models aren't updated, the caller updates them once for all the new points.
+    :param trajectories: list of TrajectoryRecord
+    :return: list of the TrajectoryRecord that got new points
+    """
+    diagnostics = self.logic.diagnostics
+    latency = diagnostics.latency
+    newPositions = []
+    for trajectory in trajectories:
+      with diagnostics.measure("realTime", "samples", [trajectory]):
+        newPositions.append(self.getNewSamples(trajectory))
+    recorded = [index for index in range(len(trajectories)) if len(newPositions[index])]
+    if len(recorded) == 0:
+      return []
+    with diagnostics.measure("realTime", "filter", [trajectories[index] for index in recorded],
+                             [len(newPositions[index]) for index in recorded]):
+      filteredData, pCovs = self.logic.kalmanFilteredNewPosesBatch([newPositions[index] for index in recorded],
+                                                                   [trajectories[index].filteredData.array()[-1] for index in recorded],
+                                                                   [trajectories[index].pCov for index in recorded],
+                                                                   self.processVariance, self.measurementVariance)
+    filterTime = time.perf_counter()
+    updatedTrajectories = []
+    for index, filteredPositions, pCov in zip(recorded, filteredData, pCovs.tolist()):
+      trajectory = trajectories[index]
+      trajectory.pCov = pCov
+      trajectory.filteredData.extend(filteredPositions)
+      latency.setStageTime(trajectory, "filter", len(trajectory.filteredData), filterTime)
+      with diagnostics.measure("realTime", "resample", [trajectory]):
+        resampledPositions = trajectory.resampler.extend(filteredPositions)
+      latency.setStageTime(trajectory, "resample", len(trajectory.filteredData))
+      diagnostics.setCounts(trajectory, len(trajectory.filteredData), len(trajectory.points) + len(resampledPositions))
+      if len(resampledPositions) == 0:
+        continue
+      trajectory.points.extend(resampledPositions)
+      if trajectory.editing:
+        with diagnostics.measure("realTime", "markups", [trajectory]):
+          fiducialNode = trajectory.fiducialNode
+          wasModified = fiducialNode.StartModify()
+          for pos in resampledPositions:
+            fiducialNode.AddFiducialFromArray(pos)
+            fiducialNode.SetNthFiducialLabel(fiducialNode.GetNumberOfFiducials()-1, "")
+          fiducialNode.EndModify(wasModified)
+      updatedTrajectories.append(trajectory)
+    return updatedTrajectories
     
   def onReload(self, moduleName="TrajectoryReconstructor"):
     # Generic reload method for any scripted module.
@@ -1238,8 +1925,16 @@ class TrajectoryReconstructorLogic(ScriptedLoadableModuleLogic):
     self.connectorNodeID = ''
 
     self.count = 0
-    self.pCov = [[],[],[],[],[]]
-    self.filteredData = [[],[],[],[],[]]
+    # locators and trajectories, with their nodes and real-time reconstruction state
+    self.registry = LocatorRegistry()
+    # samples of the sequence nodes, by sequence node ID
+    self.sequenceSamples = {}
+    # [sequence node, observer tag, number of data nodes] of the sequence nodes of the cached samples, by node ID
+    self.sequenceObservers = {}
+    # disk cache of the reconstructed trajectories, disabled if None
+    self.reconstructionCache = None
+    # timings of the reconstruction stages of each trajectory
+    self.diagnostics = ReconstructionDiagnostics()
     
   def setWidget(self, widget):
     self.widget = widget
@@ -1368,94 +2063,266 @@ class TrajectoryReconstructorLogic(ScriptedLoadableModuleLogic):
     if delkey != '':
       del self.eventTag[delkey]
 
+    for nodeID in [nodeID for nodeID in self.sequenceSamples if self.scene.GetNodeByID(nodeID) is None]:
+      self.invalidateSequenceSamples(self.sequenceObservers[nodeID][0])
+
+  def updateSequenceSamples(self, seqNode):
+    """
+    Bring the cached samples of a sequence node up to date. Only the samples added since the last update are read
+    from the data nodes. The whole sequence is read again when a sample was removed or inserted before the end, or
+    when the sequence node was modified without samples being appended, as when a stored transform is replaced.
+    After an edit of a data node that doesn't modify the sequence node, invalidateSequenceSamples has to be called.
+    :param seqNode: Sequence node where the poses are stored.
+    :return: SequenceSamples of the sequence node
+    """
+    samples = self.sequenceSamples.get(seqNode.GetID())
+    if samples is None:
+      samples = SequenceSamples()
+      self.sequenceSamples[seqNode.GetID()] = samples
+      self.observeSequenceNode(seqNode)
+    numOfDataNodes = seqNode.GetNumberOfDataNodes()
+    numOfSamples = len(samples)
+    if numOfSamples > 0 and (numOfSamples > numOfDataNodes or not samples.isPrefixOf(
+        seqNode.GetNthIndexValue(0), seqNode.GetNthIndexValue(numOfSamples - 1))):
+      samples.clear()
+      numOfSamples = 0
+    if numOfSamples < numOfDataNodes:
+      timeStamps = numpy.zeros(numOfDataNodes - numOfSamples)
+      positions = numpy.zeros((numOfDataNodes - numOfSamples, 3))
+      transMatrix = vtk.vtkMatrix4x4()
+      for index in range(numOfSamples, numOfDataNodes):
+        seqNode.GetNthDataNode(index).GetMatrixTransformToParent(transMatrix)
+        positions[index - numOfSamples] = [transMatrix.GetElement(0, 3), transMatrix.GetElement(1, 3),
+                                           transMatrix.GetElement(2, 3)]
+        timeStamps[index - numOfSamples] = float(seqNode.GetNthIndexValue(index))
+      samples.extend(timeStamps, positions, seqNode.GetNthIndexValue(0), seqNode.GetNthIndexValue(numOfDataNodes - 1))
+    return samples
+
+  def setSequenceSamples(self, seqNode, timeStamps, positions):
+    """
+    Fill the cache with the samples just stored in a sequence node, so that they are not read back from the data nodes.
+    The sequence node sorts its samples by time stamp, the cache is only filled if they were already sorted.
+    :param seqNode: Sequence node where the poses are stored.
+    :param timeStamps: (N,) float array
+    :param positions: (N, 3) float array
+    :return: None
+    """
+    self.invalidateSequenceSamples(seqNode)
+    numOfDataNodes = seqNode.GetNumberOfDataNodes()
+    if numOfDataNodes == 0 or not numOfDataNodes == len(timeStamps) or numpy.any(numpy.diff(timeStamps) <= 0):
+      return
+    samples = SequenceSamples()
+    samples.extend(timeStamps, positions, seqNode.GetNthIndexValue(0), seqNode.GetNthIndexValue(numOfDataNodes - 1))
+    self.sequenceSamples[seqNode.GetID()] = samples
+    self.observeSequenceNode(seqNode)
+
+  def observeSequenceNode(self, seqNode):
+    """
+    Discard the cached samples of a sequence node when it is modified without samples being appended. The number of
+    data nodes is compared to the one of the previous modification, so that the samples recorded in real time keep
+    being read incrementally.
+    :param seqNode: Sequence node where the poses are stored.
+    :return: None
+    """
+    observer = self.sequenceObservers.get(seqNode.GetID())
+    if observer is None:
+      observer = [seqNode, seqNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onSequenceNodeModified), 0]
+      self.sequenceObservers[seqNode.GetID()] = observer
+    observer[2] = seqNode.GetNumberOfDataNodes()
+
+  def onSequenceNodeModified(self, caller, event):
+    observer = self.sequenceObservers.get(caller.GetID())
+    if observer is None:
+      return
+    numOfDataNodes = caller.GetNumberOfDataNodes()
+    if numOfDataNodes > observer[2]:
+      observer[2] = numOfDataNodes
+    else:
+      self.invalidateSequenceSamples(caller)
+
+  def invalidateSequenceSamples(self, seqNode = None):
+    """
+    Discard the cached samples of a sequence node, or of all the sequence nodes if seqNode is None
+    :return: None
+    """
+    if seqNode is None:
+      self.sequenceSamples.clear()
+      observers = list(self.sequenceObservers.values())
+      self.sequenceObservers.clear()
+    else:
+      self.sequenceSamples.pop(seqNode.GetID(), None)
+      observers = [self.sequenceObservers.pop(seqNode.GetID(), None)]
+    for observer in observers:
+      if observer is not None:
+        observer[0].RemoveObserver(observer[1])
+
+
+  def setReconstructionCacheDirectory(self, directory, maxSize = 256 * 1024 * 1024):
+    """
+    :param directory: directory of the reconstruction cache, the cache is disabled if None
+    :param maxSize: maximum size of the cache, in bytes
+    :return: None
+    """
+    self.reconstructionCache = None
+    if directory:
+      try:
+        self.reconstructionCache = ReconstructionCache(directory, maxSize)
+      except OSError as e:
+        print("Reconstruction cache disabled: %s" % e)
+
+  def reconstructTrajectories(self, samplesList, Q, R, movementThreshold, step, trajectories = None):
+    """
+    Filter and resample trajectories. The results are read from the reconstruction cache when the samples and the
+    parameters didn't change, the other trajectories are filtered together and stored in the cache.
+    :param samplesList: list of SequenceSamples
+    :param trajectories: TrajectoryRecord of each SequenceSamples, the stages are timed in the diagnostics if given
+    :return: list of (filteredData, resampledPoints) float arrays, empty for the trajectories without samples
+    """
+    cache = self.reconstructionCache
+    if trajectories is None:
+      trajectories = [None] * len(samplesList)
+    diagnostics = self.diagnostics
+    reconstructions = [(numpy.zeros((0, 3)), numpy.zeros((0, 3)))] * len(samplesList)
+    keys = {}
+    missing = []
+    for index, samples in enumerate(samplesList):
+      if len(samples) == 0:
+        continue
+      if cache is not None:
+        with diagnostics.measure("reconstruction", "cache", [trajectories[index]]):
+          keys[index] = cache.key(samples.timeStamps(), samples.positions(), Q, R, movementThreshold, step)
+          entry = cache.get(keys[index])
+        if entry is not None:
+          reconstructions[index] = entry
+          continue
+      missing.append(index)
+    with diagnostics.measure("reconstruction", "filter", [trajectories[index] for index in missing],
+                             [len(samplesList[index]) for index in missing]):
+      filteredData = self.kalmanFilteredPosesBatch([samplesList[index].positions() for index in missing], Q, R)
+    for index, filteredPositions in zip(missing, filteredData):
+      with diagnostics.measure("reconstruction", "resample", [trajectories[index]]):
+        reconstructions[index] = (filteredPositions, self.resampleData(filteredPositions, movementThreshold, step))
+      if cache is not None:
+        with diagnostics.measure("reconstruction", "cache", [trajectories[index]]):
+          cache.put(keys[index], *reconstructions[index])
+    return reconstructions
+
+  def reconstructTrajectory(self, timeStamps, positions, Q, R, movementThreshold, step, trajectory = None):
+    """
+    Filter and resample one trajectory, through the reconstruction cache. Doesn't access the scene, so it can be
+    called from a worker thread.
+    :param timeStamps: (N,) float array of the time stamps of the samples
+    :param positions: (N, 3) float array of the recorded positions
+    :param trajectory: TrajectoryRecord, the stages are timed in the diagnostics if given
+    :return: (filteredData, resampledPoints) float arrays
+    """
+    if len(positions) == 0:
+      return numpy.zeros((0, 3)), numpy.zeros((0, 3))
+    diagnostics = self.diagnostics
+    cache = self.reconstructionCache
+    if cache is not None:
+      with diagnostics.measure("reconstruction", "cache", [trajectory]):
+        key = cache.key(timeStamps, positions, Q, R, movementThreshold, step)
+        entry = cache.get(key)
+      if entry is not None:
+        return entry
+    with diagnostics.measure("reconstruction", "filter", [trajectory]):
+      filteredData = TrajectoryReconstructorLib.kalmanFilteredPoses(positions, Q, R)
+    with diagnostics.measure("reconstruction", "resample", [trajectory]):
+      resampledPoints = TrajectoryReconstructorLib.resampleData(filteredData, movementThreshold, step)
+    if cache is not None:
+      with diagnostics.measure("reconstruction", "cache", [trajectory]):
+        cache.put(key, filteredData, resampledPoints)
+    return filteredData, resampledPoints
 
   def kalmanFilteredPoses(self, posAll, Q = 1e-5, R = 0.02**2):
-    #Q = 1e-5  # process variance
-    #R = 0.02 ** 2  # estimate of measurement variance, change to see effect
-    totalLen = len(posAll)
-    # allocate space for arrays
-    hatminus = numpy.zeros(totalLen)  # a priori estimate
-    filteredData = numpy.zeros((totalLen,3))
-    # intial guesses
-    for i in range(3):
-      filteredData[0][i] = posAll[0][i]
-      P_pre = 1.0
-      for k in range(1, totalLen):
-        # time update
-        hatminus[k] = filteredData[k-1][i]
-        Pminus = P_pre + Q
-
-        # measurement update
-        K = Pminus / (Pminus + R)
-        filteredData[k][i] = hatminus[k] + K * (posAll[k][i] - hatminus[k])
-        P_pre = (1 - K) * Pminus
-    return filteredData
+    return TrajectoryReconstructorLib.kalmanFilteredPoses(posAll, Q, R)
 
   def kalmanFilteredPosesRealTime(self, pos, filteredDataAll, pCov, Q = 1e-5, R = 0.02**2):
-    #Q = 1e-5  # process variance
-    #R = 0.02 ** 2  # estimate of measurement variance, change to see effect
-    # allocate space for arrays
-    #hatminus = numpy.zeros(totalLen)  # a priori estimate
-    #Intial guesses
-    totalLen = len(filteredDataAll) # current filtered data length
-    filteredPos = [0,0,0]
-    for i in range(3):
-
-      # time update
-      hatminus = filteredDataAll[totalLen-1][i]
-      Pminus = pCov + Q
-      # measurement update
-      K = Pminus / (Pminus + R)
-      filteredPos[i] = hatminus + K * (pos[i] - hatminus)
-      pCov = (1 - K) * Pminus
-    return filteredPos, pCov
+    return TrajectoryReconstructorLib.kalmanFilteredPosesRealTime(pos, filteredDataAll, pCov, Q, R)
+
+  def kalmanFilteredNewPoses(self, newPos, filteredDataAll, pCov, Q = 1e-5, R = 0.02**2):
+    return TrajectoryReconstructorLib.kalmanFilteredNewPoses(newPos, filteredDataAll, pCov, Q, R)
+
+  def kalmanFilteredPosesBatch(self, posList, Q = 1e-5, R = 0.02**2):
+    return TrajectoryReconstructorLib.kalmanFilteredPosesBatch(posList, Q, R)
+
+  def kalmanFilteredNewPosesBatch(self, newPosList, lastFilteredPos, pCovs, Q = 1e-5, R = 0.02**2):
+    return TrajectoryReconstructorLib.kalmanFilteredNewPosesBatch(newPosList, lastFilteredPos, pCovs, Q, R)
 
   def resampleData(self, data, movementThreshold = 1.0, step = 10):
-    dataLen = len(data)
-    if dataLen >= step:
-      pos_mean = numpy.zeros((int(dataLen/step),3))
-      pos_mean[0,:] = numpy.array([numpy.mean(data[0:step,0]), numpy.mean(data[0:step, 1]), numpy.mean(data[0:step, 2])])
-      pos_DownSampled = []
-      pos_DownSampled.append(pos_mean[0,:])
-      for index in range(step, dataLen-step, step):
-        pos_mean[int(index/step)] = numpy.array([numpy.mean(data[index:index+step, 0]), numpy.mean(data[index:index+step, 1]), numpy.mean(data[index:index+step, 2])])
-        if numpy.linalg.norm(pos_mean[int(index/step)] - pos_mean[int(index/step)-1])>movementThreshold:
-          distance = -1e20
-          indexMax = 0
-          for indexInner in range(step):
-            pos1 = numpy.array(data[index+indexInner,:])
-            if len(pos_DownSampled) > 1:
-              pos2 = pos_DownSampled[-2]
-            else:
-              pos2 = pos_DownSampled[0]
-            if numpy.linalg.norm(pos1-pos2)>distance:
-              indexMax = indexInner
-              distance = numpy.linalg.norm(pos1-pos2)
-          pos_DownSampled.append(data[index+indexMax,:])
-      pos_downSampledArray = numpy.zeros((len(pos_DownSampled),3))
-      for index in range(len(pos_DownSampled)):
-        pos_downSampledArray[index,:] = pos_DownSampled[index]
-      return pos_downSampledArray
-    return data
+    return TrajectoryReconstructorLib.resampleData(data, movementThreshold, step)
 
   def resampleDataRealTime(self, data, movementThreshold = 1.0, step = 10):
-    dataLen = len(data)
-    sectionNum = int(dataLen / step)
-    pos_downSampledPoint = numpy.zeros((1,3))
-    if abs(float(dataLen)/step - int(dataLen/step))< 1e-15 and sectionNum >=2: # we have received another section of data
-      pos_mean_pre = numpy.zeros((1,3))
-      pos_mean_pre[0,:] = numpy.array([numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step,0]), numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step, 1]), numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step, 2])])
-      pos_mean  = numpy.zeros((1,3))
-      pos_mean[0,:]  = numpy.array([numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 0]), numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 1]), numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 2])])
-      if numpy.linalg.norm(pos_mean - pos_mean_pre)>movementThreshold:
-        distance = -1e20
-        indexMax = 0
-        for indexInner in range(step):
-          pos1 = numpy.array(data[(sectionNum-1)*step+indexInner,:])
-          if numpy.linalg.norm(pos1-pos_mean_pre)>distance:
-            indexMax = indexInner
-            distance = numpy.linalg.norm(pos1-pos_mean_pre)
-        pos_downSampledPoint = data[(sectionNum-1)*step+indexMax,:]
-        return pos_downSampledPoint, True
-    return pos_downSampledPoint, False
+    return TrajectoryReconstructorLib.resampleDataRealTime(data, movementThreshold, step)
+
+  def sweepParameters(self, seqNode, processVariances, measurementVariances, movementThresholds, steps, processes = 1):
+    """
+    Reconstruct the trajectory recorded in a sequence node with every combination of the parameters,
+    see TrajectoryReconstructorLib.sweep.
+    :param processes: number of worker processes, the sweep runs in Slicer's process by default
+    :return: list of result dictionaries, one per combination
+    """
+    # the sweep module is the entry point of "python -m TrajectoryReconstructorLib.sweep", it isn't imported by the
+    # package so that runpy can run it as __main__
+    from TrajectoryReconstructorLib.sweep import sweepParameters
+    positions = self.updateSequenceSamples(seqNode).positions()
+    return sweepParameters(positions, processVariances, measurementVariances, movementThresholds, steps, processes)
 
+  def simplifyTrajectory(self, points, tolerance, maxNumOfPoints = None):
+    return TrajectoryReconstructorLib.simplifyTrajectory(points, tolerance, maxNumOfPoints)
+
+  def createTrajectoryPolyData(self, tube):
+    """
+    Build the tube model of a trajectory in one shot: the spline and the tube are computed with numpy,
+    and the arrays are passed to VTK at once. The arrays are copied, as the buffers of the tube are reused
+    when it grows.
+    :param tube: TubeBuilder of the resampled points
+    :return: vtkPolyData, empty if there are less than 2 points
+    """
+    polyData = vtk.vtkPolyData()
+    quads = tube.quads()
+    if len(quads) == 0:
+      return polyData
+    tubePoints = vtk.vtkPoints()
+    tubePoints.SetData(numpy_support.numpy_to_vtk(tube.vertices(), deep=True))
+    normals = numpy_support.numpy_to_vtk(tube.vertexNormals(), deep=True)
+    normals.SetName("Normals")
+    # legacy cell array layout: number of points of the cell followed by the point ids
+    cells = numpy.empty((len(quads), 5), dtype=numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE])
+    cells[:, 0] = 4
+    cells[:, 1:] = quads
+    polys = vtk.vtkCellArray()
+    polys.SetCells(len(quads), numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(), deep=True))
+    polyData.SetPoints(tubePoints)
+    polyData.SetPolys(polys)
+    polyData.GetPointData().SetNormals(normals)
+    return polyData
+
+  def appendTrajectoryPolyData(self, polyData, tube, firstRing, numOfOldRings):
+    """
+    Update a polydata built by createTrajectoryPolyData after points were appended to its tube. The vertices of the
+    rings that changed are overwritten in place and only the quads of the new rings are inserted.
+    :param polyData: vtkPolyData of the tube before the points were appended
+    :param tube: TubeBuilder, after the points were appended
+    :param firstRing: index of the first ring that changed, returned by TubeBuilder.append
+    :param numOfOldRings: number of rings before the points were appended
+    :return: None
+    """
+    first = firstRing * tube.numOfSides
+    numOfPoints = tube.numOfRings() * tube.numOfSides
+    tubePoints = polyData.GetPoints()
+    normals = polyData.GetPointData().GetNormals()
+    # VTK grows the arrays geometrically, the existing vertices are not copied at each update
+    tubePoints.SetNumberOfPoints(numOfPoints)
+    normals.SetNumberOfTuples(numOfPoints)
+    numpy_support.vtk_to_numpy(tubePoints.GetData())[first:] = tube.vertices()[first:]
+    numpy_support.vtk_to_numpy(normals)[first:] = tube.vertexNormals()[first:]
+    polys = polyData.GetPolys()
+    for quad in tube.quads(max(numOfOldRings - 1, 0)).tolist():
+      polys.InsertNextCell(4, quad)
+    tubePoints.Modified()
+    normals.Modified()
+    polys.Modified()
+    polyData.DeleteCells()
+    polyData.Modified()
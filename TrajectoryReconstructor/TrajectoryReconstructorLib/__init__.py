@@ -0,0 +1,30 @@
+"""
+Trajectory reconstruction core of the TrajectoryReconstructor module.
+Only depends on numpy, so it can be used without starting Slicer.
+"""
+from .buffer import SequenceSamples, TrajectoryBuffer
+from .cache import ReconstructionCache
+from .diagnostics import ReconstructionDiagnostics, formatDiagnosticsTable, profileCall
+from .geometry import TubeBuilder, catmullRomSpline, tubeMesh
+from .jobs import ReconstructionJob
+from .kalman import kalmanGainSequence, kalmanFilteredPoses, kalmanFilteredPosesRealTime, kalmanFilteredNewPoses, \
+  kalmanFilteredPosesBatch, kalmanFilteredNewPosesBatch
+from .latency import LatencyMonitor, formatLatencyTable
+from .registry import LocatorRecord, LocatorRegistry, TrajectoryRecord
+from .resampling import StreamingResampler, resampleData, resampleDataRealTime
+from .simplification import simplifiedIndexes, simplifyTrajectory
+from .streaming import StreamingRecorder
+from .tracking import TrackedTrajectory, removeDuplicatedPositions
+from .trackingbinary import isTrackingRecording, readTrackingRecording, writeTrackingRecording
+from .trackingcsv import parseTrackingCSV, readTrackingCSV, writeTrackingCSV, writeTrackingCSVHeader
+
+
+def readTrackingFile(fileName):
+  """
+  Read a tracking data file in the binary recording format or in the CSV format.
+  :param fileName: path of the file
+  :return: list of TrackedTrajectory
+  """
+  if isTrackingRecording(fileName):
+    return readTrackingRecording(fileName)
+  return readTrackingCSV(fileName)
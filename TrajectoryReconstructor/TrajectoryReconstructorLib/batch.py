@@ -0,0 +1,167 @@
+"""
+Command line batch reconstruction of tracking data files exported by the TrajectoryReconstructor module.
+Each trajectory of each file is filtered and resampled, and the resampled points are written next to the input
+file (or in the output directory) as <file name>_resampled.csv. The files are distributed over a process pool.
+Usage:
+  python -m TrajectoryReconstructorLib.batch [options] <directory or glob> [<directory or glob> ...]
+"""
+import argparse
+import csv
+import fnmatch
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+from .kalman import kalmanFilteredPosesBatch
+from .resampling import resampleData
+from .trackingcsv import readTrackingCSV
+
+OUTPUT_SUFFIX = "_resampled.csv"
+
+
+def findTrackingFiles(patterns, filePattern = "*.csv"):
+  """
+  Expand the directories and globs given on the command line.
+  :param patterns: list of directories, files or glob patterns
+  :param filePattern: pattern of the file names searched in the directories
+  :return: sorted list of file paths, without duplicates and without the outputs of previous runs
+  """
+  fileNames = set()
+  for pattern in patterns:
+    for path in (glob.glob(pattern) or [pattern]):
+      if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+          for name in fnmatch.filter(files, filePattern):
+            fileNames.add(os.path.join(root, name))
+      elif os.path.isfile(path):
+        fileNames.add(path)
+  return sorted(fileName for fileName in fileNames if not fileName.endswith(OUTPUT_SUFFIX))
+
+
+def outputFileName(fileName, outputDir = None):
+  baseName = os.path.splitext(os.path.basename(fileName))[0] + OUTPUT_SUFFIX
+  return os.path.join(outputDir if outputDir else os.path.dirname(fileName), baseName)
+
+
+def writeResampledCSV(fileName, trajectories, resampledPositions):
+  """
+  Write the resampled points of all the trajectories of a file, one point per row.
+  :param fileName: output path
+  :param trajectories: list of TrackedTrajectory
+  :param resampledPositions: list of (M, 3) float arrays, one per trajectory
+  :return: None
+  """
+  with open(fileName, 'w') as csvfile:
+    fileWriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    fileWriter.writerow(["Locator", "TrajectoryIndex", "X", "Y", "Z"])
+    for trajectory, positions in zip(trajectories, resampledPositions):
+      fileWriter.writerows([trajectory.locatorName, trajectory.trajectoryIndex] + pos for pos in positions.tolist())
+
+
+def reconstructFile(fileName, processVariance = 5e-5, measurementVariance = 0.0004, movementThreshold = 1.0,
+                    downSampleStepSize = 1, outputDir = None):
+  """
+  Filter and resample all the trajectories of one tracking data file and write the resampled points.
+  :return: dictionary with the file name, output file name, numbers of trajectories, samples and points,
+           elapsed time in seconds, and the error message if the file couldn't be processed
+  """
+  startTime = time.time()
+  result = {"fileName": fileName, "outputFileName": None, "trajectories": 0, "samples": 0, "points": 0,
+            "seconds": 0.0, "error": None}
+  try:
+    trajectories = readTrackingCSV(fileName)
+    resampledPositions = []
+    filteredData = kalmanFilteredPosesBatch([trajectory.positions for trajectory in trajectories],
+                                            processVariance, measurementVariance)
+    for trajectory, filteredPositions in zip(trajectories, filteredData):
+      resampledPositions.append(resampleData(filteredPositions, movementThreshold, downSampleStepSize))
+      result["samples"] = result["samples"] + len(trajectory.positions)
+      result["points"] = result["points"] + len(resampledPositions[-1])
+    result["trajectories"] = len(trajectories)
+    result["outputFileName"] = outputFileName(fileName, outputDir)
+    writeResampledCSV(result["outputFileName"], trajectories, resampledPositions)
+  except Exception as e:
+    result["error"] = str(e)
+  result["seconds"] = time.time() - startTime
+  return result
+
+
+def reconstructFileWithArgs(args):
+  return reconstructFile(*args)
+
+
+def reconstructFiles(fileNames, processVariance = 5e-5, measurementVariance = 0.0004, movementThreshold = 1.0,
+                     downSampleStepSize = 1, outputDir = None, processes = None, callback = None):
+  """
+  Reconstruct the files over a process pool.
+  :param fileNames: list of tracking data files
+  :param processes: number of worker processes, the number of cores if None. 1 runs in the calling process.
+  :param callback: called with the result dictionary of each file as soon as it is done
+  :return: list of result dictionaries, in completion order
+  """
+  tasks = [(fileName, processVariance, measurementVariance, movementThreshold, downSampleStepSize, outputDir)
+           for fileName in fileNames]
+  results = []
+  if processes == 1:
+    resultIterator = (reconstructFileWithArgs(task) for task in tasks)
+    pool = None
+  else:
+    pool = multiprocessing.Pool(processes)
+    resultIterator = pool.imap_unordered(reconstructFileWithArgs, tasks)
+  try:
+    for result in resultIterator:
+      results.append(result)
+      if callback:
+        callback(result)
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+  return results
+
+
+def printResult(result):
+  if result["error"]:
+    print("%s: failed (%s)" % (result["fileName"], result["error"]))
+  else:
+    samplesPerSecond = result["samples"] / result["seconds"] if result["seconds"] > 0 else float("inf")
+    print("%s: %d trajectories, %d samples -> %d points in %.3f s (%.0f samples/s)" % (
+      result["fileName"], result["trajectories"], result["samples"], result["points"], result["seconds"],
+      samplesPerSecond))
+  sys.stdout.flush()
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description="Reconstruct the trajectories of tracking data CSV files.")
+  parser.add_argument("inputs", nargs="+", help="tracking data files, directories or glob patterns")
+  parser.add_argument("-o", "--output-dir", default=None,
+                      help="directory of the resampled files, next to the input files by default")
+  parser.add_argument("-j", "--processes", type=int, default=None, help="number of worker processes")
+  parser.add_argument("--pattern", default="*.csv", help="file name pattern searched in the directories")
+  parser.add_argument("--process-variance", type=float, default=5e-5)
+  parser.add_argument("--measurement-variance", type=float, default=0.0004)
+  parser.add_argument("--movement-threshold", type=float, default=1.0, help="in millimeter")
+  parser.add_argument("--step", type=int, default=1, help="downsample window size")
+  args = parser.parse_args(argv)
+
+  fileNames = findTrackingFiles(args.inputs, args.pattern)
+  if not fileNames:
+    print("No tracking data file found.")
+    return 1
+  if args.output_dir and not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+  startTime = time.time()
+  results = reconstructFiles(fileNames, args.process_variance, args.measurement_variance, args.movement_threshold,
+                             args.step, args.output_dir, args.processes, printResult)
+  elapsed = time.time() - startTime
+  numOfSamples = sum(result["samples"] for result in results)
+  numOfFailures = len([result for result in results if result["error"]])
+  print("%d files, %d samples in %.3f s (%.0f samples/s), %d failed" % (
+    len(results), numOfSamples, elapsed, numOfSamples / elapsed if elapsed > 0 else float("inf"), numOfFailures))
+  return 1 if numOfFailures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Storage of the filtered positions of a trajectory and of the samples of a sequence node.
+"""
+import numpy
+
+
+class TrajectoryBuffer(object):
+  """
+  Growable Nx3 array for the filtered positions of one trajectory.
+  The storage capacity is doubled when it is full, so appending a position costs amortized O(1)
+  instead of copying the whole trajectory like numpy.insert does.
+  Rows with another number of values can be stored by setting the number of columns.
+  """
+
+  def __init__(self, data = None, capacity = 1024, columns = 3):
+    self.columns = columns
+    self._data = numpy.zeros((capacity, columns))
+    self._length = 0
+    if data is not None:
+      self.setData(data)
+
+  def __len__(self):
+    return self._length
+
+  def reserve(self, capacity):
+    """
+    Make sure the buffer can hold the given number of positions without reallocation.
+    :param capacity: number of positions
+    :return: None
+    """
+    if capacity > len(self._data):
+      newCapacity = max(capacity, 2 * len(self._data))
+      data = numpy.zeros((newCapacity, self.columns))
+      data[:self._length] = self._data[:self._length]
+      self._data = data
+
+  def append(self, pos):
+    """
+    Append one position at the end of the trajectory
+    :param pos: position [x, y, z]
+    :return: None
+    """
+    self.reserve(self._length + 1)
+    self._data[self._length] = pos
+    self._length = self._length + 1
+
+  def extend(self, positions):
+    """
+    Append several positions at the end of the trajectory
+    :param positions: (N, 3) float array of positions
+    :return: None
+    """
+    positions = numpy.asarray(positions, dtype=float).reshape(-1, self.columns)
+    self.reserve(self._length + len(positions))
+    self._data[self._length:self._length + len(positions)] = positions
+    self._length = self._length + len(positions)
+
+  def setData(self, data):
+    """
+    Replace the content of the buffer
+    :param data: (N, 3) float array of positions
+    :return: None
+    """
+    self._length = 0
+    self.extend(data)
+
+  def clear(self):
+    self._length = 0
+
+  def truncate(self, length):
+    """
+    Keep the first rows of the buffer
+    :param length: number of rows to keep
+    :return: None
+    """
+    self._length = max(min(length, self._length), 0)
+
+  def array(self):
+    """
+    :return: (N, 3) view of the stored positions, valid until the next reallocation of the buffer.
+    """
+    return self._data[:self._length]
+
+
+class SequenceSamples(object):
+  """
+  Time stamps and positions of the samples of a sequence node, in the order of the sequence.
+  The index values of the first and the last stored samples are kept, so that an edit of the sequence
+  can be told apart from samples appended at its end.
+  """
+
+  def __init__(self):
+    self._samples = TrajectoryBuffer(columns = 4)
+    self.firstIndexValue = None
+    self.lastIndexValue = None
+
+  def __len__(self):
+    return len(self._samples)
+
+  def isPrefixOf(self, firstIndexValue, lastIndexValue):
+    """
+    :param firstIndexValue: current index value of the first sample of the sequence
+    :param lastIndexValue: current index value of the sample of the sequence at the position of the last stored sample
+    :return: True if the stored samples are still the beginning of the sequence
+    """
+    return firstIndexValue == self.firstIndexValue and lastIndexValue == self.lastIndexValue
+
+  def extend(self, timeStamps, positions, firstIndexValue, lastIndexValue):
+    """
+    Append samples read from the sequence
+    :param timeStamps: (N,) float array
+    :param positions: (N, 3) float array
+    :param firstIndexValue: index value of the first sample of the sequence
+    :param lastIndexValue: index value of the last appended sample
+    :return: None
+    """
+    samples = numpy.empty((len(timeStamps), 4))
+    samples[:, 0] = timeStamps
+    samples[:, 1:] = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+    self._samples.extend(samples)
+    self.firstIndexValue = firstIndexValue
+    self.lastIndexValue = lastIndexValue
+
+  def clear(self):
+    self._samples.clear()
+    self.firstIndexValue = None
+    self.lastIndexValue = None
+
+  def timeStamps(self):
+    """
+    :return: (N,) view of the time stamps, valid until the samples are updated
+    """
+    return self._samples.array()[:, 0]
+
+  def positions(self):
+    """
+    :return: (N, 3) view of the positions, valid until the samples are updated
+    """
+    return self._samples.array()[:, 1:]
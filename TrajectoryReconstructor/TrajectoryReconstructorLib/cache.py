@@ -0,0 +1,130 @@
+"""
+Disk cache of the reconstructed trajectories. An entry holds the filtered positions and the resampled points of a
+trajectory, its key is a hash of the recorded samples and of the algorithm parameters, so an entry is never
+out of date. The least recently used entries are removed when the cache grows larger than its maximum size.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy
+
+FILE_EXTENSION = ".npz"
+# entries being written, they are neither counted in the size of the cache nor evicted
+TEMPORARY_FILE_EXTENSION = ".tmp"
+
+
+class ReconstructionCache(object):
+
+  def __init__(self, directory, maxSize = 256 * 1024 * 1024):
+    """
+    :param directory: directory of the cache files, created if it doesn't exist
+    :param maxSize: maximum total size of the cache files, in bytes
+    """
+    self.directory = directory
+    self.maxSize = maxSize
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def key(self, timeStamps, positions, processVariance, measurementVariance, movementThreshold, step):
+    """
+    :param timeStamps: (N,) float array of the time stamps of the samples
+    :param positions: (N, 3) float array of the recorded positions
+    :return: hexadecimal hash of the samples and of the parameters
+    """
+    contentHash = hashlib.sha1()
+    contentHash.update(numpy.ascontiguousarray(timeStamps, dtype=float).tobytes())
+    contentHash.update(numpy.ascontiguousarray(positions, dtype=float).tobytes())
+    contentHash.update(repr((float(processVariance), float(measurementVariance), float(movementThreshold),
+                             int(step))).encode())
+    return contentHash.hexdigest()
+
+  def fileName(self, key):
+    return os.path.join(self.directory, key + FILE_EXTENSION)
+
+  def get(self, key):
+    """
+    :param key: key returned by ReconstructionCache.key
+    :return: (filteredData, points) float arrays, None if the entry isn't in the cache
+    """
+    fileName = self.fileName(key)
+    try:
+      with numpy.load(fileName) as entry:
+        filteredData, points = entry["filteredData"], entry["points"]
+      # the modification time orders the entries for the eviction
+      os.utime(fileName, None)
+    except (IOError, OSError, KeyError, ValueError):
+      if os.path.exists(fileName):
+        self.remove(key)
+      return None
+    return filteredData, points
+
+  def put(self, key, filteredData, points):
+    """
+    Store an entry, then remove the least recently used entries if the cache is too large.
+    :param key: key returned by ReconstructionCache.key
+    :param filteredData: (N, 3) float array of the filtered positions
+    :param points: (M, 3) float array of the resampled points
+    :return: True if the entry was stored
+    """
+    # write to a temporary file first, a reader never sees a partial entry
+    fileHandle, temporaryName = tempfile.mkstemp(suffix=TEMPORARY_FILE_EXTENSION, prefix=".", dir=self.directory)
+    try:
+      with os.fdopen(fileHandle, 'wb') as entryFile:
+        numpy.savez(entryFile, filteredData=numpy.asarray(filteredData, dtype=float),
+                    points=numpy.asarray(points, dtype=float))
+      os.replace(temporaryName, self.fileName(key))
+    except (IOError, OSError):
+      if os.path.exists(temporaryName):
+        os.remove(temporaryName)
+      return False
+    self.evict()
+    return True
+
+  def remove(self, key):
+    try:
+      os.remove(self.fileName(key))
+    except OSError:
+      pass
+
+  def entries(self):
+    """
+    :return: list of (modification time, size, file name) of the cache files, least recently used first. The
+             temporary files of the entries being written are not listed.
+    """
+    entries = []
+    for name in os.listdir(self.directory):
+      if name.endswith(FILE_EXTENSION):
+        fileName = os.path.join(self.directory, name)
+        try:
+          status = os.stat(fileName)
+        except OSError:
+          continue
+        entries.append((status.st_mtime, status.st_size, fileName))
+    return sorted(entries)
+
+  def size(self):
+    return sum(size for mtime, size, fileName in self.entries())
+
+  def evict(self):
+    """
+    Remove the least recently used entries until the cache isn't larger than maxSize.
+    :return: None
+    """
+    entries = self.entries()
+    totalSize = sum(size for mtime, size, fileName in entries)
+    for mtime, size, fileName in entries:
+      if totalSize <= self.maxSize:
+        break
+      try:
+        os.remove(fileName)
+        totalSize = totalSize - size
+      except OSError:
+        pass
+
+  def clear(self):
+    for mtime, size, fileName in self.entries():
+      try:
+        os.remove(fileName)
+      except OSError:
+        pass
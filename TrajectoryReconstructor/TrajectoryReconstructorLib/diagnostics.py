@@ -0,0 +1,173 @@
+"""
+Timings of the stages of the trajectory reconstruction, by locator and trajectory. Each stage keeps the number of
+calls, the cumulative time and the time of its last call, separately for the reconstruction of whole trajectories
+and for the real-time reconstruction. A stage processed for several trajectories at once, like the batched Kalman
+filter, is timed once and its time is shared among the trajectories in proportion to their number of samples.
+The latencies of the real-time reconstruction are kept by a LatencyMonitor, see latency.py.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+
+from .latency import LatencyMonitor
+
+# reconstruction of whole trajectories and real-time reconstruction of the recorded trajectories
+PATHS = ["reconstruction", "realTime"]
+# reading the samples of the sequence node, reconstruction cache lookup, Kalman filter, resampling,
+# markups update while the trajectory is edited, and tube model or CurveMaker update
+STAGES = ["samples", "cache", "filter", "resample", "markups", "model"]
+
+
+class StageStatistics(object):
+
+  def __init__(self):
+    self.calls = 0
+    self.totalSeconds = 0.0
+    self.lastSeconds = 0.0
+
+  def add(self, seconds):
+    self.calls += 1
+    self.totalSeconds += seconds
+    self.lastSeconds = seconds
+
+  def toDict(self):
+    return {"calls": self.calls, "totalSeconds": self.totalSeconds, "lastSeconds": self.lastSeconds}
+
+
+class TrajectoryDiagnostics(object):
+  """
+  Stage statistics of one trajectory, with its numbers of samples and of resampled points after its last update
+  """
+
+  def __init__(self, locatorIndex, trajectoryIndex):
+    self.locatorIndex = locatorIndex
+    self.trajectoryIndex = trajectoryIndex
+    self.numOfSamples = 0
+    self.numOfPoints = 0
+    self.stages = dict((path, dict((stage, StageStatistics()) for stage in STAGES)) for path in PATHS)
+
+  def toDict(self):
+    return {"locatorIndex": self.locatorIndex, "trajectoryIndex": self.trajectoryIndex,
+            "samples": self.numOfSamples, "points": self.numOfPoints,
+            "stages": dict((path, dict((stage, statistics.toDict()) for stage, statistics in stages.items()))
+                           for path, stages in self.stages.items())}
+
+
+class ReconstructionDiagnostics(object):
+  """
+  Stage statistics of all the trajectories, the trajectories are given as objects with locatorIndex and
+  trajectoryIndex attributes. The statistics can be updated from worker threads.
+  """
+
+  def __init__(self):
+    self._trajectories = {}
+    self._lock = threading.Lock()
+    # text of the last profile, see profileCall
+    self.profile = ""
+    self.latency = LatencyMonitor()
+
+  def clear(self):
+    with self._lock:
+      self._trajectories.clear()
+      self.profile = ""
+    self.latency.clear()
+
+  def _trajectory(self, trajectory):
+    key = (trajectory.locatorIndex, trajectory.trajectoryIndex)
+    diagnostics = self._trajectories.get(key)
+    if diagnostics is None:
+      diagnostics = TrajectoryDiagnostics(*key)
+      self._trajectories[key] = diagnostics
+    return diagnostics
+
+  def trajectories(self):
+    """
+    :return: list of TrajectoryDiagnostics, ordered by locator index and trajectory index
+    """
+    with self._lock:
+      return [self._trajectories[key] for key in sorted(self._trajectories)]
+
+  def addStageTime(self, path, stage, trajectories, seconds, weights = None):
+    """
+    :param path: "reconstruction" or "realTime"
+    :param stage: name of the stage, see STAGES
+    :param trajectories: trajectories processed by the stage, the ones that are None are not timed
+    :param seconds: time of the stage
+    :param weights: the time is shared among the trajectories in proportion to their weights, equally if None
+    :return: None
+    """
+    if len(trajectories) == 0:
+      return
+    if weights is None or sum(weights) <= 0:
+      weights = [1] * len(trajectories)
+    totalWeight = float(sum(weights))
+    with self._lock:
+      for trajectory, weight in zip(trajectories, weights):
+        if trajectory is not None:
+          self._trajectory(trajectory).stages[path][stage].add(seconds * weight / totalWeight)
+
+  @contextlib.contextmanager
+  def measure(self, path, stage, trajectories, weights = None):
+    """
+    Time the statements of a with block as a stage of the trajectories, see addStageTime
+    """
+    startTime = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.addStageTime(path, stage, trajectories, time.perf_counter() - startTime, weights)
+
+  def setCounts(self, trajectory, numOfSamples, numOfPoints):
+    with self._lock:
+      diagnostics = self._trajectory(trajectory)
+      diagnostics.numOfSamples = numOfSamples
+      diagnostics.numOfPoints = numOfPoints
+
+  def toDict(self):
+    return {"stages": STAGES, "trajectories": [diagnostics.toDict() for diagnostics in self.trajectories()],
+            "latency": self.latency.toDict(), "profile": self.profile}
+
+  def writeJSON(self, fileName):
+    with open(fileName, 'w') as outputFile:
+      json.dump(self.toDict(), outputFile, indent=2)
+
+
+def formatDiagnosticsTable(diagnostics, cumulative = False):
+  """
+  :param diagnostics: ReconstructionDiagnostics
+  :param cumulative: show the cumulative times in seconds instead of the times of the last calls in milliseconds
+  :return: the statistics as a text table, one line per trajectory and path that was timed
+  """
+  lines = ["%7s %10s %14s %6s %9s %7s" % ("Locator", "Trajectory", "Path", "Calls", "Samples", "Points") +
+           "".join(" %9s" % stage for stage in STAGES)]
+  for trajectory in diagnostics.trajectories():
+    for path in PATHS:
+      stages = trajectory.stages[path]
+      calls = max(statistics.calls for statistics in stages.values())
+      if calls == 0:
+        continue
+      if cumulative:
+        times = ["%9.3f" % stages[stage].totalSeconds for stage in STAGES]
+      else:
+        times = ["%9.2f" % (1000.0 * stages[stage].lastSeconds) for stage in STAGES]
+      lines.append("%7d %10d %14s %6d %9d %7d " % (trajectory.locatorIndex, trajectory.trajectoryIndex, path, calls,
+                                                   trajectory.numOfSamples, trajectory.numOfPoints) + " ".join(times))
+  return "\n".join(lines)
+
+
+def profileCall(function, *args, **kwargs):
+  """
+  Run a function with cProfile
+  :param numOfLines: keyword only, number of functions in the profile text, 30 by default
+  :return: (result, profile), the result of the function and the profile text sorted by cumulative time
+  """
+  numOfLines = kwargs.pop("numOfLines", 30)
+  profiler = cProfile.Profile()
+  result = profiler.runcall(function, *args, **kwargs)
+  stream = io.StringIO()
+  pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(numOfLines)
+  return result, stream.getvalue()
@@ -0,0 +1,305 @@
+"""
+Geometry of the displayed trajectories, computed with numpy so that the model polydata can be filled in one shot.
+The resampled points are interpolated with a uniform Catmull-Rom spline, which only depends on the neighbouring
+points, and a tube is swept along the interpolated line with rotation minimizing frames.
+Both are local, so TubeBuilder only recomputes the end of the tube when points are appended to a live trajectory.
+"""
+import numpy
+
+from .buffer import TrajectoryBuffer
+
+
+def catmullRomSpline(points, numOfSubdivisions = 10):
+  """
+  Interpolate points with a uniform Catmull-Rom spline, a cardinal spline with tension 0.
+  The curve goes through all the points, the end tangents use reflected phantom points.
+  :param points: (N, 3) float array of points
+  :param numOfSubdivisions: number of interpolated points per segment
+  :return: ((N-1) * numOfSubdivisions + 1, 3) float array, the points themselves if N < 3
+  """
+  points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+  if len(points) < 3 or numOfSubdivisions < 2:
+    return points.copy()
+  return catmullRomSegments(points, 0, numOfSubdivisions)
+
+
+def catmullRomSegments(points, firstSegment, numOfSubdivisions = 10):
+  """
+  Interpolate the end of a Catmull-Rom spline, from the segment that starts at points[firstSegment].
+  Only points[firstSegment-1:] are read.
+  :param points: (N, 3) float array of points, N >= 3
+  :param firstSegment: index of the first interpolated segment
+  :param numOfSubdivisions: number of interpolated points per segment
+  :return: ((N-1-firstSegment) * numOfSubdivisions + 1, 3) float array, the rows of catmullRomSpline(points)
+           from firstSegment * numOfSubdivisions
+  """
+  start = max(firstSegment - 1, 0)
+  controls = [points[start:], 2 * points[-1:] - points[-2:-1]]
+  if firstSegment == 0:
+    controls.insert(0, 2 * points[:1] - points[1:2])
+  padded = numpy.concatenate(controls)
+  t = numpy.arange(numOfSubdivisions) / float(numOfSubdivisions)
+  # Catmull-Rom basis, weights of P[i-1], P[i], P[i+1] and P[i+2] for each t
+  basis = 0.5 * numpy.array([-t ** 3 + 2 * t ** 2 - t,
+                             3 * t ** 3 - 5 * t ** 2 + 2,
+                             -3 * t ** 3 + 4 * t ** 2 + t,
+                             t ** 3 - t ** 2]).T
+  numOfSegments = len(points) - 1 - firstSegment
+  controls = numpy.stack([padded[0:numOfSegments], padded[1:numOfSegments + 1],
+                          padded[2:numOfSegments + 2], padded[3:numOfSegments + 3]], axis=1)
+  curve = numpy.einsum('tk,skd->std', basis, controls).reshape(-1, 3)
+  return numpy.concatenate([curve, points[-1:]])
+
+
+def curveTangents(centerline):
+  """
+  :param centerline: (M, 3) float array
+  :return: (M, 3) unit tangents, central differences inside the line. The tangent of a repeated point is the one of
+           the previous point.
+  """
+  centerline = numpy.asarray(centerline, dtype=float)
+  tangents = numpy.zeros_like(centerline)
+  if len(centerline) < 2:
+    tangents[:, 2] = 1.0
+    return tangents
+  tangents[1:-1] = centerline[2:] - centerline[:-2]
+  tangents[0] = centerline[1] - centerline[0]
+  tangents[-1] = centerline[-1] - centerline[-2]
+  lengths = numpy.linalg.norm(tangents, axis=1)
+  valid = lengths > 1e-12
+  tangents[valid] /= lengths[valid, None]
+  if not valid.all():
+    validIndexes = numpy.nonzero(valid)[0]
+    if len(validIndexes) == 0:
+      tangents[:] = [0.0, 0.0, 1.0]
+      return tangents
+    previous = numpy.maximum.accumulate(numpy.where(valid, numpy.arange(len(valid)), -1))
+    previous[previous < 0] = validIndexes[0]
+    tangents = tangents[previous]
+  return tangents
+
+
+def initialNormal(tangent):
+  """
+  :return: a unit vector orthogonal to the tangent
+  """
+  axis = numpy.zeros(3)
+  axis[numpy.argmin(numpy.abs(tangent))] = 1.0
+  normal = axis - numpy.dot(axis, tangent) * tangent
+  return normal / numpy.linalg.norm(normal)
+
+
+def reflectionScales(vectors):
+  """
+  :param vectors: (M, 3) float array
+  :return: (M,) float array of 2 / |v|^2, the reflection across the plane orthogonal to v is I - 2 / |v|^2 * v v^T.
+           0 for the null vectors, whose reflection is the identity.
+  """
+  squaredLengths = numpy.einsum('ij,ij->i', vectors, vectors)
+  scales = numpy.zeros_like(squaredLengths)
+  valid = squaredLengths > 1e-24
+  scales[valid] = 2.0 / squaredLengths[valid]
+  return scales
+
+
+def transformVectors(matrices, vector, blockSize = 32):
+  """
+  Compute v[k] = matrices[k] * v[k-1] for all k with v[-1] = vector, without looping over the matrices.
+  The matrices are split in blocks, the products of the first matrices of each block are computed for all the
+  blocks at once, and the vectors carried from one block to the next follow the same recurrence with the product
+  of all the matrices of a block.
+  :param matrices: (M, 3, 3) float array
+  :param vector: (3,) float array
+  :param blockSize: number of matrices of each block
+  :return: (M, 3) float array
+  """
+  totalLen = len(matrices)
+  blockSize = max(min(blockSize, totalLen), 1)
+  nBlocks = -(-totalLen // blockSize)
+  padded = numpy.empty((nBlocks * blockSize, 3, 3))
+  padded[:totalLen] = matrices
+  padded[totalLen:] = numpy.eye(3)
+  # products[k, b] is the product of the first k+1 matrices of block b, the blocks are contiguous for each k
+  products = numpy.ascontiguousarray(padded.reshape(nBlocks, blockSize, 3, 3).transpose(1, 0, 2, 3))
+  for k in range(1, blockSize):
+    numpy.matmul(products[k], products[k-1], out=products[k])
+  if nBlocks > 1:
+    carried = transformVectors(products[-1], vector, blockSize)
+    blockStart = numpy.concatenate([vector[None], carried[:-1]])
+  else:
+    blockStart = vector[None]
+  return numpy.einsum('kbij,bj->bki', products, blockStart).reshape(-1, 3)[:totalLen]
+
+
+def transportNormals(centerline, tangents, normal):
+  """
+  Propagate a normal along a line with the double reflection method of Wang et al. (2008), which approximates a
+  rotation minimizing frame. The frame of a point is reflected across the bisecting plane of the segment to the
+  next point, then across the plane that maps the reflected tangent onto the next tangent. The reflections only
+  depend on the points and the tangents, so the normals are the products of the reflections applied to the first
+  normal, computed with transformVectors.
+  :param centerline: (M, 3) float array
+  :param tangents: (M, 3) unit tangents
+  :param normal: unit normal at the first point, orthogonal to tangents[0]
+  :return: (M, 3) unit normals, the first one is normal
+  """
+  normals = numpy.empty((len(tangents), 3))
+  normals[0] = normal
+  if len(tangents) > 1:
+    segments = centerline[1:] - centerline[:-1]
+    segmentScales = reflectionScales(segments)
+    reflectedTangents = tangents[:-1] - (segmentScales * numpy.einsum('ij,ij->i', segments, tangents[:-1]))[:, None] * \
+                        segments
+    differences = tangents[1:] - reflectedTangents
+    differenceScales = reflectionScales(differences)
+    # (I - b d d^T) (I - a s s^T) = I - a s s^T - b d d^T + a b (d.s) d s^T
+    steps = -segmentScales[:, None, None] * segments[:, :, None] * segments[:, None, :]
+    steps -= differenceScales[:, None, None] * differences[:, :, None] * differences[:, None, :]
+    steps += (segmentScales * differenceScales * numpy.einsum('ij,ij->i', differences, segments))[:, None, None] * \
+             differences[:, :, None] * segments[:, None, :]
+    steps[:, [0, 1, 2], [0, 1, 2]] += 1.0
+    normals[1:] = transformVectors(steps, numpy.asarray(normal, dtype=float))
+    # remove the rounding errors accumulated by the products of the reflections
+    normals[1:] -= numpy.einsum('ij,ij->i', normals[1:], tangents[1:])[:, None] * tangents[1:]
+    normals[1:] /= numpy.linalg.norm(normals[1:], axis=1)[:, None]
+  return normals
+
+
+def tubeRings(centerline, tangents, normals, radius, numOfSides):
+  """
+  :return: (vertices, vertexNormals), (M * numOfSides, 3) float arrays, ring by ring
+  """
+  binormals = numpy.cross(tangents, normals)
+  angles = 2 * numpy.pi * numpy.arange(numOfSides) / float(numOfSides)
+  directions = numpy.cos(angles)[None, :, None] * normals[:, None, :] + \
+               numpy.sin(angles)[None, :, None] * binormals[:, None, :]
+  vertices = centerline[:, None, :] + radius * directions
+  return vertices.reshape(-1, 3), directions.reshape(-1, 3)
+
+
+def tubeQuads(firstRing, numOfRings, numOfSides):
+  """
+  :param firstRing: index of the first ring
+  :param numOfRings: number of rings, numOfRings - 1 bands of quads are returned
+  :return: (max(numOfRings - 1, 0) * numOfSides, 4) integer array of vertex indices
+  """
+  if numOfRings < 2:
+    return numpy.zeros((0, 4), dtype=numpy.int64)
+  ring = numpy.arange(firstRing, firstRing + numOfRings - 1)[:, None] * numOfSides
+  side = numpy.arange(numOfSides)[None, :]
+  nextSide = (side + 1) % numOfSides
+  quads = numpy.stack([ring + side, ring + nextSide, ring + numOfSides + nextSide, ring + numOfSides + side], axis=2)
+  return quads.reshape(-1, 4)
+
+
+def tubeMesh(centerline, radius = 0.5, numOfSides = 12):
+  """
+  Sweep a tube along a line.
+  :param centerline: (M, 3) float array
+  :param radius: tube radius, in millimeter
+  :param numOfSides: number of vertices of each ring
+  :return: (vertices, vertexNormals, quads), (M * numOfSides, 3) float arrays and (K, 4) integer array.
+           Empty arrays if the line has less than 2 points.
+  """
+  centerline = numpy.asarray(centerline, dtype=float).reshape(-1, 3)
+  if len(centerline) < 2:
+    return numpy.zeros((0, 3)), numpy.zeros((0, 3)), numpy.zeros((0, 4), dtype=numpy.int64)
+  tangents = curveTangents(centerline)
+  normals = transportNormals(centerline, tangents, initialNormal(tangents[0]))
+  vertices, vertexNormals = tubeRings(centerline, tangents, normals, radius, numOfSides)
+  return vertices, vertexNormals, tubeQuads(0, len(centerline), numOfSides)
+
+
+class TubeBuilder(object):
+  """
+  Tube of a trajectory that grows at its end. Appending points only recomputes the spline segment that ended at
+  the previous last point, the new segments, and their rings, so the cost of an update doesn't depend on the length
+  of the trajectory. The result is the same as tubeMesh(catmullRomSpline(points)).
+  """
+
+  def __init__(self, radius = 0.5, numOfSides = 12, numOfSubdivisions = 10):
+    self.radius = radius
+    self.numOfSides = numOfSides
+    self.numOfSubdivisions = numOfSubdivisions
+    self._points = TrajectoryBuffer()
+    self._centerline = TrajectoryBuffer()
+    self._normals = TrajectoryBuffer()
+    self._vertices = TrajectoryBuffer()
+    self._vertexNormals = TrajectoryBuffer()
+
+  def __len__(self):
+    return len(self._points)
+
+  def clear(self):
+    for buffer in [self._points, self._centerline, self._normals, self._vertices, self._vertexNormals]:
+      buffer.clear()
+
+  def setPoints(self, points):
+    """
+    Rebuild the whole tube
+    :param points: (N, 3) float array of the points of the trajectory
+    :return: None
+    """
+    self.clear()
+    self.append(points)
+
+  def append(self, points):
+    """
+    Append points at the end of the trajectory.
+    :param points: (K, 3) float array of new points
+    :return: index of the first ring that changed, the rings before it and the quads between them are unchanged
+    """
+    numOfOldPoints = len(self._points)
+    self._points.extend(points)
+    allPoints = self._points.array()
+    if numOfOldPoints < 3 or self.numOfSubdivisions < 2:
+      firstRing = 0
+      centerline = catmullRomSpline(allPoints, self.numOfSubdivisions)
+    else:
+      # the segment ending at the previous last point used a phantom point instead of the new ones
+      firstRing = (numOfOldPoints - 2) * self.numOfSubdivisions
+      centerline = catmullRomSegments(allPoints, numOfOldPoints - 2, self.numOfSubdivisions)
+    self._centerline.truncate(firstRing)
+    self._centerline.extend(centerline)
+    self._updateRings(firstRing)
+    return firstRing
+
+  def _updateRings(self, firstRing):
+    centerline = self._centerline.array()
+    self._normals.truncate(firstRing)
+    self._vertices.truncate(firstRing * self.numOfSides)
+    self._vertexNormals.truncate(firstRing * self.numOfSides)
+    if len(centerline) < 2:
+      return
+    if firstRing == 0:
+      tangents = curveTangents(centerline)
+      normals = transportNormals(centerline, tangents, initialNormal(tangents[0]))
+    else:
+      # the tangent of a ring depends on its neighbours, the two rings before the changed ones only depend on
+      # unchanged points, the normals are transported from the previous ring
+      tangents = curveTangents(centerline[firstRing - 2:])[1:]
+      normals = transportNormals(centerline[firstRing - 1:], tangents, self._normals.array()[firstRing - 1])[1:]
+      tangents = tangents[1:]
+    vertices, vertexNormals = tubeRings(centerline[firstRing:], tangents, normals, self.radius, self.numOfSides)
+    self._normals.extend(normals)
+    self._vertices.extend(vertices)
+    self._vertexNormals.extend(vertexNormals)
+
+  def numOfRings(self):
+    return len(self._normals)
+
+  def vertices(self):
+    """
+    :return: (numOfRings * numOfSides, 3) view of the vertices, ring by ring
+    """
+    return self._vertices.array()
+
+  def vertexNormals(self):
+    return self._vertexNormals.array()
+
+  def quads(self, firstBand = 0):
+    """
+    :param firstBand: index of the first ring of the first returned band of quads
+    :return: (K, 4) integer array of vertex indices of the quads from firstBand to the end of the tube
+    """
+    return tubeQuads(firstBand, self.numOfRings() - firstBand, self.numOfSides)
@@ -0,0 +1,54 @@
+"""
+Reconstruction of several trajectories on a thread pool. The filtering and resampling run in numpy, which releases
+the GIL on the large array operations, while the caller keeps its event loop running and polls the finished
+trajectories to update their display.
+"""
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReconstructionJob(object):
+
+  def __init__(self, function, tasks, workers = None):
+    """
+    Start the tasks on a thread pool.
+    :param function: function called in the worker threads, it must not access the MRML scene or the GUI
+    :param tasks: list of (key, args), function(*args) is called for each task
+    :param workers: number of threads, the number of cores if None
+    """
+    self._executor = ThreadPoolExecutor(max_workers=workers or multiprocessing.cpu_count())
+    self._pending = [(key, self._executor.submit(function, *args)) for key, args in tasks]
+    self.numOfTasks = len(tasks)
+    self.numOfCompletedTasks = 0
+    self.cancelled = False
+    # no more tasks will be submitted, the threads exit when the queue is empty
+    self._executor.shutdown(wait=False)
+
+  def takeCompleted(self):
+    """
+    Get the results of the tasks completed since the previous call.
+    :return: list of (key, result, error), error is the exception raised by the task or None
+    """
+    completed = []
+    pending = []
+    for key, future in self._pending:
+      if future.done():
+        if not future.cancelled():
+          completed.append((key, None, future.exception()) if future.exception() else (key, future.result(), None))
+      else:
+        pending.append((key, future))
+    self._pending = pending
+    self.numOfCompletedTasks = self.numOfTasks - len(pending)
+    return [] if self.cancelled else completed
+
+  def isFinished(self):
+    return len(self._pending) == 0
+
+  def cancel(self):
+    """
+    Cancel the tasks that didn't start, the results of the running ones are discarded.
+    :return: None
+    """
+    self.cancelled = True
+    for key, future in self._pending:
+      future.cancel()
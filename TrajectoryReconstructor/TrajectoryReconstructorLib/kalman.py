@@ -0,0 +1,240 @@
+"""
+Kalman filtering of tracked positions with a constant position model.
+Each axis is filtered independently with the same process and measurement variances.
+"""
+import numpy
+
+
+def kalmanGainSequence(Q, R, maxLen, pCov = 1.0):
+  """
+  Compute the Kalman gain sequence of the constant position model. The gains only depend on Q, R and the initial
+  covariance, not on the measurements, so they can be computed once and applied to all the axes.
+  The sequence stops as soon as the gain has converged to its steady state value. Without process noise (Q = 0) the
+  gain decreases towards 0 and never converges, the whole sequence is then given by its closed form
+  K[k] = pCov / (R + k * pCov).
+  :param Q: process variance
+  :param R: measurement variance
+  :param maxLen: maximum number of gains to compute, normally the number of samples
+  :param pCov: initial estimate covariance
+  :return: (gains, steadyStateGain). gains[0] is 1.0 as the first sample is taken as the initial estimate.
+           steadyStateGain is None if the gain didn't converge within maxLen samples.
+  """
+  if Q == 0:
+    # 1/P grows by 1/R at each sample
+    gains = pCov / (R + pCov * numpy.arange(max(maxLen, 1), dtype=float))
+    gains[0] = 1.0
+    return gains, None
+  gains = [1.0]
+  tolerance = 4 * numpy.finfo(float).eps
+  while len(gains) < maxLen:
+    Pminus = pCov + Q
+    K = Pminus / (Pminus + R)
+    pCov = (1 - K) * Pminus
+    if abs(K - gains[-1]) <= tolerance * K:
+      return numpy.array(gains), K
+    gains.append(K)
+  return numpy.array(gains), None
+
+
+def solveLinearRecurrence(a, u, x0, blockSize = 32):
+  """
+  Solve x[:, k] = a * x[:, k-1] + u[:, k] for all k with x[:, -1] = x0, without looping over the samples.
+  The samples are split in blocks, each block is solved by one matrix product with the lower triangular matrix
+  of the powers of a, and the states carried from one block to the next follow the same recurrence with a**blockSize.
+  :param a: constant recurrence coefficient, 0 <= a <= 1
+  :param u: input array of shape (nAxes, N)
+  :param x0: state before the first sample, shape (nAxes,)
+  :param blockSize: number of samples solved by each matrix product
+  :return: array of shape (nAxes, N)
+  """
+  nAxes, totalLen = u.shape
+  nBlocks = -(-totalLen // blockSize)
+  if nBlocks * blockSize != totalLen:
+    u = numpy.concatenate([u, numpy.zeros((nAxes, nBlocks * blockSize - totalLen))], axis=1)
+  powers = a ** numpy.arange(blockSize + 1)
+  lags = numpy.subtract.outer(numpy.arange(blockSize), numpy.arange(blockSize))
+  transition = numpy.where(lags >= 0, powers[numpy.maximum(lags, 0)], 0.0)
+  x = numpy.dot(u.reshape(nAxes * nBlocks, blockSize), transition.T).reshape(nAxes, nBlocks, blockSize)
+  if nBlocks > 1:
+    carried = solveLinearRecurrence(powers[blockSize], x[:, :, -1], x0, blockSize)
+    blockStart = numpy.concatenate([x0[:, None], carried[:, :-1]], axis=1)
+  else:
+    blockStart = x0[:, None]
+  x += blockStart[:, :, None] * powers[1:]
+  return x.reshape(nAxes, nBlocks * blockSize)[:, :totalLen]
+
+
+def kalmanFilteredPosesWithoutProcessNoise(measurements, R, pCov = 1.0):
+  """
+  Filter a whole trajectory with Q = 0. The estimate is then the weighted mean of the first sample, with a weight
+  of 1/pCov, and of the following samples so far, each with a weight of 1/R.
+  :param measurements: (N, 3) float array of positions, N > 0
+  :param R: measurement variance
+  :param pCov: initial estimate covariance
+  :return: (N, 3) float array of filtered positions
+  """
+  filteredData = numpy.empty_like(measurements)
+  filteredData[0] = 0.0
+  numpy.cumsum(measurements[1:], axis=0, out=filteredData[1:])
+  filteredData *= pCov
+  filteredData += R * measurements[0]
+  filteredData /= (R + pCov * numpy.arange(len(measurements), dtype=float))[:, None]
+  return filteredData
+
+
+def kalmanFilteredPoses(posAll, Q = 1e-5, R = 0.02**2):
+  """
+  Filter a whole trajectory. The first sample is taken as the initial estimate with a covariance of 1.0.
+  :param posAll: (N, 3) float array or list of positions
+  :param Q: process variance
+  :param R: measurement variance
+  :return: (N, 3) float array of filtered positions
+  """
+  measurements = numpy.asarray(posAll, dtype=float)
+  totalLen = len(measurements)
+  filteredData = numpy.zeros((totalLen,3))
+  if totalLen == 0:
+    return filteredData
+  if Q == 0:
+    return kalmanFilteredPosesWithoutProcessNoise(measurements, R)
+  gains, steadyStateGain = kalmanGainSequence(Q, R, totalLen)
+  # the gain is still changing during the first samples, filter them one by one, all axes at once
+  filteredData[0] = measurements[0]
+  for k in range(1, len(gains)):
+    filteredData[k] = filteredData[k-1] + gains[k] * (measurements[k] - filteredData[k-1])
+  # after convergence x[k] = (1-K) * x[k-1] + K * z[k] is a linear recurrence with constant coefficients
+  start = len(gains)
+  if start < totalLen:
+    filteredData[start:] = solveLinearRecurrence(1.0 - steadyStateGain, steadyStateGain * measurements[start:].T,
+                                                      filteredData[start-1]).T
+  return filteredData
+
+
+def kalmanFilteredPosesRealTime(pos, filteredDataAll, pCov, Q = 1e-5, R = 0.02**2):
+  """
+  Filter one new position. The covariance is updated after each axis.
+  :param pos: new measured position [x, y, z]
+  :param filteredDataAll: (N, 3) float array of the filtered positions so far, only the last one is used
+  :param pCov: current estimate covariance
+  :param Q: process variance
+  :param R: measurement variance
+  :return: (filteredPos, pCov), the filtered position as a list and the updated covariance
+  """
+  totalLen = len(filteredDataAll) # current filtered data length
+  filteredPos = [0,0,0]
+  for i in range(3):
+
+    # time update
+    hatminus = filteredDataAll[totalLen-1][i]
+    Pminus = pCov + Q
+    # measurement update
+    K = Pminus / (Pminus + R)
+    filteredPos[i] = hatminus + K * (pos[i] - hatminus)
+    pCov = (1 - K) * Pminus
+  return filteredPos, pCov
+
+
+def kalmanFilteredNewPoses(newPos, filteredDataAll, pCov, Q = 1e-5, R = 0.02**2):
+  """
+  Filter the positions received since the last update, with the same results as calling kalmanFilteredPosesRealTime
+  for each of them. The gains don't depend on the measurements, so they are computed first with scalar arithmetic
+  and the positions are then filtered all axes at once.
+  :param newPos: (M, 3) float array of new measured positions
+  :param filteredDataAll: (N, 3) float array of the filtered positions so far, only the last one is used
+  :param pCov: current estimate covariance
+  :param Q: process variance
+  :param R: measurement variance
+  :return: (filteredPos, pCov), (M, 3) float array of the filtered positions and the updated covariance
+  """
+  measurements = numpy.asarray(newPos, dtype=float).reshape(-1, 3)
+  gains = []
+  for k in range(3 * len(measurements)):
+    Pminus = pCov + Q
+    K = Pminus / (Pminus + R)
+    gains.append(K)
+    pCov = (1 - K) * Pminus
+  gains = numpy.array(gains).reshape(-1, 3)
+  filteredPos = numpy.zeros((len(measurements), 3))
+  hat = numpy.array(filteredDataAll[len(filteredDataAll)-1], dtype=float)
+  for k in range(len(measurements)):
+    hat = hat + gains[k] * (measurements[k] - hat)
+    filteredPos[k] = hat
+  return filteredPos, pCov
+
+
+def stackTrajectories(posList):
+  """
+  Stack trajectories of different lengths in one array padded with zeros.
+  :param posList: list of K (N_k, 3) float arrays or lists of positions
+  :return: (stacked, lengths), (K, max N_k, 3) float array and integer array of the N_k
+  """
+  measurements = [numpy.asarray(pos, dtype=float).reshape(-1, 3) for pos in posList]
+  lengths = numpy.array([len(pos) for pos in measurements], dtype=int)
+  stacked = numpy.zeros((len(measurements), max(lengths.tolist() + [0]), 3))
+  for k, pos in enumerate(measurements):
+    stacked[k, :len(pos)] = pos
+  return stacked, lengths
+
+
+def kalmanFilteredPosesBatch(posList, Q = 1e-5, R = 0.02**2):
+  """
+  Filter several whole trajectories together, with the same results as kalmanFilteredPoses for each of them.
+  All the trajectories start with a covariance of 1.0, so they share the gain sequence. The first samples, while the
+  gain is still changing, are filtered for all the trajectories at once, then the steady state recurrence of each
+  trajectory is solved on its own samples.
+  :param posList: list of K (N_k, 3) float arrays or lists of positions
+  :param Q: process variance
+  :param R: measurement variance
+  :return: list of K (N_k, 3) float arrays of filtered positions
+  """
+  measurements = [numpy.asarray(pos, dtype=float).reshape(-1, 3) for pos in posList]
+  maxLen = max([len(pos) for pos in measurements] + [0])
+  if maxLen == 0 or Q == 0:
+    return [kalmanFilteredPoses(pos, Q, R) for pos in measurements]
+  gains, steadyStateGain = kalmanGainSequence(Q, R, maxLen)
+  # only the samples of the converging gains are padded, there are a few tens of them with the usual variances
+  firstSamples, lengths = stackTrajectories([pos[:len(gains)] for pos in measurements])
+  firstFiltered = numpy.zeros_like(firstSamples)
+  firstFiltered[:, 0] = firstSamples[:, 0]
+  for k in range(1, firstSamples.shape[1]):
+    firstFiltered[:, k] = firstFiltered[:, k-1] + gains[k] * (firstSamples[:, k] - firstFiltered[:, k-1])
+  filteredDataList = []
+  for pos, start, filtered in zip(measurements, lengths, firstFiltered):
+    filteredData = numpy.empty((len(pos), 3))
+    filteredData[:start] = filtered[:start]
+    if start < len(pos):
+      filteredData[start:] = solveLinearRecurrence(1.0 - steadyStateGain, steadyStateGain * pos[start:].T,
+                                                   filteredData[start-1]).T
+    filteredDataList.append(filteredData)
+  return filteredDataList
+
+
+def kalmanFilteredNewPosesBatch(newPosList, lastFilteredPos, pCovs, Q = 1e-5, R = 0.02**2):
+  """
+  Filter the positions received since the last update by several trajectories, with the same results as
+  kalmanFilteredNewPoses for each of them. Each step is computed for all the trajectories at once, the state of
+  a trajectory stops changing after its last new position.
+  :param newPosList: list of K (M_k, 3) float arrays of new measured positions
+  :param lastFilteredPos: (K, 3) float array, last filtered position of each trajectory
+  :param pCovs: K estimate covariances
+  :param Q: process variance
+  :param R: measurement variance
+  :return: (filteredPosList, pCovs), list of K (M_k, 3) float arrays of filtered positions and float array of the
+           updated covariances
+  """
+  measurements, lengths = stackTrajectories(newPosList)
+  numOfTrajectories, maxLen = measurements.shape[:2]
+  pCovs = numpy.array(pCovs, dtype=float).reshape(numOfTrajectories)
+  # the covariance is updated after each axis, as in kalmanFilteredPosesRealTime
+  gains = numpy.zeros((numOfTrajectories, 3 * maxLen))
+  for i in range(3 * maxLen):
+    Pminus = pCovs + Q
+    gains[:, i] = Pminus / (Pminus + R)
+    pCovs = numpy.where(i < 3 * lengths, (1 - gains[:, i]) * Pminus, pCovs)
+  gains = gains.reshape(numOfTrajectories, maxLen, 3)
+  filteredPos = numpy.zeros_like(measurements)
+  hat = numpy.array(lastFilteredPos, dtype=float).reshape(numOfTrajectories, 3)
+  for k in range(maxLen):
+    hat = hat + gains[:, k] * (measurements[:, k] - hat)
+    filteredPos[:, k] = hat
+  return [filteredPos[k, :lengths[k]].copy() for k in range(numOfTrajectories)], pCovs
@@ -0,0 +1,225 @@
+"""
+Latency of the real-time reconstruction: the time from a tracking sample being recorded in the sequence of a
+trajectory to the sample being filtered, resampled, and shown by the model or curve of the trajectory.
+The latencies of the last samples of each locator are kept in rolling windows, from which the percentiles are
+computed. Samples that reach the transform node of a locator without being recorded, or that are recorded but
+discarded before being shown, are counted as dropped.
+"""
+import collections
+import time
+
+import numpy
+
+# the samples are filtered, added to the resampler, and the model or curve is updated with them
+STAGES = ["filter", "resample", "display"]
+PERCENTILES = [50, 95, 99]
+
+
+class LatencyWindow(object):
+  """
+  Rolling window of the latencies of the last samples, in seconds
+  """
+
+  def __init__(self, size = 10000):
+    self._latencies = numpy.zeros(size)
+    # number of samples added since the window was created, the window keeps the last ones
+    self.numOfSamples = 0
+
+  def add(self, latency, numOfSamples = 1):
+    """
+    :param latency: latency of the samples, in seconds
+    :param numOfSamples: number of samples that have this latency
+    :return: None
+    """
+    size = len(self._latencies)
+    indexes = (self.numOfSamples + numpy.arange(min(numOfSamples, size))) % size
+    self._latencies[indexes] = latency
+    self.numOfSamples += numOfSamples
+
+  def latencies(self):
+    return self._latencies[:min(self.numOfSamples, len(self._latencies))]
+
+  def percentiles(self, percentiles = PERCENTILES):
+    """
+    :return: list of the percentiles of the latencies in the window, in seconds, NaN if the window is empty
+    """
+    latencies = self.latencies()
+    if len(latencies) == 0:
+      return [float("nan")] * len(percentiles)
+    return numpy.percentile(latencies, percentiles).tolist()
+
+
+class LocatorLatency(object):
+  """
+  Latency windows of the stages and sample counters of one locator
+  """
+
+  def __init__(self, locatorIndex, windowSize):
+    self.locatorIndex = locatorIndex
+    # samples that reached the transform node, that were recorded in a sequence, and that were discarded
+    self.numOfReceived = 0
+    self.numOfRecorded = 0
+    self.numOfDiscarded = 0
+    self.windows = dict((stage, LatencyWindow(windowSize)) for stage in STAGES)
+
+  def numOfDropped(self):
+    return max(self.numOfReceived - self.numOfRecorded, 0) + self.numOfDiscarded
+
+  def toDict(self):
+    return {"locatorIndex": self.locatorIndex, "received": self.numOfReceived, "recorded": self.numOfRecorded,
+            "dropped": self.numOfDropped(),
+            "stages": dict((stage, {"samples": window.numOfSamples,
+                                    "percentiles": dict(zip(["p%d" % percentile for percentile in PERCENTILES],
+                                                            window.percentiles()))})
+                           for stage, window in self.windows.items())}
+
+
+class TrajectoryLatency(object):
+  """
+  Samples of a trajectory recorded in real time that haven't gone through all the stages yet
+  """
+
+  def __init__(self, numOfSamples):
+    # number of samples of the sequence
+    self.numOfSamples = numOfSamples
+    # for each stage, (number of samples of the sequence, number of new samples, time) of each sequence update that
+    # didn't reach the stage yet
+    self.pending = dict((stage, collections.deque()) for stage in STAGES)
+
+
+class LatencyMonitor(object):
+  """
+  Latencies of the trajectories recorded in real time, by locator. The trajectories are given as objects with
+  locatorIndex and trajectoryIndex attributes, the samples of a trajectory are identified by their number in its
+  sequence. The monitor is only used from the main thread.
+  """
+
+  def __init__(self, windowSize = 10000):
+    self.windowSize = windowSize
+    self._locators = {}
+    self._trajectories = {}
+
+  def clear(self):
+    """
+    Reset the statistics, the trajectories that are recorded keep being monitored.
+    :return: None
+    """
+    self._locators.clear()
+
+  def _locator(self, locatorIndex):
+    locator = self._locators.get(locatorIndex)
+    if locator is None:
+      locator = LocatorLatency(locatorIndex, self.windowSize)
+      self._locators[locatorIndex] = locator
+    return locator
+
+  def locators(self):
+    """
+    :return: list of LocatorLatency, ordered by locator index
+    """
+    return [self._locators[locatorIndex] for locatorIndex in sorted(self._locators)]
+
+  def startTrajectory(self, trajectory, numOfSamples):
+    """
+    Start monitoring a trajectory, its samples already recorded are not timed.
+    :param numOfSamples: number of samples of the sequence of the trajectory
+    :return: None
+    """
+    self._trajectories[(trajectory.locatorIndex, trajectory.trajectoryIndex)] = TrajectoryLatency(numOfSamples)
+
+  def stopTrajectory(self, trajectory):
+    """
+    Stop monitoring a trajectory, its samples that weren't displayed are counted as discarded.
+    :return: None
+    """
+    state = self._trajectories.pop((trajectory.locatorIndex, trajectory.trajectoryIndex), None)
+    if state is not None:
+      self._discardPending(trajectory, state)
+
+  def _discardPending(self, trajectory, state):
+    numOfDiscarded = sum(numOfNewSamples for numOfSamples, numOfNewSamples, recordTime in state.pending["display"])
+    if numOfDiscarded:
+      self._locator(trajectory.locatorIndex).numOfDiscarded += numOfDiscarded
+    for pending in state.pending.values():
+      pending.clear()
+
+  def addReceived(self, trajectory, numOfSamples = 1):
+    """
+    Count samples that reached the transform node of the locator of a trajectory.
+    :return: None
+    """
+    if (trajectory.locatorIndex, trajectory.trajectoryIndex) in self._trajectories:
+      self._locator(trajectory.locatorIndex).numOfReceived += numOfSamples
+
+  def addRecorded(self, trajectory, numOfSamples, recordTime = None):
+    """
+    Time the samples added to the sequence of a trajectory since the previous call.
+    :param numOfSamples: number of samples of the sequence
+    :param recordTime: time.perf_counter() of the sequence update, now if None
+    :return: None
+    """
+    state = self._trajectories.get((trajectory.locatorIndex, trajectory.trajectoryIndex))
+    if state is None:
+      return
+    numOfNewSamples = numOfSamples - state.numOfSamples
+    state.numOfSamples = numOfSamples
+    if numOfNewSamples <= 0:
+      return
+    if recordTime is None:
+      recordTime = time.perf_counter()
+    self._locator(trajectory.locatorIndex).numOfRecorded += numOfNewSamples
+    for pending in state.pending.values():
+      pending.append((numOfSamples, numOfNewSamples, recordTime))
+
+  def discard(self, trajectory, numOfSamples):
+    """
+    The sequence of a trajectory was edited and its samples are processed again from the first one, the samples
+    that weren't displayed are counted as discarded.
+    :param numOfSamples: number of samples of the sequence
+    :return: None
+    """
+    state = self._trajectories.get((trajectory.locatorIndex, trajectory.trajectoryIndex))
+    if state is not None:
+      self._discardPending(trajectory, state)
+      state.numOfSamples = numOfSamples
+
+  def setStageTime(self, trajectory, stage, numOfSamples, stageTime = None):
+    """
+    The first samples of the sequence of a trajectory went through a stage.
+    :param stage: name of the stage, see STAGES
+    :param numOfSamples: number of samples that went through the stage, counted from the first one of the sequence
+    :param stageTime: time.perf_counter() at the end of the stage, now if None
+    :return: None
+    """
+    state = self._trajectories.get((trajectory.locatorIndex, trajectory.trajectoryIndex))
+    if state is None:
+      return
+    pending = state.pending[stage]
+    if len(pending) == 0 or pending[0][0] > numOfSamples:
+      return
+    if stageTime is None:
+      stageTime = time.perf_counter()
+    window = self._locator(trajectory.locatorIndex).windows[stage]
+    while len(pending) and pending[0][0] <= numOfSamples:
+      lastSample, numOfNewSamples, recordTime = pending.popleft()
+      window.add(stageTime - recordTime, numOfNewSamples)
+
+  def toDict(self):
+    return {"stages": STAGES, "locators": [locator.toDict() for locator in self.locators()]}
+
+
+def formatLatencyTable(monitor):
+  """
+  :param monitor: LatencyMonitor
+  :return: the sample counters and the latency percentiles in milliseconds as a text table, one line per locator
+  """
+  lines = ["%7s %9s %9s %8s" % ("Locator", "Received", "Recorded", "Dropped") +
+           "".join(" %23s" % ("%s p50/p95/p99 ms" % stage) for stage in STAGES)]
+  for locator in monitor.locators():
+    percentiles = []
+    for stage in STAGES:
+      percentiles.append(" %7.1f/%7.1f/%7.1f" % tuple(1000.0 * latency
+                                                      for latency in locator.windows[stage].percentiles()))
+    lines.append("%7d %9d %9d %8d" % (locator.locatorIndex, locator.numOfReceived, locator.numOfRecorded,
+                                      locator.numOfDropped()) + "".join(percentiles))
+  return "\n".join(lines)
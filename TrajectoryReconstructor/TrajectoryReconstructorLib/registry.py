@@ -0,0 +1,113 @@
+"""
+Registry of the tracked locators and of their trajectories.
+The locators are numbered in the order they are registered and the trajectories of a locator in the order they are
+added. Every record can also be found from the ID of any of its MRML nodes.
+"""
+from .buffer import TrajectoryBuffer
+
+
+class TrajectoryRecord(object):
+  """
+  Nodes and real-time reconstruction state of one trajectory of a locator.
+  """
+
+  def __init__(self, locator, trajectoryIndex):
+    self.locator = locator
+    self.locatorIndex = locator.locatorIndex
+    self.trajectoryIndex = trajectoryIndex
+    self.sequenceNode = None
+    self.sequenceBrowserNode = None
+    self.fiducialNode = None
+    self.modelNode = None
+    self.curveManager = None
+    # resampled points shown by the model, the markups fiducial and curve manager are only created to edit them
+    self.points = TrajectoryBuffer()
+    self.editing = False
+    # as the pCov is set to 1.0, the first tracked point will be added to the trajectory
+    self.filteredData = TrajectoryBuffer()
+    self.pCov = 1.0
+    self.resampler = None
+    # TubeBuilder of the points, which only computes the end of the model again when points are added
+    self.tube = None
+    # the model shows a simplified subset of the points instead of all of them
+    self.simplified = False
+    # the trajectory was registered without being reconstructed, it is reconstructed when it is needed
+    self.stale = False
+    self.staleObserverTag = None
+    # (node, tag) of the observers of the sequence and locator nodes that time the samples recorded in real time
+    self.latencyObserverTags = []
+
+
+class LocatorRecord(object):
+  """
+  Transform node of a locator and its trajectories, ordered by trajectory index.
+  """
+
+  def __init__(self, locatorIndex, locatorNode):
+    self.locatorIndex = locatorIndex
+    self.locatorNode = locatorNode
+    self.trajectories = []
+
+
+class LocatorRegistry(object):
+
+  def __init__(self):
+    self.locators = []
+    self._records = {}
+
+  def __len__(self):
+    return len(self.locators)
+
+  def clear(self):
+    del self.locators[:]
+    self._records.clear()
+
+  def addLocator(self, locatorNode):
+    """
+    Register a locator transform node, nothing is done if it is already registered.
+    :param locatorNode: transform node of the locator
+    :return: LocatorRecord of the node
+    """
+    record = self._records.get(locatorNode.GetID())
+    if record is None:
+      record = LocatorRecord(len(self.locators), locatorNode)
+      self.locators.append(record)
+      self._records[locatorNode.GetID()] = record
+    return record
+
+  def addTrajectory(self, locator):
+    """
+    Add an empty trajectory at the end of the trajectories of a locator.
+    :param locator: LocatorRecord
+    :return: the new TrajectoryRecord
+    """
+    record = TrajectoryRecord(locator, len(locator.trajectories))
+    locator.trajectories.append(record)
+    return record
+
+  def register(self, nodeID, record):
+    """
+    Make a record found by the ID of one of its nodes
+    :return: None
+    """
+    if nodeID:
+      self._records[nodeID] = record
+
+  def find(self, nodeID):
+    """
+    :param nodeID: ID of a registered node
+    :return: the LocatorRecord or TrajectoryRecord of the node, None if the node isn't registered
+    """
+    return self._records.get(nodeID)
+
+  def locator(self, locatorIndex):
+    return self.locators[locatorIndex]
+
+  def trajectory(self, locatorIndex, trajectoryIndex):
+    return self.locators[locatorIndex].trajectories[trajectoryIndex]
+
+  def trajectories(self):
+    """
+    :return: list of all the TrajectoryRecord, ordered by locator index and trajectory index
+    """
+    return [trajectory for locator in self.locators for trajectory in locator.trajectories]
@@ -0,0 +1,181 @@
+"""
+Downsampling of filtered trajectories with a moving window.
+"""
+import numpy
+
+# largest window size for which the farthest points of a window are computed for every candidate reference point
+MAX_TABLE_STEP = 16
+
+
+def resampleData(data, movementThreshold = 1.0, step = 10):
+  """
+  Downsample the filtered data with a moving window of 'step' samples. The mean of the first window is always kept.
+  For each following window whose mean moved more than movementThreshold from the mean of the previous window,
+  the point of the window that is the farthest from the reference point is kept. The reference point is the
+  second last kept point. The last window that reaches the end of the data is not evaluated.
+  The window means are computed at once. As the reference point of a window depends on the point kept two windows
+  before, the kept points are then resolved one window after the other. Up to MAX_TABLE_STEP, the farthest point of
+  each window is first computed for every candidate reference point, which costs O(step^2) per window in numpy and
+  leaves a lookup per window. For larger windows, each window is resolved from its actual reference point in O(step).
+  Either way the time is linear in the number of samples.
+  :param data: (N, 3) float array of filtered positions
+  :param movementThreshold: minimum movement of the window mean, in millimeter
+  :param step: window size
+  :return: (M, 3) float array of downsampled positions, or the data itself if there are less than 'step' samples
+  """
+  data = numpy.asarray(data, dtype=float)
+  dataLen = len(data)
+  if dataLen < step:
+    return data
+  numOfWindows = max(int((dataLen - 1) / step), 1)
+  windows = data[:numOfWindows * step].reshape(numOfWindows, step, 3)
+  pos_mean = windows.mean(axis=1)
+  movement = numpy.sqrt(numpy.sum(numpy.diff(pos_mean, axis=0) ** 2, axis=1))
+  movedWindows = numpy.nonzero(movement > movementThreshold)[0] + 1
+  pos_downSampledArray = numpy.zeros((len(movedWindows) + 1, 3))
+  pos_downSampledArray[0, :] = pos_mean[0]
+  if len(movedWindows) == 0:
+    return pos_downSampledArray
+  candidates = windows[movedWindows]
+  if step == 1:
+    pos_downSampledArray[1:, :] = candidates[:, 0, :]
+    return pos_downSampledArray
+  # The first two kept windows are compared to the mean of the first window.
+  # The later ones are compared to the point kept two windows before.
+  indexMax = numpy.zeros(len(movedWindows), dtype=int)
+  indexMax[:2] = numpy.argmax(numpy.sum((candidates[:2] - pos_mean[0]) ** 2, axis=2), axis=1)
+  # |x - r|^2 = |x|^2 - 2 x.r + |r|^2, the last term doesn't change the farthest point of a window
+  squaredNorm = numpy.sum(candidates ** 2, axis=2)
+  if step > MAX_TABLE_STEP:
+    kept = pos_downSampledArray[1:]
+    kept[:2] = candidates[numpy.arange(min(2, len(movedWindows))), indexMax[:2]]
+    for index in range(2, len(movedWindows)):
+      farthest = numpy.argmax(squaredNorm[index] - 2 * numpy.dot(candidates[index], kept[index - 2]))
+      kept[index] = candidates[index, farthest]
+    return pos_downSampledArray
+  # the reference point is unknown until the window two windows before is resolved, so the farthest point is
+  # computed for every candidate of that window and looked up afterwards
+  chunkSize = max(int(2 ** 20 / (step * step)), 1)
+  farthestTable = []
+  for chunkStart in range(2, len(movedWindows), chunkSize):
+    chunkEnd = min(chunkStart + chunkSize, len(movedWindows))
+    crossProduct = numpy.matmul(candidates[chunkStart-2:chunkEnd-2], candidates[chunkStart:chunkEnd].transpose(0, 2, 1))
+    farthestTable.extend(numpy.argmax(squaredNorm[chunkStart:chunkEnd, None, :] - 2 * crossProduct, axis=2).tolist())
+  indexMaxList = indexMax.tolist()
+  for index in range(2, len(movedWindows)):
+    indexMaxList[index] = farthestTable[index - 2][indexMaxList[index - 2]]
+  pos_downSampledArray[1:, :] = candidates[numpy.arange(len(movedWindows)), indexMaxList]
+  return pos_downSampledArray
+
+
+def resampleDataRealTime(data, movementThreshold = 1.0, step = 10):
+  """
+  Evaluate the last window of the filtered data when it has just been completed. Kept as the reference
+  implementation of StreamingResampler, which doesn't need the whole filtered data.
+  :param data: (N, 3) float array of filtered positions
+  :param movementThreshold: minimum movement of the window mean, in millimeter
+  :param step: window size
+  :return: (resampledPos, valid), valid is True when resampledPos should be added to the trajectory
+  """
+  dataLen = len(data)
+  sectionNum = int(dataLen / step)
+  pos_downSampledPoint = numpy.zeros((1,3))
+  if abs(float(dataLen)/step - int(dataLen/step))< 1e-15 and sectionNum >=2: # we have received another section of data
+    pos_mean_pre = numpy.zeros((1,3))
+    pos_mean_pre[0,:] = numpy.array([numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step,0]), numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step, 1]), numpy.mean(data[(sectionNum-2)*step:(sectionNum-1)*step, 2])])
+    pos_mean  = numpy.zeros((1,3))
+    pos_mean[0,:]  = numpy.array([numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 0]), numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 1]), numpy.mean(data[(sectionNum-1)*step:sectionNum*step, 2])])
+    if numpy.linalg.norm(pos_mean - pos_mean_pre)>movementThreshold:
+      distance = -1e20
+      indexMax = 0
+      for indexInner in range(step):
+        pos1 = numpy.array(data[(sectionNum-1)*step+indexInner,:])
+        if numpy.linalg.norm(pos1-pos_mean_pre)>distance:
+          indexMax = indexInner
+          distance = numpy.linalg.norm(pos1-pos_mean_pre)
+      pos_downSampledPoint = data[(sectionNum-1)*step+indexMax,:]
+      return pos_downSampledPoint, True
+  return pos_downSampledPoint, False
+
+
+class StreamingResampler(object):
+  """
+  Real-time counterpart of resampleData. The filtered positions are fed one at a time,
+  only the samples of the current window, their running sum and the mean of the previous window are kept.
+  When a window is complete and its mean moved more than movementThreshold from the mean of the previous window,
+  the point of the window that is the farthest from the previous mean is returned.
+  """
+
+  def __init__(self, movementThreshold = 1.0, step = 10):
+    self.movementThreshold = movementThreshold
+    self.step = step
+    self.reset()
+
+  def reset(self):
+    self._window = numpy.zeros((self.step, 3))
+    self._windowSum = numpy.zeros(3)
+    self._count = 0
+    self._previousMean = None
+
+  def setStep(self, step, history = None):
+    """
+    Change the window size. The windows are aligned on the first sample of the trajectory,
+    so the state is rebuilt from the history if it is provided.
+    :param step: window size
+    :param history: (N, 3) float array of the filtered positions received so far
+    :return: None
+    """
+    self.step = step
+    self.setHistory(history)
+
+  def setHistory(self, history):
+    """
+    Restore the state as if the positions in history had been appended one by one. Only the last
+    complete window and the incomplete one are read.
+    :param history: (N, 3) float array of filtered positions
+    :return: None
+    """
+    self.reset()
+    if history is None or len(history) == 0:
+      return
+    numOfWindows = int(len(history) / self.step)
+    if numOfWindows > 0:
+      self._previousMean = numpy.mean(history[(numOfWindows - 1) * self.step:numOfWindows * self.step], axis=0)
+    remaining = history[numOfWindows * self.step:]
+    self._count = len(remaining)
+    self._window[:self._count] = remaining
+    self._windowSum = numpy.sum(remaining, axis=0)
+
+  def append(self, pos):
+    """
+    Add a filtered position.
+    :param pos: position [x, y, z]
+    :return: (resampledPos, valid), valid is True when resampledPos should be added to the trajectory
+    """
+    self._window[self._count] = pos
+    self._windowSum += self._window[self._count]
+    self._count = self._count + 1
+    if self._count < self.step:
+      return numpy.zeros((1, 3)), False
+    pos_mean = self._windowSum / self.step
+    pos_mean_pre = self._previousMean
+    self._previousMean = pos_mean
+    self._windowSum = numpy.zeros(3)
+    self._count = 0
+    if pos_mean_pre is not None and numpy.linalg.norm(pos_mean - pos_mean_pre) > self.movementThreshold:
+      indexMax = numpy.argmax(numpy.sum((self._window - pos_mean_pre) ** 2, axis=1))
+      return self._window[indexMax].copy(), True
+    return numpy.zeros((1, 3)), False
+
+  def extend(self, positions):
+    """
+    Add several filtered positions.
+    :param positions: (M, 3) float array of filtered positions
+    :return: (K, 3) float array of the points that should be added to the trajectory
+    """
+    points = []
+    for pos in positions:
+      point, valid = self.append(pos)
+      if valid:
+        points.append(point)
+    return numpy.array(points).reshape(-1, 3)
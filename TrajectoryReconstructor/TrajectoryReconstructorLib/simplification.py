@@ -0,0 +1,68 @@
+"""
+Simplification of the resampled points of a trajectory for display, with the Ramer-Douglas-Peucker algorithm.
+The segment with the largest deviation is split first, so that when the number of points is limited the kept points
+are the ones that reduce the deviation the most. The distances of the points of a segment are computed at once
+with numpy, the loop only runs once per kept point.
+"""
+import heapq
+import numpy
+
+
+def farthestPoint(points, start, end):
+  """
+  :param points: (N, 3) float array
+  :param start: index of the first point of the segment
+  :param end: index of the last point of the segment, end > start + 1
+  :return: (index, distance) of the point between start and end that is the farthest from the segment
+  """
+  inner = points[start + 1:end]
+  direction = points[end] - points[start]
+  offsets = inner - points[start]
+  lengthSquared = numpy.dot(direction, direction)
+  if lengthSquared > 0:
+    t = numpy.clip(numpy.dot(offsets, direction) / lengthSquared, 0.0, 1.0)
+    offsets = offsets - t[:, None] * direction
+  distancesSquared = numpy.einsum('ij,ij->i', offsets, offsets)
+  index = int(numpy.argmax(distancesSquared))
+  return start + 1 + index, float(numpy.sqrt(distancesSquared[index]))
+
+
+def simplifiedIndexes(points, tolerance, maxNumOfPoints = None):
+  """
+  :param points: (N, 3) float array
+  :param tolerance: maximum distance of the removed points to the simplified line, in millimeter
+  :param maxNumOfPoints: maximum number of kept points, at least 2. No limit if None.
+  :return: sorted integer array of the indexes of the kept points, the first and last points are always kept
+  """
+  points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+  numOfPoints = len(points)
+  if numOfPoints <= 2:
+    return numpy.arange(numOfPoints)
+  if maxNumOfPoints is None:
+    maxNumOfPoints = numOfPoints
+  maxNumOfPoints = max(maxNumOfPoints, 2)
+  kept = [0, numOfPoints - 1]
+  segments = []
+
+  def addSegment(start, end):
+    if end - start > 1:
+      index, distance = farthestPoint(points, start, end)
+      if distance > tolerance:
+        heapq.heappush(segments, (-distance, start, end, index))
+
+  addSegment(0, numOfPoints - 1)
+  while segments and len(kept) < maxNumOfPoints:
+    negativeDistance, start, end, index = heapq.heappop(segments)
+    kept.append(index)
+    addSegment(start, index)
+    addSegment(index, end)
+  return numpy.sort(numpy.array(kept))
+
+
+def simplifyTrajectory(points, tolerance, maxNumOfPoints = None):
+  """
+  :param points: (N, 3) float array
+  :return: (M, 3) float array of the kept points, see simplifiedIndexes
+  """
+  points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+  return points[simplifiedIndexes(points, tolerance, maxNumOfPoints)]
@@ -0,0 +1,99 @@
+"""
+Streaming export of the tracked samples while they are recorded. The samples are appended by a background thread to
+one CSV file per locator in a session directory, in the layout of the files saved separately for each locator (see
+trackingcsv). The directory can be imported as soon as the recording stops, and the files hold all the samples
+written before their last flush if the application stops unexpectedly.
+"""
+import os
+import queue
+import threading
+import time
+
+from .tracking import TrackedTrajectory
+from .trackingcsv import formatTrackingRows, writeTrackingCSVHeader
+
+
+class StreamingRecorder(object):
+
+  def __init__(self, directory, maxQueueSize = 256, flushInterval = 1.0):
+    """
+    Create the session directory and start the writer thread.
+    :param directory: session directory, created if it doesn't exist
+    :param maxQueueSize: maximum number of blocks of samples waiting to be written
+    :param flushInterval: maximum time in seconds between the writing of samples and the flush of their file
+    """
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self.directory = directory
+    self.flushInterval = flushInterval
+    self.numOfWrittenSamples = 0
+    # first exception raised while writing, the samples received after it are discarded
+    self.error = None
+    self._queue = queue.Queue(maxQueueSize)
+    self._files = {}
+    self._thread = threading.Thread(target=self._run, name="StreamingRecorder")
+    self._thread.daemon = True
+    self._thread.start()
+
+  def addSamples(self, fileName, locatorName, trajectoryIndex, timeStamps, positions, wait = False):
+    """
+    Queue samples to be appended to a file of the session.
+    :param fileName: name of the file in the session directory
+    :param locatorName: locator name written in the header of the file when it is created
+    :param trajectoryIndex: index of the trajectory of the samples
+    :param timeStamps: (N,) float array, it must not be modified afterwards
+    :param positions: (N, 3) float array, it must not be modified afterwards
+    :param wait: if True, wait until the queue has room for the samples
+    :return: False if the queue is full and the samples were not added, they have to be given again later
+    """
+    try:
+      self._queue.put((fileName, locatorName, trajectoryIndex, timeStamps, positions), wait)
+    except queue.Full:
+      return False
+    return True
+
+  def close(self):
+    """
+    Write the queued samples, close the files and stop the writer thread.
+    :return: list of the paths of the files of the session
+    """
+    self._queue.put(None)
+    self._thread.join()
+    return self.fileNames()
+
+  def fileNames(self):
+    return sorted(os.path.join(self.directory, fileName) for fileName in self._files)
+
+  def _write(self, fileName, locatorName, trajectoryIndex, timeStamps, positions):
+    outputFile = self._files.get(fileName)
+    if outputFile is None:
+      outputFile = open(os.path.join(self.directory, fileName), 'w')
+      self._files[fileName] = outputFile
+      writeTrackingCSVHeader(outputFile, [locatorName, " ", " ", " ", " ", " "], 1)
+    rows = formatTrackingRows(TrackedTrajectory(0, locatorName, "", trajectoryIndex, timeStamps, positions))
+    outputFile.write("\n".join(rows) + "\n")
+    self.numOfWrittenSamples += len(rows)
+
+  def _run(self):
+    lastFlushTime = time.time()
+    while True:
+      try:
+        block = self._queue.get(True, self.flushInterval)
+      except queue.Empty:
+        block = ()
+      if block is None:
+        break
+      try:
+        if block and self.error is None:
+          self._write(*block)
+        if time.time() - lastFlushTime >= self.flushInterval:
+          for outputFile in self._files.values():
+            outputFile.flush()
+          lastFlushTime = time.time()
+      except (IOError, OSError) as error:
+        self.error = error
+    for outputFile in self._files.values():
+      try:
+        outputFile.close()
+      except (IOError, OSError) as error:
+        self.error = self.error or error
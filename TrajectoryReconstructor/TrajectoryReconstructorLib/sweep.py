@@ -0,0 +1,175 @@
+"""
+Parameter sweep of the trajectory reconstruction, to tune the Kalman filter variances and the resampling settings.
+A recorded trajectory is reconstructed for every combination of the given process variances, measurement variances,
+movement thresholds and window sizes. The filtering only depends on the variances, so each (Q, R) pair is one task
+of the process pool that filters the trajectory once and resamples it with all the thresholds and window sizes.
+Usage:
+  python -m TrajectoryReconstructorLib.sweep [options] <tracking data file>
+"""
+import argparse
+import itertools
+import multiprocessing
+import sys
+
+import numpy
+
+from .kalman import kalmanFilteredPoses
+from .resampling import resampleData
+from .trackingcsv import readTrackingCSV
+
+COLUMNS = ["processVariance", "measurementVariance", "movementThreshold", "step", "points", "smoothness",
+           "meanDeviation", "maxDeviation", "filterDeviation"]
+
+
+def turningAngles(points):
+  """
+  :param points: (M, 3) float array
+  :return: (M-2,) float array of the angles between consecutive segments, in degrees
+  """
+  segments = numpy.diff(points, axis=0)
+  lengths = numpy.linalg.norm(segments, axis=1)
+  segments = segments[lengths > 0] / lengths[lengths > 0, None]
+  if len(segments) < 2:
+    return numpy.zeros(0)
+  cosines = numpy.clip(numpy.einsum('ij,ij->i', segments[:-1], segments[1:]), -1.0, 1.0)
+  return numpy.degrees(numpy.arccos(cosines))
+
+
+def distancesToPolyline(samples, points, chunkSize = 256):
+  """
+  :param samples: (N, 3) float array
+  :param points: (M, 3) float array of the vertices of the polyline
+  :return: (N,) float array of the distances of the samples to the polyline
+  """
+  if len(points) == 1:
+    return numpy.linalg.norm(samples - points[0], axis=1)
+  starts = points[:-1]
+  directions = points[1:] - points[:-1]
+  lengthsSquared = numpy.maximum(numpy.einsum('ij,ij->i', directions, directions), 1e-24)
+  distances = numpy.zeros(len(samples))
+  for chunkStart in range(0, len(samples), chunkSize):
+    offsets = samples[chunkStart:chunkStart + chunkSize, None, :] - starts[None, :, :]
+    t = numpy.clip(numpy.einsum('nmj,mj->nm', offsets, directions) / lengthsSquared, 0.0, 1.0)
+    offsets = offsets - t[:, :, None] * directions[None, :, :]
+    distances[chunkStart:chunkStart + chunkSize] = numpy.sqrt(numpy.einsum('nmj,nmj->nm', offsets, offsets).min(axis=1))
+  return distances
+
+
+def evaluateReconstruction(positions, filteredData, points, maxNumOfSamples = 2000):
+  """
+  :param positions: (N, 3) float array of the measured positions
+  :param filteredData: (N, 3) float array of the filtered positions
+  :param points: (M, 3) float array of the resampled points
+  :param maxNumOfSamples: the deviations from the resampled points are evaluated on at most this number of
+                          evenly spaced measured positions
+  :return: dictionary with the number of points, the smoothness (mean turning angle between consecutive segments,
+           in degrees, lower is smoother), the mean and maximum distances of the measured positions to the
+           resampled trajectory and the RMS distance between the measured and filtered positions, in millimeter
+  """
+  evaluated = positions[numpy.unique(numpy.linspace(0, len(positions) - 1, min(len(positions), maxNumOfSamples)).astype(int))]
+  deviations = distancesToPolyline(evaluated, points) if len(points) else numpy.zeros(0)
+  angles = turningAngles(points)
+  return {"points": len(points),
+          "smoothness": float(angles.mean()) if len(angles) else 0.0,
+          "meanDeviation": float(deviations.mean()) if len(deviations) else 0.0,
+          "maxDeviation": float(deviations.max()) if len(deviations) else 0.0,
+          "filterDeviation": float(numpy.sqrt(numpy.mean(numpy.sum((positions - filteredData) ** 2, axis=1))))}
+
+
+def sweepVariances(positions, processVariance, measurementVariance, movementThresholds, steps):
+  """
+  Filter a trajectory once and resample the filtered positions with all the thresholds and window sizes.
+  :return: list of result dictionaries, one per (movementThreshold, step)
+  """
+  filteredData = kalmanFilteredPoses(positions, processVariance, measurementVariance)
+  rows = []
+  for movementThreshold, step in itertools.product(movementThresholds, steps):
+    points = resampleData(filteredData, movementThreshold, step)
+    row = {"processVariance": processVariance, "measurementVariance": measurementVariance,
+           "movementThreshold": movementThreshold, "step": step}
+    row.update(evaluateReconstruction(positions, filteredData, points))
+    rows.append(row)
+  return rows
+
+
+def sweepVariancesWithArgs(args):
+  return sweepVariances(*args)
+
+
+def sweepParameters(positions, processVariances, measurementVariances, movementThresholds, steps,
+                    processes = None, callback = None):
+  """
+  Reconstruct a trajectory with every combination of the parameters.
+  :param positions: (N, 3) float array of the measured positions
+  :param processVariances: list of process variances Q
+  :param measurementVariances: list of measurement variances R
+  :param movementThresholds: list of movement thresholds, in millimeter
+  :param steps: list of resampling window sizes
+  :param processes: number of worker processes, the number of cores if None. 1 runs in the calling process.
+  :param callback: called with the result dictionaries of each (Q, R) pair as soon as they are done
+  :return: list of result dictionaries with the keys of COLUMNS, ordered as the combinations of the parameters
+  """
+  positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+  tasks = [(positions, processVariance, measurementVariance, movementThresholds, steps)
+           for processVariance, measurementVariance in itertools.product(processVariances, measurementVariances)]
+  results = {}
+  if processes == 1 or len(tasks) == 1:
+    resultIterator = (sweepVariancesWithArgs(task) for task in tasks)
+    pool = None
+  else:
+    pool = multiprocessing.Pool(processes)
+    resultIterator = pool.imap_unordered(sweepVariancesWithArgs, tasks)
+  try:
+    for rows in resultIterator:
+      results[(rows[0]["processVariance"], rows[0]["measurementVariance"])] = rows
+      if callback:
+        callback(rows)
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+  return [row for task in tasks for row in results[(task[1], task[2])]]
+
+
+def formatSweepTable(rows):
+  """
+  :param rows: list of result dictionaries
+  :return: the rows as a text table, one line per combination
+  """
+  lines = ["%12s %12s %10s %5s %7s %10s %10s %10s %10s" % ("Q", "R", "threshold", "step", "points", "smoothness",
+                                                          "meanDev", "maxDev", "filterDev")]
+  for row in rows:
+    lines.append("%12.3g %12.3g %10.3g %5d %7d %10.3f %10.4f %10.4f %10.4f" % tuple(row[column] for column in COLUMNS))
+  return "\n".join(lines)
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description="Reconstruct a trajectory with a grid of parameters.")
+  parser.add_argument("input", help="tracking data CSV file")
+  parser.add_argument("-t", "--trajectory", type=int, default=0,
+                      help="index of the trajectory in the file, ordered by column group and trajectory index")
+  parser.add_argument("-j", "--processes", type=int, default=None, help="number of worker processes")
+  parser.add_argument("--process-variance", type=float, nargs="+", default=[1e-5, 5e-5, 1e-4])
+  parser.add_argument("--measurement-variance", type=float, nargs="+", default=[0.0001, 0.0004, 0.0016])
+  parser.add_argument("--movement-threshold", type=float, nargs="+", default=[0.5, 1.0, 2.0], help="in millimeter")
+  parser.add_argument("--step", type=int, nargs="+", default=[1, 5, 10], help="downsample window sizes")
+  parser.add_argument("-o", "--output", default=None, help="CSV file of the results")
+  args = parser.parse_args(argv)
+
+  trajectories = readTrackingCSV(args.input)
+  if not 0 <= args.trajectory < len(trajectories):
+    print("%s: no trajectory %d, the file has %d trajectories." % (args.input, args.trajectory, len(trajectories)))
+    return 1
+  rows = sweepParameters(trajectories[args.trajectory].positions, args.process_variance, args.measurement_variance,
+                         args.movement_threshold, args.step, args.processes)
+  print(formatSweepTable(rows))
+  if args.output:
+    with open(args.output, 'w') as outputFile:
+      outputFile.write(",".join(COLUMNS) + "\n")
+      for row in rows:
+        outputFile.write(",".join(repr(row[column]) for column in COLUMNS) + "\n")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
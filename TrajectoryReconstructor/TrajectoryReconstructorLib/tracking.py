@@ -0,0 +1,32 @@
+"""
+Container for the tracked samples of one trajectory, shared by the file formats.
+"""
+import collections
+import numpy
+
+TrackedTrajectory = collections.namedtuple("TrackedTrajectory",
+                                           ["locatorIndex", "locatorName", "sequenceName", "trajectoryIndex",
+                                            "timeStamps", "positions"])
+TrackedTrajectory.__doc__ = """
+Samples of one trajectory of a tracking data file.
+locatorIndex: index of the locator in the file, starting from 0
+locatorName: name of the locator
+sequenceName: name of the sequence node, empty if not available
+trajectoryIndex: index of the trajectory of the locator
+timeStamps: (N,) float array
+positions: (N, 3) float array
+"""
+
+
+def removeDuplicatedPositions(timeStamps, positions, tolerance = 1e-8):
+  """
+  Remove the samples whose position is the same as the position of the previous sample.
+  :param timeStamps: (N,) float array
+  :param positions: (N, 3) float array
+  :param tolerance: distance below which two positions are the same, in millimeter
+  :return: (timeStamps, positions) of the remaining samples
+  """
+  positions = numpy.asarray(positions, dtype=float)
+  valid = numpy.ones(len(positions), dtype=bool)
+  valid[1:] = numpy.sqrt(numpy.sum(numpy.diff(positions, axis=0) ** 2, axis=1)) >= tolerance
+  return numpy.asarray(timeStamps, dtype=float)[valid], positions[valid]
@@ -0,0 +1,103 @@
+"""
+Binary tracking data recording, an alternative to the CSV files that can be opened with numpy.memmap.
+Layout:
+  magic        8 bytes, "TRJREC01"
+  headerSize   little endian uint64, size of the header in bytes
+  header       UTF-8 JSON, {"trajectories": [{"locatorIndex", "locatorName", "sequenceName", "trajectoryIndex",
+                                              "offset", "count"}, ...]}
+  padding      up to the next multiple of 64 bytes
+  data         for each trajectory, at 'offset' bytes from the beginning of the file:
+               little endian float64 columns TimeStamp, X, Y and Z of 'count' values each
+"""
+import json
+import struct
+import numpy
+
+from .tracking import TrackedTrajectory
+
+MAGIC = b"TRJREC01"
+FILE_EXTENSION = ".trrec"
+ALIGNMENT = 64
+DATA_TYPE = numpy.dtype('<f8')
+
+
+def isTrackingRecording(fileName):
+  """
+  :param fileName: path of a tracking data file
+  :return: True if the file starts with the magic of the binary recording format
+  """
+  with open(fileName, 'rb') as recordingFile:
+    return recordingFile.read(len(MAGIC)) == MAGIC
+
+
+def alignedSize(size):
+  return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def writeTrackingRecording(fileName, trajectories):
+  """
+  Write trajectories in the binary recording format.
+  :param fileName: output path
+  :param trajectories: list of TrackedTrajectory
+  :return: None
+  """
+  entries = []
+  for trajectory in trajectories:
+    entries.append({"locatorIndex": int(trajectory.locatorIndex), "locatorName": trajectory.locatorName,
+                    "sequenceName": trajectory.sequenceName, "trajectoryIndex": int(trajectory.trajectoryIndex),
+                    "offset": 0, "count": len(trajectory.timeStamps)})
+  # the offsets change the header size, so they are computed with a header large enough for any offset value
+  headerSize = len(json.dumps({"trajectories": entries}).encode('utf-8')) + 24 * len(entries)
+  offset = alignedSize(len(MAGIC) + 8 + headerSize)
+  for entry in entries:
+    entry["offset"] = offset
+    offset = offset + alignedSize(4 * entry["count"] * DATA_TYPE.itemsize)
+  header = json.dumps({"trajectories": entries}).encode('utf-8')
+  header = header + b" " * (headerSize - len(header))
+  with open(fileName, 'wb') as recordingFile:
+    recordingFile.write(MAGIC)
+    recordingFile.write(struct.pack('<Q', headerSize))
+    recordingFile.write(header)
+    for trajectory, entry in zip(trajectories, entries):
+      recordingFile.seek(entry["offset"])
+      columns = numpy.empty((4, entry["count"]), dtype=DATA_TYPE)
+      columns[0] = trajectory.timeStamps
+      columns[1:] = numpy.asarray(trajectory.positions, dtype=float).reshape(-1, 3).T
+      recordingFile.write(columns.tobytes())
+    recordingFile.truncate(offset)
+
+
+def readTrackingRecordingHeader(fileName):
+  """
+  :param fileName: path of a binary recording
+  :return: list of the trajectory entries of the header
+  """
+  with open(fileName, 'rb') as recordingFile:
+    if not recordingFile.read(len(MAGIC)) == MAGIC:
+      raise ValueError("%s is not a tracking data recording" % fileName)
+    headerSize = struct.unpack('<Q', recordingFile.read(8))[0]
+    return json.loads(recordingFile.read(headerSize).decode('utf-8'))["trajectories"]
+
+
+def readTrackingRecording(fileName, selected = None):
+  """
+  Open a binary recording without reading the samples. The returned arrays are memory mapped,
+  only the parts that are accessed are read from the disk.
+  :param fileName: path of a binary recording
+  :param selected: optional function called with each header entry, only the trajectories for which it returns
+                   True are returned
+  :return: list of TrackedTrajectory, the positions are (N, 3) views of the X, Y and Z columns
+  """
+  entries = readTrackingRecordingHeader(fileName)
+  if selected is not None:
+    entries = [entry for entry in entries if selected(entry)]
+  if len(entries) == 0:
+    return []
+  data = numpy.memmap(fileName, dtype=numpy.uint8, mode='r')
+  trajectories = []
+  for entry in entries:
+    count = entry["count"]
+    columns = numpy.ndarray((4, count), dtype=DATA_TYPE, buffer=data, offset=entry["offset"])
+    trajectories.append(TrackedTrajectory(entry["locatorIndex"], entry["locatorName"], entry["sequenceName"],
+                                          entry["trajectoryIndex"], columns[0], columns[1:].T))
+  return trajectories
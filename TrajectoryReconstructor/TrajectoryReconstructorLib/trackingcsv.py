@@ -0,0 +1,154 @@
+"""
+Parsing of the tracking data CSV files written by the TrajectoryReconstructor module.
+Each group of columns holds one locator:
+Tracker1  sequence1               Tracker1 sequence2                Tracker2 sequence1
+TimeStamp	X	Y	Z	TrajectoryIndex   TimeStamp	X	Y	Z	TrajectoryIndex   TimeStamp	X	Y	Z	TrajectoryIndex
+xx        x x x 0                 xx        x x x 1                 xx        x x x 0
+Files written by older versions don't have the TrajectoryIndex column, all their samples belong to trajectory 0.
+Consecutive groups with the same locator name belong to the same locator.
+"""
+import csv
+import warnings
+import numpy
+
+from .tracking import TrackedTrajectory
+
+
+def parseNumericTable(lines):
+  """
+  Convert the data rows of a tracking data file into a float array, blank cells are converted to NaN.
+  :param lines: list of comma separated rows
+  :return: (nRows, nColumns) float array
+  """
+  if len(lines) == 0:
+    return numpy.zeros((0, 0))
+  numOfColumns = len(lines[0].split(','))
+  # surround every row with separators so that all the blank cells appear as ',,', then parse the whole
+  # table at once in C with numpy.fromstring
+  text = ',' + '\n'.join(lines).replace(' ', '').replace('\n', ',\n,') + ','
+  text = text.replace(',,', ',nan,').replace(',,', ',nan,').replace(',\n,', ',').strip(',')
+  with warnings.catch_warnings():
+    # depending on the version, numpy warns or raises when a cell is not a number, such a table is parsed again below
+    warnings.simplefilter("ignore")
+    try:
+      values = numpy.fromstring(text, dtype=float, sep=',')
+    except ValueError:
+      values = []
+  if len(values) == numOfColumns * len(lines):
+    return values.reshape(len(lines), numOfColumns)
+  # rows with different numbers of cells or invalid cells, pad the rows to the widest one and convert cell by cell
+  rows = [line.replace(' ', '').split(',') for line in lines]
+  numOfColumns = max(len(row) for row in rows)
+  cells = []
+  for row in rows:
+    cells.extend(row)
+    cells.extend([''] * (numOfColumns - len(row)))
+  return numpy.array([cell if cell else 'nan' for cell in cells], dtype=float).reshape(len(lines), numOfColumns)
+
+
+def parseTrackingCSV(text):
+  """
+  Parse the content of a tracking data file.
+  :param text: content of the file
+  :return: list of TrackedTrajectory, ordered by column group and then by trajectory index
+  """
+  lines = [line for line in text.replace('\r', '').split('\n') if line.strip()]
+  if len(lines) < 2:
+    return []
+  header, title = list(csv.reader(lines[:2], delimiter=',', quotechar='|'))
+  header = [cell.strip() for cell in header]
+  title = [cell.strip() for cell in title]
+  groupStarts = [index for index in range(len(title)) if title[index] == "TimeStamp"]
+  values = parseNumericTable(lines[2:])
+  trajectories = []
+  locatorIndex = -1
+  locatorName = None
+  for start in groupStarts:
+    name = header[start] if start < len(header) else ""
+    if not name == locatorName:
+      locatorIndex = locatorIndex + 1
+      locatorName = name
+    sequenceName = header[start + 1] if start + 1 < len(header) else ""
+    if start + 3 >= values.shape[1]:
+      continue
+    timeStamps = values[:, start]
+    valid = numpy.logical_not(numpy.isnan(timeStamps))
+    timeStamps = timeStamps[valid]
+    positions = values[valid, start + 1:start + 4]
+    if start + 4 < len(title) and title[start + 4] == "TrajectoryIndex" and start + 4 < values.shape[1]:
+      trajectoryIndexes = values[valid, start + 4].astype(int)
+    else:
+      trajectoryIndexes = numpy.zeros(len(timeStamps), dtype=int)
+    uniqueIndexes, firstRows = numpy.unique(trajectoryIndexes, return_index=True)
+    for trajectoryIndex in uniqueIndexes[numpy.argsort(firstRows)]:
+      rows = trajectoryIndexes == trajectoryIndex
+      trajectories.append(TrackedTrajectory(locatorIndex, locatorName, sequenceName, int(trajectoryIndex),
+                                            timeStamps[rows], positions[rows]))
+  return trajectories
+
+
+def readTrackingCSV(fileName):
+  """
+  Read a tracking data file.
+  :param fileName: path of the CSV file
+  :return: list of TrackedTrajectory
+  """
+  with open(fileName, 'r') as csvfile:
+    return parseTrackingCSV(csvfile.read())
+
+
+def formatTrackingRows(trajectory):
+  """
+  Format the samples of a trajectory as the cells of one column group.
+  :param trajectory: TrackedTrajectory
+  :return: list of strings "TimeStamp,X,Y,Z,TrajectoryIndex, ", one per sample
+  """
+  rowFormat = "%%r,%%r,%%r,%%r,%d, " % trajectory.trajectoryIndex
+  positions = numpy.asarray(trajectory.positions, dtype=float).reshape(-1, 3)
+  columns = [numpy.asarray(trajectory.timeStamps, dtype=float).tolist(),
+             positions[:, 0].tolist(), positions[:, 1].tolist(), positions[:, 2].tolist()]
+  return list(map(rowFormat.__mod__, zip(*columns)))
+
+
+def writeTrackingCSVHeader(csvfile, header, numOfGroups):
+  """
+  Write the two header rows of a tracking data file.
+  :param csvfile: file opened for writing
+  :param header: cells of the first row, the locator and sequence names of the column groups
+  :param numOfGroups: number of column groups
+  :return: None
+  """
+  fileWriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+  fileWriter.writerow(header)
+  fileWriter.writerow(["TimeStamp", "X", "Y", "Z", "TrajectoryIndex", " "] * numOfGroups)
+
+
+def writeTrackingCSV(fileName, trajectories, concatenate = False, blockSize = 65536):
+  """
+  Write trajectories in the CSV format, see the description of the module.
+  :param fileName: output path
+  :param trajectories: list of TrackedTrajectory
+  :param concatenate: if False, each trajectory gets its own column group. If True, the trajectories are
+                      concatenated in a single column group named after the locator of the first trajectory,
+                      which is the layout of the files saved separately for each locator.
+  :param blockSize: number of rows formatted and written at once
+  :return: None
+  """
+  if concatenate:
+    locatorName = trajectories[0].locatorName if trajectories else ""
+    header = [locatorName, " ", " ", " ", " ", " "]
+    columns = [[row for trajectory in trajectories for row in formatTrackingRows(trajectory)]]
+  else:
+    header = []
+    for trajectory in trajectories:
+      header.extend([trajectory.locatorName, trajectory.sequenceName, " ", " ", " ", " "])
+    columns = [formatTrackingRows(trajectory) for trajectory in trajectories]
+  numOfRows = max([len(column) for column in columns] + [0])
+  blank = " , , , , , "
+  with open(fileName, 'w') as csvfile:
+    writeTrackingCSVHeader(csvfile, header, len(columns))
+    for blockStart in range(0, numOfRows, blockSize):
+      blockEnd = min(blockStart + blockSize, numOfRows)
+      blockColumns = [column[blockStart:blockEnd] + [blank] * (blockEnd - blockStart - len(column[blockStart:blockEnd]))
+                      for column in columns]
+      csvfile.write("\n".join(",".join(row) for row in zip(*blockColumns)) + "\n")